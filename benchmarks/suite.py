@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark suite for the client, run against the offline stand-in API in
+tests/fakeapi.py so that results are repeatable and need no network or
+rate limit.  Measures request throughput and latency, limiter overhead,
+full-history pagination, timestamp parsing and the memory held by results.
+
+    python benchmarks/suite.py --output before.json
+    python benchmarks/suite.py --compare before.json
+
+With ``--compare``, each metric is shown next to its previous value and any
+that got worse by more than ``--threshold`` percent are flagged."""
+
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from github import core, models
+from github.ratelimit import RateLimiter
+from tests.fakeapi import FakeAPI
+
+# metrics where a bigger number is better;  everything else is a time or a size
+higher_is_better = ('rps', 'per_sec')
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+def timed(func):
+    start = time.time()
+    result = func()
+    return time.time() - start, result
+
+def latency_stats(latencies, elapsed):
+    return {'rps': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000}
+
+def deep_sizeof(obj, seen=None):
+    """Bytes held by an object and everything it references, counting
+    shared objects (like interned strings) once."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += deep_sizeof(value, seen)
+    elif isinstance(obj, models.Model):
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                size += deep_sizeof(getattr(obj, slot, None), seen)
+    return size
+
+def bench_requests(gh, requests):
+    """Sequential load_url calls, each a full round trip on a pooled
+    connection."""
+    url = gh.api_base + 'user/show/octocat'
+    latencies = []
+    def run():
+        for i in range(requests):
+            start = time.time()
+            gh.load_url(url)
+            latencies.append(time.time() - start)
+    elapsed, _ = timed(run)
+    return latency_stats(latencies, elapsed)
+
+def bench_fetch_many(gh, requests, concurrency):
+    """The same calls made concurrently through fetch_many."""
+    url = gh.api_base + 'user/show/octocat'
+    latencies = []
+    def fetch():
+        start = time.time()
+        gh.load_url(url)
+        latencies.append(time.time() - start)
+    elapsed, results = timed(lambda: gh.fetch_many([fetch] * requests, concurrency))
+    assert not any(r.error for r in results)
+    return latency_stats(latencies, elapsed)
+
+def bench_limiter(calls):
+    """Cost of asking the limiter for a slot when it has budget to spare."""
+    limiter = RateLimiter(limit=calls * 10, period=3600, burst=calls * 10)
+    reserve = limiter.reserve
+    elapsed, _ = timed(lambda: [reserve() for i in xrange(calls)])
+    return {'reserve_us': elapsed / calls * 1e6}
+
+def bench_pagination(gh, commits):
+    repo = gh.repository('octocat', 'repo0')
+    parallel, result = timed(lambda: repo.commits(all=True))
+    assert len(result) == commits
+    serial, result = timed(lambda: list(repo.iter_commits()))
+    assert len(result) == commits
+    prefetch, result = timed(lambda: list(repo.iter_commits(prefetch=True)))
+    assert len(result) == commits
+    stream, result = timed(lambda: list(repo.iter_commits(stream=True)))
+    assert len(result) == commits
+    return {'all_s': parallel, 'iter_s': serial, 'iter_prefetch_s': prefetch,
+        'iter_stream_s': stream}
+
+def bench_to_datetime(stamps):
+    def cold():
+        core._datetime_cache.clear()
+        core._offset_cache.clear()
+        core.to_datetimes(stamps)
+    best = min(timed(cold)[0] for i in range(3))
+    return {'per_sec': len(stamps) / best}
+
+def bench_memory(payloads):
+    gc.collect()
+    dicts = json.loads(json.dumps(payloads))
+    decoded = models.Commit.decode(json.loads(json.dumps(payloads)))
+    per = 10000.0 / len(payloads)
+    return {'dicts_kb_per_10k': deep_sizeof(dicts) * per / 1024,
+        'models_kb_per_10k': deep_sizeof(decoded) * per / 1024}
+
+def run(options):
+    api = FakeAPI(commits=options.commits, latency=options.latency)
+    base = api.start()
+    gh = core.Github(api_base=base, throttle=False, pool_size=options.concurrency,
+        page_workers=options.concurrency)
+    results = {}
+    try:
+        gh.load_url(base + 'user/show/octocat')
+        results['load_url'] = bench_requests(gh, options.requests)
+        results['fetch_many'] = bench_fetch_many(gh, options.requests, options.concurrency)
+        results['limiter'] = bench_limiter(options.requests * 10)
+        results['pagination'] = bench_pagination(gh, options.commits)
+        history = api.history('octocat', 'repo0')
+        results['to_datetime'] = bench_to_datetime(
+            [c['commit']['author']['date'] for c in history])
+        results['memory'] = bench_memory(history[:10000])
+    finally:
+        gh.close()
+        api.stop()
+    # flatten to "group.metric" names, which is what --compare works with
+    return dict(('%s.%s' % (group, name), value)
+        for group, metrics in results.items() for name, value in metrics.items())
+
+def compare(results, baseline, threshold):
+    """Print each metric beside its baseline, returning the names of those
+    which regressed by more than ``threshold`` percent."""
+    regressions = []
+    for name in sorted(results):
+        value = results[name]
+        if name not in baseline:
+            print '%-36s %12.2f' % (name, value)
+            continue
+        old = baseline[name]
+        change = (value - old) / old * 100 if old else 0
+        worse = -change if name.endswith(higher_is_better) else change
+        flag = ''
+        if worse > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print '%-36s %12.2f %12.2f %+8.1f%%%s' % (name, old, value, change, flag)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=500,
+        help='requests made by the throughput benchmarks')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--commits', type=int, default=10000,
+        help='commits in the repository paginated through')
+    parser.add_argument('--latency', type=float, default=0,
+        help='seconds the fake API waits before each response')
+    parser.add_argument('--output', help='save the results as json')
+    parser.add_argument('--compare', help='json results to compare against')
+    parser.add_argument('--threshold', type=float, default=10,
+        help='percent change counted as a regression')
+    options = parser.parse_args(argv)
+
+    results = run(options)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = json.load(f)
+        return 1 if compare(results, baseline, options.threshold) else 0
+    for name in sorted(results):
+        print '%-36s %12.2f' % (name, results[name])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
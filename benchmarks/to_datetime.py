@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Micro-benchmark of github.to_datetime and github.to_datetimes against the
+original strptime and pytz implementation, which is reproduced below.  Run
+with ``python benchmarks/to_datetime.py [count]``."""
+
+import os
+import re
+import sys
+import time
+import random
+import datetime
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from github import core
+
+def original_to_datetime(timestring):
+    import pytz
+    mountain = re.search('-07:?00', timestring)
+    is_utc = timestring.endswith("Z")
+    stripped = re.sub('-0\d:?00', '', timestring).strip().rstrip("Z")
+    try:
+        dt = datetime.datetime(*time.strptime(stripped, core.github_date_format)[:6])
+    except ValueError:
+        try:
+            dt = datetime.datetime(*time.strptime(stripped, core.commit_date_format)[:6])
+        except ValueError:
+            raise Exception("Unrecognized timestamp format for string \"%s\"" % timestring)
+    if mountain:
+        timezone = pytz.timezone('US/Mountain')
+    elif is_utc:
+        timezone = pytz.utc
+    else:
+        timezone = pytz.timezone('US/Pacific')
+    local = timezone.normalize(timezone.localize(dt))
+    return local.astimezone(pytz.utc)
+
+formats = ['%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S-08:00',
+    '%Y-%m-%dT%H:%M:%S-07:00', '%Y/%m/%d %H:%M:%S -0700']
+
+def timestamps(count, seed=0):
+    """A column of commit-like timestamps, in mixed formats, descending."""
+    rand = random.Random(seed)
+    t = time.mktime((2011, 10, 1, 0, 0, 0, 0, 0, 0))
+    stamps = []
+    for i in range(count):
+        t -= rand.randint(1, 20000)
+        stamps.append(time.strftime(rand.choice(formats), time.gmtime(t)))
+    return stamps
+
+def bench(name, func, repeat=3):
+    best = min(timeit.repeat(func, number=1, repeat=repeat))
+    print '%-36s %8.3fs' % (name, best)
+    return best
+
+def clear_caches():
+    core._datetime_cache.clear()
+    core._offset_cache.clear()
+
+def main(count=100000):
+    stamps = timestamps(count)
+    expected = map(original_to_datetime, stamps)
+    assert core.to_datetimes(stamps) == expected
+    assert [d.tzinfo for d in core.to_datetimes(stamps)] == [d.tzinfo for d in expected]
+    print '%d timestamps' % count
+    original = bench('original to_datetime', lambda: map(original_to_datetime, stamps), 1)
+    def cold(func):
+        def run():
+            clear_caches()
+            func()
+        return run
+    fast = bench('to_datetime (cold caches)', cold(lambda: map(core.to_datetime, stamps)))
+    batch = bench('to_datetimes (cold caches)', cold(lambda: core.to_datetimes(stamps)))
+    bench('to_datetimes (warm caches)', lambda: core.to_datetimes(stamps))
+    print 'speedup: %.1fx single, %.1fx batch' % (original / fast, original / batch)
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -5,3 +5,14 @@
 
 from core import *
 
+from cache import MemoryCache, DiskCache
+from threaded import ThreadedGithub
+from models import UserInfo, RepoInfo, Commit
+from metrics import Metrics
+from store import Store
+from crawl import Crawler
+from writes import WritePipeline
+from graph import CommitGraph
+from retry import RetryPolicy
+from graphql import GraphQLBackend
+from events import EventPoller
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Response caches for conditional requests.  The Github object stores the
+body of each GET along with its ETag and Last-Modified validators, and on the
+next request for the same url sends them back as If-None-Match and
+If-Modified-Since.  If github answers 304 Not Modified, the stored body is
+used and no rate budget is spent downloading it again."""
+
+import os
+import threading
+import tempfile
+from hashlib import sha1
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+__all__ = ["CacheEntry", "MemoryCache", "DiskCache"]
+
+class CacheEntry(object):
+    """A cached response body and the validators needed to revalidate it.
+    The Link header is kept as well, since pagination depends on it."""
+    __slots__ = ('etag', 'last_modified', 'body', 'link')
+
+    def __init__(self, etag, last_modified, body, link=None):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self.link = link
+
+    def __getstate__(self):
+        return (self.etag, self.last_modified, self.body, self.link)
+
+    def __setstate__(self, state):
+        self.etag, self.last_modified, self.body, self.link = state
+
+    def __len__(self):
+        return len(self.body) + len(self.etag or '') + len(self.last_modified or '') + \
+            len(self.link or '')
+
+class MemoryCache(object):
+    """A thread-safe in-memory LRU cache bounded by the total size in bytes
+    of the bodies it holds, and optionally by the number of entries."""
+    def __init__(self, max_bytes=16*1024*1024, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        if len(entry) > self.max_bytes:
+            return self.delete(key)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = entry
+            self.size += len(entry)
+            while self.size > self.max_bytes or \
+                    (self.max_entries and len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry)
+
+    def delete_pages(self, key):
+        """Delete the entry for a url's ``key`` along with those for the url
+        with any query string, eg. its other pages."""
+        with self._lock:
+            for k in [k for k in self._entries if k == key or k.startswith(key + '?')]:
+                self.size -= len(self._entries.pop(k))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+class DiskCache(object):
+    """A persistent cache which keeps one pickle file per entry in ``path``,
+    so that validators survive process restarts.  Writes are atomic, so many
+    processes may share one cache directory."""
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        return os.path.join(self.path, sha1(key).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._filename(key), 'rb') as f:
+                stored_key, entry = pickle.load(f)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        return entry if stored_key == key else None
+
+    def set(self, key, entry):
+        fd, tmp = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, entry), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self._filename(key))
+        except:
+            os.unlink(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._filename(key))
+        except OSError:
+            pass
+
+    def delete_pages(self, key):
+        """Delete the entry for a url's ``key`` along with those for the url
+        with any query string.  Keys are hashed, so every entry is read."""
+        for name in os.listdir(self.path):
+            filename = os.path.join(self.path, name)
+            try:
+                with open(filename, 'rb') as f:
+                    stored_key, _ = pickle.load(f)
+            except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+                continue
+            if stored_key == key or stored_key.startswith(key + '?'):
+                try:
+                    os.unlink(filename)
+                except OSError:
+                    pass
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            os.unlink(os.path.join(self.path, name))
@@ -5,23 +5,50 @@
 originally intended to mimic py-github.  But I don"t like the way py-github
 and python-github2 wrap all of the API results."""
 
-from urllib2 import Request, urlopen
+from urllib2 import Request
 from urllib import urlencode
+from urlparse import urlsplit, parse_qs
 from functools import wraps
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty
 import re
+import inspect
 import datetime
 import time
+import threading
+import sys
+import socket
+import httplib
+import hashlib
+
+from transport import ConnectionPool, HTTPError
+from cache import CacheEntry
+from ratelimit import RateLimiter
+from executor import Executor, SingleFlight, as_completed
+from models import UserInfo, RepoInfo, Commit, decode
+from metrics import hook_events, RequestEvent, url_template
+from tokens import TokenPool, identity
+from jsonstream import find_decoder, ArrayParser
+from writes import WritePipeline
+from graph import CommitGraph
+from retry import RetryPolicy
+from graphql import GraphQLBackend
 
 try:
     import json
 except ImportError:
     import simplejson as json
 
-__all__ = ["AccessRestricted", "AuthenticationRequired", "to_datetime", "Github"]
+__all__ = ["AccessRestricted", "AuthenticationRequired", "DownloadError",
+    "to_datetime", "to_datetimes", "Github", "FetchResult", "CommitCursor",
+    "PagePlan", "PageIterator"]
 
 #api_base = "https://github.com/api/v2/json/"
 api_base = "https://api.github.com/"
 gist_base = "https://gist.github.com/api/v1/json/"
+# the largest page github will return
+max_per_page = 100
 
 github_timezone = "-0700"
 github_date_format = "%Y/%m/%d %H:%M:%S"
@@ -33,12 +60,22 @@ class AuthenticationRequired(Exception):
 class AccessRestricted(Exception):
     pass
 
+class DownloadError(Exception):
+    pass
+
 def authenticated_user_only(method):
+    """Restricts a User method to the authenticated user, or to users in the
+    handle's token pool;  requests it makes are pinned to that user's token."""
     @wraps(method)
     def wrapper(self, *args, **kwargs):
-        if self.gh.username != self.username:
+        if not self.gh.can_act_as(self.username):
             raise AccessRestricted("%s is only callable for the authenticated user" % method.__name__)
-        return method(self, *args, **kwargs)
+        previous = getattr(self.gh._local, 'identity', None)
+        self.gh._local.identity = self.username
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.gh._local.identity = previous
     return requires_authentication(wrapper)
 
 def requires_authentication(method):
@@ -51,27 +88,232 @@ def requires_authentication(method):
     return wrapper
 
 def handle_pagination_all(method):
-    """Handles the "all" keyword argument, looping over the method page by
-    page until the page is empty and then returning a list of items."""
+    """Handles the "all" keyword argument, returning a list of the items on
+    every page.  Methods which take a ``per_page`` argument have their pages
+    requested ``max_per_page`` items at a time unless one is given.  If the
+    first page's Link header says which page is last, the remaining pages
+    are fetched concurrently on ``Github.page_workers`` threads;  otherwise
+    the method is looped over page by page until a short page.  With
+    ``dry_run``, nothing is fetched but a probe, and a PagePlan of what
+    fetching all would cost is returned."""
+    sized = 'per_page' in inspect.getargspec(method).args
     @wraps(method)
     def wrapper(self, **kwargs):
         kwargs = dict(kwargs)
         all = kwargs.pop("all", None)
+        if kwargs.pop("dry_run", False):
+            return plan_pages(lambda **kw: method(self, **kw), self.gh, **kwargs)
         if all:
             kwargs["page"] = 1
+            per_page = None
+            if sized:
+                per_page = kwargs["per_page"] = kwargs.get("per_page") or max_per_page
             items = []
+            local = self.gh._local
+            # in strict mode (eg. under fetch_many) a failed page raises
+            # rather than cutting the list short
+            strict = getattr(local, 'strict', False)
+            identity = getattr(local, 'identity', None)
             result = method(self, **kwargs)
+            last = last_page(self.gh.last_response)
+            if result and last:
+                def fetch(page):
+                    # the page is fetched as the calling thread would
+                    previous = getattr(local, 'strict', False), getattr(local, 'identity', None)
+                    local.strict, local.identity = strict, identity
+                    try:
+                        return method(self, **dict(kwargs, page=page))
+                    except:
+                        if strict:
+                            raise
+                        return None
+                    finally:
+                        local.strict, local.identity = previous
+                pages = concurrent_map(fetch, range(2, last + 1), self.gh.page_workers)
+                for result in [result] + pages:
+                    if not result:
+                        break
+                    items += result
+                return items
             while result:
                 items += result
+                if per_page and len(result) < per_page:
+                    break
                 kwargs['page'] += 1
                 try:
                     result = method(self, **kwargs)
                 except:
+                    if strict:
+                        raise
                     break
             return items
         return method(self, **kwargs)
     return wrapper
 
+PagePlan = namedtuple('PagePlan', 'items requests per_page remaining reset fits')
+
+def plan_pages(method, gh, per_page=None, **kwargs):
+    """Work out what fetching every page of a paginated method would cost,
+    with a single request for one item per page:  the Link header's last
+    page number is then the number of items.  Returns a PagePlan of the item
+    count, the requests needed at ``per_page`` (max_per_page by default),
+    the rate limit remaining and its reset, and whether the requests fit in
+    what remains.  ``items`` is None if the server sent no Link header and
+    returned a full page, in which case nothing can be said.  A ``page``
+    argument is ignored, as the plan covers every page."""
+    kwargs.pop('page', None)
+    per_page = per_page or max_per_page
+    result = method(page=1, per_page=1, **kwargs)
+    response = gh.last_response
+    items = last_page(response)
+    if items is None:
+        items = len(result) if isinstance(result, list) and len(result) < 2 else None
+    requests = max(1, -(-items // per_page)) if items is not None else None
+    remaining = reset = None
+    if response is not None:
+        headers = response.headers
+        if headers.get('x-ratelimit-remaining', '').isdigit():
+            remaining = int(headers['x-ratelimit-remaining'])
+        try:
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            pass
+    fits = None
+    if requests is not None and remaining is not None:
+        fits = requests <= remaining
+    return PagePlan(items, requests, per_page, remaining, reset, fits)
+
+class PageIterator(object):
+    """Iterates over the items of a paginated listing.  Pages are loaded in
+    strict mode, so a page which fails ends the iteration with its
+    exception kept in ``error``, rather than looking like the end of the
+    listing;  ``error`` is None once the listing has been read in full.  If
+    the caller is in strict mode itself (eg. under fetch_many), the
+    exception is raised instead."""
+    def __init__(self, gh, items):
+        self.gh = gh
+        self.error = None
+        self._items = items
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        local = self.gh._local
+        strict = getattr(local, 'strict', False)
+        local.strict = True
+        try:
+            return self._items.next()
+        except StopIteration:
+            raise
+        except Exception:
+            if strict:
+                raise
+            self.error = sys.exc_info()[1]
+            raise StopIteration
+        finally:
+            local.strict = strict
+
+    def close(self):
+        """Stop iterating, without fetching any more pages."""
+        self._items.close()
+
+def iter_pages(method, prefetch=False, **kwargs):
+    """Yield the items of a paginated method page by page, as each page
+    arrives, stopping at the last page according to the Link header or at the
+    first empty page.  With prefetch, the next page is requested in a
+    background thread while the current one is consumed.  Only one or two
+    pages are held in memory, and closing the iterator early stops it from
+    fetching the rest.  Returns a PageIterator."""
+    gh = method.im_self.gh
+    identity = getattr(gh._local, 'identity', None)
+    def fetch(page):
+        # prefetched pages are loaded as the caller's would be
+        local = gh._local
+        previous = getattr(local, 'strict', False), getattr(local, 'identity', None)
+        local.strict, local.identity = True, identity
+        try:
+            return method(page=page, **kwargs), last_page(gh.last_response)
+        finally:
+            local.strict, local.identity = previous
+    def items(page):
+        pool = ThreadPool(1) if prefetch else None
+        try:
+            result, last = fetch(page)
+            while result:
+                more = last is None or page < last
+                pending = None
+                if more and pool is not None:
+                    pending = pool.apply_async(fetch, (page + 1,))
+                for item in result:
+                    yield item
+                if not more:
+                    return
+                page += 1
+                result, last = pending.get() if pending else fetch(page)
+        finally:
+            if pool is not None:
+                pool.close()
+    return PageIterator(gh, items(kwargs.pop('page', None) or 1))
+
+def iter_stream_pages(gh, page_url, model=None, persist=None):
+    """Like iter_pages, but each page is streamed with Github.iter_json, so
+    that its items are yielded as they are decoded.  ``page_url(page)``
+    gives the url of a page, whose items are wrapped in ``model`` if the
+    handle has models enabled;  ``persist``, if given, is called with each
+    complete page.  Returns a PageIterator."""
+    def stream():
+        page = 1
+        while True:
+            items = [] if persist else None
+            count = 0
+            for item in gh.iter_json(page_url(page)):
+                item = decode(model, item, gh.models and model is not None)
+                if items is not None:
+                    items.append(item)
+                count += 1
+                yield item
+            if persist and items:
+                persist(items)
+            last = last_page(gh.last_response)
+            if not count or (last is not None and page >= last):
+                return
+            page += 1
+    return PageIterator(gh, stream())
+
+def concurrent_map(func, items, workers):
+    """Map func over items on a pool of up to ``workers`` threads, returning
+    the results in the order of items."""
+    items = list(items)
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return map(func, items)
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(func, items, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+link_re = re.compile(r'<([^>]*)>\s*;\s*rel="?([^",;]+)"?')
+
+def parse_link_header(value):
+    """Parse an RFC 5988 Link header into a dict of {rel: url}."""
+    return dict((rel, url) for url, rel in link_re.findall(value or ''))
+
+def last_page(response):
+    """Returns the number of the last page according to a response's Link
+    header, or None if it doesn't say."""
+    if response is None:
+        return None
+    url = parse_link_header(response.getheader('link')).get('last')
+    if not url:
+        return None
+    try:
+        return int(parse_qs(urlsplit(url).query)['page'][0])
+    except (KeyError, ValueError):
+        return None
+
 def smart_encode(**kwargs):
     """Urlencode's provided keyword arguments.  If any kwargs are None, it does
     not include those."""
@@ -83,12 +325,30 @@ def smart_encode(**kwargs):
         return ''
     return urlencode(args)
 
-def to_datetime(timestring):
-    """Convert one of the github API's timestamps to a datetime object."""
-    import pytz
-    mountain = re.search('-07:?00', timestring)
+timestamp_res = (
+    re.compile(r'(\d{4})/(\d\d)/(\d\d) (\d\d):(\d\d):(\d\d)(?: ?(-0\d):?00|(Z))?$'),
+    re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?: ?(-0\d):?00|(Z))?$'),
+)
+offset_re = re.compile(r'-0\d:?00')
+mountain_re = re.compile(r'-07:?00')
+
+_timezones = {}
+_offset_cache = {}
+_datetime_cache = {}
+cache_limit = 65536
+
+def _timezone(name):
+    timezone = _timezones.get(name)
+    if timezone is None:
+        import pytz
+        timezone = _timezones[name] = pytz.timezone(name)
+    return timezone
+
+def _parse_timestamp(timestring):
+    """Convert a timestamp the slow way, with strptime and pytz."""
+    mountain = mountain_re.search(timestring)
     is_utc = timestring.endswith("Z")
-    stripped = re.sub('-0\d:?00', '', timestring).strip().rstrip("Z")
+    stripped = offset_re.sub('', timestring).strip().rstrip("Z")
     try:
         dt = datetime.datetime(*time.strptime(stripped, github_date_format)[:6])
     except ValueError:
@@ -97,77 +357,699 @@ def to_datetime(timestring):
         except ValueError:
             raise Exception("Unrecognized timestamp format for string \"%s\"" % timestring)
     if mountain:
-        timezone = pytz.timezone('US/Mountain')
+        timezone = _timezone('US/Mountain')
     elif is_utc:
-        timezone = pytz.utc
+        timezone = _timezone('UTC')
     # github's old default timezone is US/Pacific, but nowadays most are UTC
     else:
-        timezone = pytz.timezone('US/Pacific')
+        timezone = _timezone('US/Pacific')
     local = timezone.normalize(timezone.localize(dt))
-    return local.astimezone(pytz.utc)
+    return local.astimezone(_timezone('UTC'))
+
+def _convert_timestamp(timestring):
+    """Convert a timestamp in one of github's two usual formats by hand,
+    falling back to _parse_timestamp for anything else."""
+    for pattern in timestamp_res:
+        match = pattern.match(timestring)
+        if match:
+            break
+    else:
+        return _parse_timestamp(timestring)
+    year, month, day, hour, minute, second, offset, utc = match.groups()
+    try:
+        dt = datetime.datetime(int(year), int(month), int(day), int(hour),
+            int(minute), int(second), 0, _timezone('UTC') if utc else None)
+    except ValueError:
+        return _parse_timestamp(timestring)
+    if utc:
+        return dt
+    name = 'US/Mountain' if offset == '-07' else 'US/Pacific'
+    delta = _offset_cache.get((name, year, month))
+    if delta is None:
+        delta = _offset_cache.get((name, year, month, day)) or \
+            _offset_cache.get((name, year, month, day, hour)) or _utc_offset(name, dt)
+    return (dt - delta).replace(tzinfo=_timezone('UTC'))
+
+def _utc_offset(name, dt):
+    """Find and cache the UTC offset for a local time.  Offsets are cached
+    per month, or per day in months with a DST transition, or per hour on the
+    day of the transition;  US zones change offset at most once a month, and
+    always on the hour."""
+    if len(_offset_cache) >= cache_limit:
+        _offset_cache.clear()
+    localize = _timezone(name).localize
+    month = dt.replace(day=1, hour=0, minute=0, second=0)
+    next_month = (month + datetime.timedelta(days=31)).replace(day=1)
+    day = dt.replace(hour=0, minute=0, second=0)
+    month_key = (name, '%04d' % dt.year, '%02d' % dt.month)
+    day_key = month_key + ('%02d' % dt.day,)
+    spans = [(month_key, month, next_month - datetime.timedelta(hours=1)),
+        (day_key, day, day.replace(hour=23))]
+    for key, start, end in spans:
+        delta = localize(start).utcoffset()
+        if delta == localize(end).utcoffset():
+            _offset_cache[key] = delta
+            return delta
+    delta = localize(dt.replace(minute=0, second=0)).utcoffset()
+    _offset_cache[day_key + ('%02d' % dt.hour,)] = delta
+    return delta
+
+def to_datetime(timestring):
+    """Convert one of the github API's timestamps to a datetime object."""
+    dt = _datetime_cache.get(timestring)
+    if dt is None:
+        if len(_datetime_cache) >= cache_limit:
+            _datetime_cache.clear()
+        dt = _datetime_cache[timestring] = _convert_timestamp(timestring)
+    return dt
+
+def to_datetimes(timestrings):
+    """Convert an iterable of timestamps to a list of datetime objects."""
+    cache, convert = _datetime_cache, _convert_timestamp
+    results = []
+    append = results.append
+    for timestring in timestrings:
+        dt = cache.get(timestring)
+        if dt is None:
+            if len(cache) >= cache_limit:
+                cache.clear()
+            dt = cache[timestring] = convert(timestring)
+        append(dt)
+    return results
+
+FetchResult = namedtuple('FetchResult', 'spec value error')
+CommitCursor = namedtuple('CommitCursor', 'sha date')
+
+def commit_date(commit):
+    """The committer timestamp of a commit, as github sends it."""
+    if 'commit' in commit:
+        return commit['commit']['committer']['date']
+    return commit.get('committed_date')
 
 class Github(object):
     """Main github class.  Use an instantiated version of this class
     to make calls against the REST API."""
-    def __init__(self, username='', token='', throttle=True):
+    def __init__(self, username='', token='', throttle=True, pool_size=4,
+            pool_idle_timeout=60, cache=None, limiter=None, page_workers=4,
+            models=False, api_base=api_base, gist_base=gist_base, store=None,
+            coalesce=True, tokens=None, json_decoder=None, retry=None,
+            graphql=False):
         self.username = username
         self.token = token
         self.throttle = throttle
-        self.throttle_list = []
+        self.limiter = limiter or RateLimiter()
+        if tokens is not None and not isinstance(tokens, TokenPool):
+            tokens = TokenPool(tokens)
+        self.tokens = tokens
+        self.page_workers = page_workers
+        self.models = models
+        self.api_base = api_base
+        self.gist_base = gist_base
+        self.store = store
+        self.json_decoder = json_decoder or find_decoder()
+        self.inflight = SingleFlight() if coalesce else None
+        # retry=False turns retries off
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry or None
+        self._local = threading.local()
+        self.pool = ConnectionPool(pool_size, pool_idle_timeout)
+        self.cache = cache
+        self.cache_stats = dict(hits=0, misses=0, not_modified=0)
+        self._stats_lock = threading.Lock()
+        self.hooks = dict((name, []) for name in hook_events)
+        # graphql=True batches fetch_many's reads;  a GraphQLBackend may be
+        # passed to configure it
+        if graphql is True:
+            graphql = GraphQLBackend(self)
+        self.graphql = graphql or None
         # extended API support
 
     def _is_authenticated(self):
-        return self.username and self.token
+        return bool(self.username and self.token) or self.tokens is not None
     is_authenticated = property(_is_authenticated)
 
-    def wait(self):
-        """Handle request throttling.  Keeps a list of request timestamps and
-        will wait ultil oldest+60 if there are 60 timestamps in the queue."""
+    def can_act_as(self, username):
+        """Whether this handle holds a token for ``username``."""
+        if self.tokens is not None and username in self.tokens:
+            return True
+        return bool(username) and username == self.username and bool(self.token)
+
+    def _credential(self):
+        """The pooled credential the current thread's request is made with,
+        or None to use this handle's own token and limiter."""
+        if self.tokens is None:
+            return None
+        return getattr(self._local, 'credential', None)
+
+    def _last_response(self):
+        return getattr(self._local, 'response', None)
+    last_response = property(_last_response, doc="The last response received "
+        "by the current thread.")
+
+    def _coalesced(self):
+        return self.inflight.coalesced if self.inflight else 0
+    coalesced = property(_coalesced, doc="How many GETs shared the response "
+        "of an identical request already in flight.")
+
+    def _transfer_stats(self):
+        return dict(self.pool.stats)
+    transfer_stats = property(_transfer_stats, doc="Bytes received over the "
+        "wire, and the bytes they decompressed to.")
+
+    def wait(self, event=None, limiter=None):
+        """Handle request throttling.  Waits for the rate limiter, which paces
+        requests by the budget github reports in its response headers, or
+        for ``limiter`` if the request draws on a budget of its own."""
+        default = self.limiter
+        if self.tokens is not None:
+            # pick the token this thread's next request is made with
+            credential = self.tokens.select(getattr(self._local, 'identity', None))
+            self._local.credential = credential
+            if credential is not None:
+                default = credential.limiter
+        limiter = limiter or default
         if not self.throttle:
             return
-        now = time.time()
-        a_minute_ago = now - 60
-        self.throttle_list = [t for t in self.throttle_list if t > a_minute_ago]
-        if len(self.throttle_list) < 60:
-            self.throttle_list.append(now)
-            return
-        oldest = self.throttle_list[0]
-        if len(self.throttle_list) >= 60:
-            time.sleep((oldest + 60) - now)
+        start = time.time()
+        delay = limiter.reserve()
+        if delay > 0:
+            if self.hooks['throttle']:
+                event = event or RequestEvent(None, None)
+                event.delay = delay
+                self._emit('throttle', event)
+            time.sleep(delay)
+        if event is not None:
+            event.timings['throttle'] = time.time() - start
+
+    def add_hook(self, name, func):
+        """Call ``func(event)`` with a RequestEvent on each of the events
+        named in metrics.hook_events."""
+        if name not in self.hooks:
+            raise ValueError("unknown hook event %r" % name)
+        # hooks are replaced rather than mutated, as other threads may be
+        # iterating over them
+        self.hooks[name] = self.hooks[name] + [func]
+
+    def remove_hook(self, name, func):
+        self.hooks[name] = [f for f in self.hooks[name] if f != func]
+
+    def _emit(self, name, event):
+        for func in self.hooks[name]:
+            func(event)
+
+    def _event(self, method, url):
+        """A RequestEvent for a url, announced to the before_request hooks."""
+        path = url
+        for base in (self.api_base, self.gist_base):
+            if url.startswith(base):
+                path = url[len(base):]
+                break
+        else:
+            path = urlsplit(url).path
+        event = RequestEvent(method, url, url_template(path))
+        self._emit('before_request', event)
+        return event
+
+    def _failed(self, event):
+        """Record the exception being handled on an event and announce it."""
+        event.error = sys.exc_info()[1]
+        if isinstance(event.error, HTTPError):
+            self._record(event, event.error.response)
+        self._emit('error', event)
+
+    def _record(self, event, response):
+        """Copy what a response says into its event."""
+        event.status = response.status
+        event.wire_bytes = response.wire_size
+        if event.cache != 'hit':
+            event.bytes = len(response.body or '')
+        remaining = response.getheader('x-ratelimit-remaining')
+        if remaining is not None and remaining.isdigit():
+            event.rate_remaining = int(remaining)
 
     def build_request(self, url, data=None):
-        if not self.is_authenticated:
-            return Request(url)
-        auth = {'Authorization': 'token %s' % (self.token)}
+        credential = self._credential()
+        token = credential.token if credential else self.token
+        if not (token and (credential or self.username)):
+            return Request(url, data)
+        auth = {'Authorization': 'token %s' % (token)}
         return Request(url, data, auth)
 
-    def load_url(self, url, quiet=False):
-        self.wait()
+    def cache_key(self, url):
+        """The key a url is cached under;  responses differ per user, so the
+        key includes the identity the request is made as.  Unpinned requests
+        through a token pool are treated as one identity."""
+        name = ''
+        pinned = getattr(self._local, 'identity', None)
+        credential = self.tokens.get(pinned) if self.tokens and pinned else None
+        if credential is not None:
+            name = credential.identity
+        elif self.tokens is not None and not pinned:
+            name = self.tokens.identity
+        elif self.username and self.token:
+            name = identity(self.username, self.token)
+        return '%s %s' % (name, url)
+
+    def _count(self, stats, name):
+        with self._stats_lock:
+            stats[name] += 1
+
+    def _open(self, request, stream=False, event=None, limiter=None):
+        """Send a request over the pool, feeding the rate limit headers of
+        the response (successful or not) to the limiter, or to ``limiter``.
+        GETs may be hedged if the retry policy says so."""
+        self._local.response = None
+        try:
+            response = self._urlopen(request, stream, event)
+        except HTTPError, e:
+            self._update_limits(e.response, limiter)
+            self._local.response = e.response
+            raise
+        self._update_limits(response, limiter)
+        self._local.response = response
+        return response
+
+    def _urlopen(self, request, stream, event):
+        """Send a request, and if it is a GET which takes longer than the
+        endpoint usually does to answer, send it again and use whichever
+        response arrives first.  The other is discarded when it arrives."""
+        after = None
+        if self.retry is not None and event is not None and event.method == 'GET':
+            after = self.retry.hedge_after(event.template)
+        if after is None:
+            return self.pool.urlopen(request, stream)
+        results = Queue()
+        def send(hedge):
+            try:
+                results.put((self.pool.urlopen(request, stream), None, hedge))
+            except:
+                results.put((None, sys.exc_info(), hedge))
+        def start(hedge):
+            thread = threading.Thread(target=send, args=(hedge,))
+            thread.daemon = True
+            thread.start()
+        start(False)
+        sent = 1
+        try:
+            result = results.get(timeout=after)
+        except Empty:
+            credential = self._credential()
+            limiter = credential.limiter if credential else self.limiter
+            if self.retry.allow_hedge(event.template, limiter, self.throttle):
+                start(True)
+                sent += 1
+            result = results.get()
+        sent -= 1
+        # a failure only counts if the other copy fails too
+        while result[1] is not None and sent:
+            result = results.get()
+            sent -= 1
+        if sent:
+            thread = threading.Thread(target=self._discard, args=(results, sent))
+            thread.daemon = True
+            thread.start()
+        response, exc_info, hedge = result
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if hedge:
+            self.retry.hedge_won()
+        return response
+
+    def _discard(self, results, count):
+        """Read and drop the responses of the copies of a hedged request
+        which lost, so that their connections go back to the pool."""
+        for i in range(count):
+            response = results.get()[0]
+            try:
+                if response is not None:
+                    response.read()
+            except Exception:
+                pass
+
+    def _update_limits(self, response, limiter=None):
+        credential = self._credential()
+        if credential is not None:
+            self.tokens.update(credential, response, limiter)
+        else:
+            (limiter or self.limiter).update(response.headers)
+
+    def _get(self, url, event=None):
+        """Fetch a url, revalidating against the response cache if one is
+        configured.  Raises on failure."""
         request = self.build_request(url)
+        event = event or RequestEvent('GET', url)
+        if self.cache is None:
+            return self._read(request, event)
+        key = self.cache_key(url)
+        entry = self.cache.get(key)
+        if entry is None:
+            self._count(self.cache_stats, 'misses')
+            event.cache = 'miss'
+        else:
+            self._count(self.cache_stats, 'hits')
+            event.cache = 'revalidated'
+            if entry.etag:
+                request.add_header('If-None-Match', entry.etag)
+            if entry.last_modified:
+                request.add_header('If-Modified-Since', entry.last_modified)
+        body = self._read(request, event)
+        response = self.last_response
+        if response.status == 304 and entry is not None:
+            self._count(self.cache_stats, 'not_modified')
+            event.cache = 'hit'
+            event.bytes = len(entry.body)
+            if entry.link:
+                response.headers.setdefault('link', entry.link)
+            return entry.body
+        etag = response.getheader('etag')
+        last_modified = response.getheader('last-modified')
+        if etag or last_modified:
+            self.cache.set(key, CacheEntry(etag, last_modified, body,
+                response.getheader('link')))
+        return body
+
+    def _read(self, request, event, limiter=None):
+        """Send a request and read its body, timing each half."""
+        start = time.time()
+        response = self._open(request, True, event, limiter)
+        read = time.time()
+        event.timings['wait'] = read - start
+        if self.retry is not None and event.method == 'GET':
+            self.retry.observe(event.template, read - start)
+        body = response.read()
+        event.timings['transfer'] = time.time() - read
+        self._record(event, response)
+        return body
+
+    def _fetch(self, url, event):
+        """Throttle and GET a url.  If the same url is already being fetched
+        as the same user by another thread, wait for and share its response
+        instead, without spending any of the rate limit."""
+        if self.inflight is None:
+            return self._send(url, event)
+        def fetch():
+            return self._send(url, event), self.last_response
         try:
-            result = urlopen(request).read()
+            (body, response), shared = self.inflight.do(self.cache_key(url), fetch)
+        except HTTPError, e:
+            self._local.response = e.response
+            raise
+        if shared:
+            event.coalesced = True
+            event.timings['wait'] = event.elapsed()
+            self._local.response = response
+            self._record(event, response)
+            event.bytes, event.wire_bytes = len(body), 0
+        return body
+
+    def _send(self, url, event, get=None, limiter=None):
+        """Throttle and GET a url, or send it with ``get(url, event)``,
+        retrying transient failures as far as the retry policy allows.  A
+        ``limiter`` paces requests with a budget of their own."""
+        policy = self.retry
+        if policy is not None:
+            policy.requested(event.template)
+        attempt = 0
+        while True:
+            self.wait(event, limiter)
+            try:
+                return (get or self._get)(url, event)
+            except Exception, e:
+                if policy is None or not policy.should_retry(event.template, e, attempt):
+                    raise
+                delay = policy.delay(attempt, e)
+                attempt += 1
+                event.retries = attempt
+                self._emit('retry', event)
+                time.sleep(delay)
+
+    def load_url(self, url, quiet=False):
+        return self._load(url, quiet)
+
+    def load_json(self, url, quiet=False):
+        """Fetch a url and decode its json body.  If the request fails, the
+        error is printed (unless ``quiet``) and an empty object returned."""
+        return self._load(url, quiet, self.json_decoder)
+
+    def iter_json(self, url, quiet=False, chunk_size=16*1024):
+        """Yield the items of a url's json array as its body arrives, rather
+        than reading and decoding the whole of it first.  Failures are
+        handled as by load_json, and the request is retried and hedged as
+        GETs are until its body starts to arrive.  If the same url is
+        already being fetched in full, its body is shared instead.  With a
+        response cache, the body is fetched and revalidated in full as
+        usual, then its items yielded."""
+        if self.cache is not None:
+            result = self.load_json(url, quiet)
+            for item in result if isinstance(result, list) else []:
+                yield item
+            return
+        event = self._event('GET', url)
+        shared = None
+        if self.inflight is not None:
+            try:
+                shared = self.inflight.join(self.cache_key(url))
+            except Exception:
+                # the request it would have shared failed;  make its own
+                shared = None
+        if shared is not None:
+            (body, response), _ = shared
+            event.coalesced = True
+            self._local.response = response
+            self._record(event, response)
+            event.bytes, event.wire_bytes = len(body), 0
+            self._emit('after_response', event)
+            result = self.json_decoder(body)
+            for item in result if isinstance(result, list) else []:
+                yield item
+            return
+        parser = ArrayParser(self.json_decoder)
+        response = None
+        try:
+            try:
+                response = self._send(url, event, self._open_stream)
+                event.timings['wait'] = event.elapsed() - event.timings.get('throttle', 0)
+                for chunk in response.iter_chunks(chunk_size):
+                    for item in parser.feed(chunk):
+                        yield item
+                for item in parser.close():
+                    yield item
+            finally:
+                if response is not None:
+                    response.close()
+        except GeneratorExit:
+            raise
+        except:
+            self._failed(event)
+            if getattr(self._local, 'strict', False):
+                raise
+            if not quiet:
+                import traceback
+                print traceback.format_exc()
+                print "url was: %s" % url
+            return
+        self._record(event, response)
+        event.bytes = response.decoded_size
+        self._emit('after_response', event)
+
+    def _open_stream(self, url, event):
+        return self._open(self.build_request(url), True, event)
+
+    def _load(self, url, quiet=False, parse=None):
+        event = self._event('GET', url)
+        try:
+            result = self._fetch(url, event)
+        except AuthenticationRequired:
+            # no usable credentials left in the token pool
+            raise
         except:
+            self._failed(event)
+            if getattr(self._local, 'strict', False):
+                raise
             if not quiet:
                 import traceback
                 print traceback.format_exc()
                 print "url was: %s" % url
             result = "{}"
+        if parse is not None:
+            start = time.time()
+            result = parse(result)
+            event.timings['decode'] = time.time() - start
+        if event.error is None:
+            self._emit('after_response', event)
         return result
 
+    def iter_url(self, url, chunk_size=64*1024, offset=0, retries=3):
+        """Yield the body of a url in chunks of ``chunk_size`` bytes, starting
+        at byte ``offset``, without holding it all in memory.  If the transfer
+        is interrupted, it is resumed from the last byte received with a
+        Range request, up to ``retries`` times in a row."""
+        failures = 0
+        event = self._event('GET', url)
+        while True:
+            self.wait(event)
+            request = self.build_request(url)
+            request.add_header('Accept-Encoding', 'identity')
+            if offset:
+                request.add_header('Range', 'bytes=%d-' % offset)
+            response = None
+            try:
+                try:
+                    response = self._open(request, stream=True)
+                except HTTPError, e:
+                    if offset and e.code == 416:
+                        self._emit('after_response', event)
+                        return
+                    raise
+                # a server which ignores Range starts over from byte 0
+                skip = offset if response.status != 206 else 0
+                for chunk in response.iter_chunks(chunk_size):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk, skip = chunk[skip:], 0
+                    offset += len(chunk)
+                    event.bytes += len(chunk)
+                    failures = 0
+                    yield chunk
+                event.status = response.status
+                event.wire_bytes = response.wire_size
+                self._emit('after_response', event)
+                return
+            except HTTPError:
+                self._failed(event)
+                raise
+            except (socket.error, httplib.HTTPException):
+                failures += 1
+                if failures > retries:
+                    self._failed(event)
+                    raise
+            finally:
+                if response is not None:
+                    response.close()
+
+    def download_url(self, url, fileobj, chunk_size=64*1024, offset=0, size=None,
+            checksum=None, algorithm='md5', retries=3):
+        """Write the body of a url to ``fileobj`` chunk by chunk, resuming
+        interrupted transfers (see iter_url).  To resume a previous download,
+        pass the number of bytes already in fileobj as ``offset``.  If ``size``
+        or a hex ``checksum`` are given, the result is checked against them
+        and DownloadError raised on a mismatch;  checksumming a resumed
+        download reads the bytes already present back from fileobj.  Returns
+        the total size of the file."""
+        digest = hashlib.new(algorithm) if checksum else None
+        if digest and offset:
+            fileobj.seek(0)
+            remaining = offset
+            while remaining:
+                chunk = fileobj.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise DownloadError("%s has fewer than %d bytes" % (fileobj, offset))
+                digest.update(chunk)
+                remaining -= len(chunk)
+        if offset:
+            fileobj.seek(offset)
+        total = offset
+        for chunk in self.iter_url(url, chunk_size, offset, retries):
+            fileobj.write(chunk)
+            if digest:
+                digest.update(chunk)
+            total += len(chunk)
+        if size is not None and total != size:
+            raise DownloadError("expected %d bytes from %s, got %d" % (size, url, total))
+        if digest and digest.hexdigest() != checksum.lower():
+            raise DownloadError("%s checksum mismatch for %s: expected %s, got %s" % (
+                algorithm, url, checksum, digest.hexdigest()))
+        return total
+
     def post_url(self, url, data={}, quiet=False):
         data = dict(data)
-        self.wait()
+        event = self._event('POST', url)
+        self.wait(event)
         request = self.build_request(url, urlencode(data))
         try:
-            result = urlopen(request).read()
+            result = self._read(request, event)
         except:
+            self._failed(event)
+            if getattr(self._local, 'strict', False):
+                raise
             if not quiet:
                 import traceback
                 traceback.print_exc()
                 print "url was: %s" % url
             result = False
+        else:
+            self._emit('after_response', event)
         return result
 
+    def close(self):
+        """Close any idle pooled connections held by this handle."""
+        self.pool.close()
+
+    fetchers = {
+        'user': lambda gh, username: gh.user(username).get(),
+        'repositories': lambda gh, username: gh.user(username).repositories(all=True),
+        'repository': lambda gh, username, name: gh.repository(username, name).get(),
+        'branches': lambda gh, username, name: gh.repository(username, name).branches(),
+        'tags': lambda gh, username, name: gh.repository(username, name).tags(),
+        'commits': lambda gh, username, name: gh.repository(username, name).commits(all=True),
+        'commit': lambda gh, username, name, sha: gh.repository(username, name).commit(sha),
+        'gist': lambda gh, id: gh.gist(id).get(),
+    }
+
+    def _fetch_one(self, spec):
+        """Fetch a spec, with failed requests raising rather than returning
+        nothing."""
+        previous = getattr(self._local, 'strict', False)
+        self._local.strict = True
+        try:
+            if callable(spec):
+                return spec()
+            return self.fetchers[spec[0]](self, *spec[1:])
+        finally:
+            self._local.strict = previous
+
+    def fetch_many(self, specs, concurrency=8, stream=False):
+        """Fetch many objects concurrently over this handle's connection pool
+        and rate limiter.  Each spec is a tuple naming one of ``fetchers``
+        and its arguments, eg. ``('repository', 'jmoiron', 'iris')``, or a
+        callable taking no arguments.  Returns a list of FetchResults in the
+        order of specs, or with ``stream`` a generator of FetchResults in
+        the order they finish.  A failed fetch has its exception in ``error``
+        rather than aborting the batch.  With a GraphQL backend, users,
+        repositories, branches and tags are fetched in batches by it."""
+        if self.graphql is not None:
+            return self.graphql.fetch_many(specs, concurrency, stream)
+        return self._fetch_many(specs, concurrency, stream)
+
+    def _fetch_many(self, specs, concurrency=8, stream=False):
+        specs = list(specs)
+        executor = Executor(concurrency)
+        futures = executor.map(self._fetch_one, specs)
+        spec_of = dict(zip(futures, specs))
+        def result(future):
+            error = future.exception()
+            return FetchResult(spec_of[future], None if error else future.result(), error)
+        def results():
+            try:
+                for future in as_completed(futures):
+                    yield result(future)
+            finally:
+                executor.shutdown(wait=False)
+        if stream:
+            return results()
+        try:
+            return [result(future) for future in futures]
+        finally:
+            executor.shutdown(wait=False)
+
+    def pipeline(self, concurrency=8):
+        """A WritePipeline for queueing follows and key changes on this
+        handle and sending them together."""
+        return WritePipeline(self, concurrency)
+
     def user_search(self, term):
         pass
 
@@ -185,8 +1067,8 @@ class Github(object):
 
     @requires_authentication
     def organizations(self):
-        url = api_base + 'organizations'
-        return json.loads(self.load_url(url))
+        url = self.api_base + 'organizations'
+        return self.load_json(url)
 
     def __repr__(self):
         extra = ''
@@ -204,44 +1086,62 @@ class User(object):
         return Repository(self.gh, self.username, name)
 
     @handle_pagination_all
-    def repositories(self, page=None, all=False):
+    def repositories(self, page=None, all=False, per_page=None):
         """Show a user's repositories.  If 'all' is True, load all pages."""
-        query = smart_encode(page=page)
-        url = api_base + 'users/%s/repos' % self.username
+        repositories = decode(RepoInfo,
+            self.gh.load_json(self._repositories_url(page, per_page)), self.gh.models)
+        if self.gh.store is not None and isinstance(repositories, list):
+            self._persist_repositories(repositories)
+        return repositories
+
+    def _repositories_url(self, page=None, per_page=None):
+        query = smart_encode(page=page, per_page=per_page)
+        url = self.gh.api_base + 'users/%s/repos' % self.username
         if query:
             url += '?%s' % query
-        return json.loads(self.gh.load_url(url))
+        return url
+
+    def _persist_repositories(self, repositories):
+        self.gh.store.put_repositories(self.username, repositories)
+
+    def iter_repositories(self, prefetch=False, stream=False, per_page=None):
+        """Iterate over a user's repositories, fetching pages as needed.  With
+        ``stream``, each page's repositories are yielded as they arrive."""
+        if stream:
+            return iter_stream_pages(self.gh, lambda page: self._repositories_url(page, per_page),
+                RepoInfo, self._persist_repositories if self.gh.store is not None else None)
+        return iter_pages(self.repositories, prefetch=prefetch, per_page=per_page)
 
     def watched_repositories(self):
         """Show repositories a user is following.  I am not sure if this is
         paged or not."""
-        url = api_base + 'users/%s/watched' % self.username
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'users/%s/watched' % self.username
+        return decode(RepoInfo, self.gh.load_json(url), self.gh.models)
 
     @authenticated_user_only
     def follow(self, username):
         """Follow user with currently authenticated user."""
-        url = api_base + 'user/follow/%s' % username
+        url = self.gh.api_base + 'user/follow/%s' % username
         return bool(self.gh.post_url(url))
 
     @authenticated_user_only
     def unfollow(self, username):
         """Unfollow a user with currently authenticated user."""
-        url = api_base + 'user/unfollow/%s' % username
+        url = self.gh.api_base + 'user/unfollow/%s' % username
         return bool(self.gh.post_url(url))
 
     def following(self):
-        url = api_base + 'user/show/%s/following' % self.username
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'user/show/%s/following' % self.username
+        return self.gh.load_json(url)
 
     def followers(self):
-        url = api_base + 'user/show/%s/followers' % self.username
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'user/show/%s/followers' % self.username
+        return self.gh.load_json(url)
 
     @authenticated_user_only
     def emails(self):
-        url = api_base + 'user/emails'
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'user/emails'
+        return self.gh.load_json(url)
 
     # XXX: the API docs aren't finished for these two
     @authenticated_user_only
@@ -254,24 +1154,24 @@ class User(object):
 
     @authenticated_user_only
     def keys(self):
-        url = api_base + 'user/keys'
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'user/keys'
+        return self.gh.load_json(url)
 
     @authenticated_user_only
     def add_key(self, title, key):
-        url = api_base + 'user/key/add'
+        url = self.gh.api_base + 'user/key/add'
         return self.gh.post_url(url, dict(title=title, key=key))
 
     @authenticated_user_only
     def remove_key(self, id):
-        url = api_base + 'user/key/remove'
+        url = self.gh.api_base + 'user/key/remove'
         return self.gh.post_url(url, dict(id=id))
 
     def gists(self, private=False):
         if private:
             raise NotImplementedError #XXX: no API docs yet
-        url = gist_base + 'gists/%s' % self.username
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.gist_base + 'gists/%s' % self.username
+        return self.gh.load_json(url)
 
     def gist(self, id):
         # XXX: Gists don't actually "belong" to a user under the GIST API,
@@ -283,8 +1183,9 @@ class User(object):
         raise NotImplementedError
 
     def get(self):
-        url = api_base + 'user/show/%s' % self.username
-        return json.loads(self.gh.load_url(url)).get('user', {})
+        url = self.gh.api_base + 'user/show/%s' % self.username
+        user = self.gh.load_json(url).get('user', {})
+        return decode(UserInfo, user, self.gh.models)
 
     def __repr__(self):
         return '<User: %s>' % self.username
@@ -297,47 +1198,124 @@ class Repository(object):
         self.project = '%s/%s' % (username, name)
 
     def get(self):
-        url = api_base + 'repos/show/%s/%s' % (self.username, self.name)
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'repos/show/%s/%s' % (self.username, self.name)
+        return decode(RepoInfo, self.gh.load_json(url), self.gh.models)
 
     @requires_authentication
     def watch(self):
         raise NotImplementedError
 
     @handle_pagination_all
-    def commits(self, branch='master', page=None, all=False):
-        query = smart_encode(page=page)
-        url = api_base + 'repos/%s/%s/commits' % (self.username, self.name)
+    def commits(self, branch='master', page=None, all=False, since=None, per_page=None):
+        """Get a page of commits, newest first;  ``since`` is an ISO 8601
+        timestamp limiting them to commits made at or after it."""
+        commits = decode(Commit,
+            self.gh.load_json(self._commits_url(page, since, per_page)), self.gh.models)
+        if self.gh.store is not None and isinstance(commits, list):
+            self._persist_commits(commits)
+        return commits
+
+    def _commits_url(self, page=None, since=None, per_page=None, sha=None):
+        query = smart_encode(sha=sha, page=page, since=since, per_page=per_page)
+        url = self.gh.api_base + 'repos/%s/%s/commits' % (self.username, self.name)
         if query:
             url += '?%s' % query
-        return json.loads(self.gh.load_url(url))
+        return url
+
+    def _persist_commits(self, commits):
+        self.gh.store.put_commits(self.username, self.name, commits)
+
+    def iter_commits(self, branch='master', prefetch=False, stream=False, per_page=None):
+        """Iterate over a repository's commits, newest first, fetching pages
+        as needed.  With ``stream``, each page's commits are yielded as they
+        arrive."""
+        if stream:
+            return iter_stream_pages(self.gh, lambda page: self._commits_url(page, None, per_page),
+                Commit, self._persist_commits if self.gh.store is not None else None)
+        return iter_pages(self.commits, prefetch=prefetch, branch=branch, per_page=per_page)
+
+    def sync_commits(self, cursor=None, since=None, branch='master'):
+        """Fetch only the commits made since a previous sync, newest first.
+        ``cursor`` is the CommitCursor returned by the last sync, or the sha
+        of the newest commit already known;  pages are walked until that
+        commit turns up, so a poll with nothing new costs one request.  The
+        cursor's date doesn't bound the walk, as a merged branch can bring
+        in commits older than it;  an ISO 8601 ``since`` timestamp bounds
+        it by date.  History is walked from ``branch`` (or a sha), a page
+        of ``max_per_page`` commits at a time.  Returns the new commits and
+        the cursor to pass next time.  Unlike most methods, failed requests
+        raise rather than returning nothing, so a cursor is never advanced
+        past commits that weren't seen."""
+        if isinstance(cursor, basestring):
+            cursor = CommitCursor(cursor, None)
+        known = cursor.sha if cursor else None
+        oldest = to_datetime(since) if since else None
+        commits = []
+        previous = getattr(self.gh._local, 'strict', False)
+        self.gh._local.strict = True
+        try:
+            page = 1
+            while True:
+                url = self._commits_url(page, since, max_per_page, sha=branch)
+                result = decode(Commit, self.gh.load_json(url), self.gh.models)
+                if self.gh.store is not None:
+                    self._persist_commits(result)
+                for commit in result:
+                    if commit['sha'] == known:
+                        break
+                    date = commit_date(commit)
+                    if oldest and date and to_datetime(date) < oldest:
+                        break
+                    commits.append(commit)
+                else:
+                    last = last_page(self.gh.last_response)
+                    if len(result) == max_per_page and (last is None or page < last):
+                        page += 1
+                        continue
+                break
+        finally:
+            self.gh._local.strict = previous
+        if commits:
+            cursor = CommitCursor(commits[0]['sha'], commit_date(commits[0]))
+        return commits, cursor
 
     def commit(self, sha):
-        url = api_base + 'repos/%s/%s/commits/%s' % (self.username, self.name, sha)
-        return json.loads(self.gh.load_url(url))
+        url = self.gh.api_base + 'repos/%s/%s/commits/%s' % (self.username, self.name, sha)
+        return decode(Commit, self.gh.load_json(url), self.gh.models)
 
     def tags(self):
         """Get a list of tags for a repository."""
-        url = api_base + 'repos/show/%s/%s/tags' % (self.username, self.name)
-        return json.loads(self.gh.load_url(url)).get('tags', [])
+        url = self.gh.api_base + 'repos/show/%s/%s/tags' % (self.username, self.name)
+        return self.gh.load_json(url).get('tags', [])
 
     def branches(self):
         """Get a list of branches for a repository."""
-        url = api_base + 'repos/show/%s/%s/branches' % (self.username, self.name)
-        return json.loads(self.gh.load_url(url)).get('branches', [])
+        url = self.gh.api_base + 'repos/show/%s/%s/branches' % (self.username, self.name)
+        return self.gh.load_json(url).get('branches', [])
 
     def issue(self, number):
         return Issue(self.gh, self.username, self.name, number)
 
     def issues(self, open=True):
         """Get a list of open issues.  Pass open=False to get closed issues."""
-        url = api_base + "issues/list/%s/%s/%s" % (self.username, self.name,
+        url = self.gh.api_base + "issues/list/%s/%s/%s" % (self.username, self.name,
             'open' if open else 'closed')
-        return json.loads(self.gh.load_url(url)).get('issues', [])
+        issues = self.gh.load_json(url).get('issues', [])
+        if self.gh.store is not None:
+            self.gh.store.put_issues(self.username, self.name, issues)
+        return issues
 
     def followers(self):
         url = self.base_url + 'followers/'
-        return json.loads(self.gh.load_url(url))
+        return self.gh.load_json(url)
+
+    def graph(self, fill=True, branch='master'):
+        """A CommitGraph of this repository, with ``branch``'s history in it
+        unless ``fill`` is False."""
+        graph = CommitGraph(self)
+        if fill:
+            graph.fill(branch)
+        return graph
 
     def __repr__(self):
         return '<Repository: %s\'s %s>' % (self.username, self.name)
@@ -348,8 +1326,8 @@ class Gist(object):
         self.id = id
 
     def get(self):
-        url = gist_base + '%s' % self.id
-        return json.loads(self.gh.load_url(url))['gists']
+        url = self.gh.gist_base + '%s' % self.id
+        return self.gh.load_json(url)['gists']
 
     def get_file(self, filename):
         """Get a raw file from a gist.  Note that this is not in json, but
@@ -357,6 +1335,19 @@ class Gist(object):
         url = 'http://gist.github.com/raw/%s/%s' % (self.id, filename)
         return self.gh.load_url(url)
 
+    def iter_file(self, filename, chunk_size=64*1024, offset=0):
+        """Stream a raw file from a gist in chunks of ``chunk_size`` bytes,
+        resuming with Range requests if the transfer is interrupted."""
+        url = 'http://gist.github.com/raw/%s/%s' % (self.id, filename)
+        return self.gh.iter_url(url, chunk_size, offset)
+
+    def download_file(self, filename, fileobj, **kwargs):
+        """Write a raw file from a gist to ``fileobj`` in chunks, optionally
+        checking its size and checksum.  Takes the same keyword arguments as
+        Github.download_url."""
+        url = 'http://gist.github.com/raw/%s/%s' % (self.id, filename)
+        return self.gh.download_url(url, fileobj, **kwargs)
+
     @requires_authentication
     def fork(self, *args, **kwargs):
         raise NotImplementedError
@@ -380,12 +1371,12 @@ class Issue(object):
         self.number = number
 
     def get(self):
-        url = api_base + 'issues/show/%s/%s/%s' % (self.username. self.repos, self.number)
-        return json.loads(self.gh.load_url(self.base_url))
+        url = self.gh.api_base + 'issues/show/%s/%s/%s' % (self.username. self.repos, self.number)
+        return self.gh.load_json(self.base_url)
 
     def followers(self):
         url = self.base_url + 'followers/'
-        return json.loads(self.gh.load_url(url))
+        return self.gh.load_json(url)
 
     def __repr__(self):
         return '<Issue #%s on %s\'s %s>' % (self.number, self.username, self.slug)
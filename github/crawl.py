@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Crawling across processes.  Decoding json and timestamps for a large
+crawl keeps one interpreter busy, so a Crawler spreads the fetches over a
+pool of worker processes, each with its own Github handle.  The handles
+share a single SharedRateLimiter, so together they stay within the one
+budget github gives the user, and results are sent back to the parent as
+each job finishes."""
+
+import sys
+import pickle
+import multiprocessing
+from collections import namedtuple
+
+from core import Github
+from ratelimit import SharedRateLimiter
+
+__all__ = ["Crawler", "CrawlResult"]
+
+CrawlResult = namedtuple('CrawlResult', 'spec value error')
+
+# the worker process's handle and result transform, set up by _init_worker
+_gh = None
+_transform = None
+
+def _init_worker(kwargs, transform):
+    global _gh, _transform
+    _gh = Github(**kwargs)
+    _transform = transform
+
+def _portable(error):
+    """``error`` if it can be sent back to the parent, otherwise a
+    RuntimeError describing it;  HTTPErrors, for one, hold a response."""
+    try:
+        pickle.loads(pickle.dumps(error, 2))
+        return error
+    except Exception:
+        return RuntimeError('%s: %s' % (error.__class__.__name__, error))
+
+def _crawl_one(spec):
+    try:
+        value = _gh._fetch_one(spec)
+        if _transform is not None:
+            value = _transform(spec, value)
+    except Exception:
+        return CrawlResult(spec, None, _portable(sys.exc_info()[1]))
+    return CrawlResult(spec, value, None)
+
+class Crawler(object):
+    """Runs fetch jobs on ``processes`` worker processes.  The remaining
+    keyword arguments are passed to each worker's Github handle;  they all
+    share ``limiter``, a SharedRateLimiter created if not given.  Token
+    pools are not shared between processes, so use one token per crawler.
+
+    ``transform(spec, value)``, if given, is applied to each result in the
+    worker, so that expensive post-processing happens off the parent process
+    too.  It, and the results, must be picklable;  the handles are created
+    without result models for the same reason."""
+    def __init__(self, processes=4, limiter=None, transform=None, **kwargs):
+        self.processes = processes
+        self.limiter = limiter or SharedRateLimiter()
+        self.transform = transform
+        kwargs['limiter'] = self.limiter
+        kwargs['models'] = False
+        self.kwargs = kwargs
+
+    def crawl(self, specs):
+        """Fetch each spec, as understood by Github.fetch_many, eg.
+        ``('commits', 'jmoiron', 'iris')``.  Yields a CrawlResult per spec in
+        the order they finish;  failures are reported in ``error``.
+        Closing the generator early stops the workers."""
+        pool = multiprocessing.Pool(self.processes, _init_worker,
+            (self.kwargs, self.transform))
+        finished = False
+        try:
+            for result in pool.imap_unordered(_crawl_one, specs):
+                yield result
+            finished = True
+        finally:
+            if finished:
+                pool.close()
+            else:
+                pool.terminate()
+            pool.join()
+
+    def repositories(self, usernames):
+        """Crawl the repositories of each of ``usernames``."""
+        return self.crawl(('repositories', username) for username in usernames)
+
+    def commits(self, repositories):
+        """Crawl the full history of each (owner, name) in ``repositories``."""
+        return self.crawl(('commits', owner, name) for owner, name in repositories)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Following events feeds to learn what has changed.  Rather than polling
+the commits, branches and issues of every repository to stay fresh, an
+EventPoller polls the events feeds of the users, organizations or
+repositories of interest, with conditional requests (a 304 costs no rate
+limit) at the interval github asks for in ``X-Poll-Interval``.  Each new
+event is turned into Changes naming the resources it touched, which are
+dropped from the handle's response cache, invalidated or refreshed in its
+Store, and passed to subscribers.  The requests made grow with the number
+of feeds and the rate of change, not the number of repositories."""
+
+import sys
+import time
+import threading
+from collections import namedtuple, OrderedDict
+
+import core
+
+__all__ = ["Change", "EventPoller", "event_changes"]
+
+# ``kind`` is one of "user" (a user's profile and repository list),
+# "repository", "commits", "branches", "tags" or "issues";  ``number`` is set
+# for changes to one issue or pull request
+Change = namedtuple('Change', 'kind owner repo number event')
+
+ref_kinds = {'branch': 'branches', 'tag': 'tags'}
+
+def event_changes(event):
+    """The Changes an event from a feed implies."""
+    owner, _, repo = event['repo']['name'].partition('/')
+    payload = event.get('payload') or {}
+    type = event['type']
+    def change(kind, number=None):
+        return Change(kind, owner, repo, number, event)
+    if type == 'PushEvent':
+        return [change('commits'), change('branches')]
+    if type in ('CreateEvent', 'DeleteEvent'):
+        ref_type = payload.get('ref_type')
+        if ref_type in ref_kinds:
+            return [change(ref_kinds[ref_type])]
+        return [change('repository'), change('user')]
+    if type in ('IssuesEvent', 'IssueCommentEvent', 'PullRequestEvent',
+            'PullRequestReviewCommentEvent'):
+        item = payload.get('issue') or payload.get('pull_request') or {}
+        return [change('issues', item.get('number'))]
+    if type == 'ReleaseEvent':
+        return [change('tags')]
+    if type == 'PublicEvent':
+        return [change('repository'), change('user')]
+    return [change('repository')]
+
+class Feed(object):
+    """An events feed, and what is known of it from the last poll."""
+    def __init__(self, url, replay=False):
+        self.url = url
+        self.etag = None
+        self.last_id = 0 if replay else None
+        self.interval = 60
+        self.next_poll = 0
+        self.error = None
+
+    def __repr__(self):
+        return '<Feed %s>' % self.url
+
+class EventPoller(object):
+    """Polls events feeds through a Github handle.  Changes are applied to
+    ``store`` (the handle's by default):  with ``refresh``, changed commits,
+    issues and repository lists are fetched again at once, otherwise they
+    are marked stale for the store's next ``refresh_*``.  Feeds are polled no
+    more often than every ``min_interval`` seconds, or github's
+    X-Poll-Interval if it asks for longer.
+
+    The first poll of a feed only notes where it is up to;  watch it with
+    ``replay`` to have the events already in it applied too.  A refresh
+    which fails leaves its row stale for the next one, and the change and
+    exception are kept in ``change_errors`` until the next poll."""
+    def __init__(self, gh, store=None, refresh=False, min_interval=60, quiet=False):
+        self.gh = gh
+        self.store = store if store is not None else gh.store
+        self.refresh = refresh
+        self.min_interval = min_interval
+        self.quiet = quiet
+        self.feeds = []
+        self.subscribers = []
+        self.change_errors = []
+
+    def _watch(self, path, replay):
+        feed = Feed(self.gh.api_base + path, replay)
+        feed.interval = self.min_interval
+        self.feeds.append(feed)
+        return feed
+
+    def watch_user(self, login, replay=False):
+        """Follow the events a user performs."""
+        return self._watch('users/%s/events' % login, replay)
+
+    def watch_org(self, org, replay=False):
+        """Follow the events in an organization's repositories."""
+        return self._watch('orgs/%s/events' % org, replay)
+
+    def watch_repository(self, owner, name, replay=False):
+        return self._watch('repos/%s/%s/events' % (owner, name), replay)
+
+    def subscribe(self, callback, kinds=None):
+        """Call ``callback(change)`` for each Change, or only for those of
+        the given ``kinds``, once it has been applied."""
+        self.subscribers.append((callback, kinds))
+
+    def unsubscribe(self, callback):
+        self.subscribers = [(c, k) for c, k in self.subscribers if c != callback]
+
+    # -- polling
+
+    def _get(self, feed, url):
+        """Conditionally GET a page of a feed;  None if it hasn't changed."""
+        gh = self.gh
+        event = gh._event('GET', url)
+        gh.wait(event)
+        request = gh.build_request(url)
+        if feed.etag and url == feed.url:
+            request.add_header('If-None-Match', feed.etag)
+        try:
+            body = gh._read(request, event)
+        except:
+            gh._failed(event)
+            raise
+        gh._emit('after_response', event)
+        response = gh.last_response
+        if url == feed.url:
+            interval = response.getheader('x-poll-interval') or ''
+            if interval.isdigit():
+                feed.interval = max(self.min_interval, int(interval))
+            if response.status == 304:
+                return None
+            feed.etag = response.getheader('etag')
+        return gh.json_decoder(body)
+
+    def _new_events(self, feed):
+        """The events in a feed since the last poll, oldest first.  Pages
+        are followed until one reaches events already seen."""
+        url, events = feed.url, []
+        while url:
+            page = self._get(feed, url)
+            if not page:
+                break
+            new = [e for e in page if feed.last_id is None or int(e['id']) > feed.last_id]
+            events += new
+            if feed.last_id is None or len(new) < len(page):
+                break
+            url = core.parse_link_header(self.gh.last_response.getheader('link')).get('next')
+        if events:
+            newest = max(int(e['id']) for e in events)
+            first = feed.last_id is None
+            feed.last_id = max(newest, feed.last_id or 0)
+            if first:
+                return []
+        elif feed.last_id is None:
+            feed.last_id = 0
+        return sorted(events, key=lambda e: int(e['id']))
+
+    def poll(self, force=False):
+        """Poll each feed which is due (or every feed, with ``force``) and
+        apply the changes found.  Returns the Changes, with each resource
+        appearing once, for its latest event.  A feed which fails is tried
+        again after its interval;  its exception is kept in ``error``."""
+        now = time.time()
+        changes = OrderedDict()
+        self.change_errors = []
+        for feed in self.feeds:
+            if not force and feed.next_poll > now:
+                continue
+            try:
+                events = self._new_events(feed)
+                feed.error = None
+            except Exception:
+                feed.error = sys.exc_info()[1]
+                events = []
+                if not self.quiet:
+                    import traceback
+                    traceback.print_exc()
+                    print "feed was: %s" % feed.url
+            feed.next_poll = time.time() + feed.interval
+            for event in events:
+                for change in event_changes(event):
+                    key = change[:4]
+                    changes.pop(key, None)
+                    changes[key] = change
+        # in the order of their latest events
+        changes = sorted(changes.values(), key=lambda c: int(c.event['id']))
+        done = set()
+        for change in changes:
+            self.apply(change, done)
+        return changes
+
+    def next_poll(self):
+        """Seconds until the next feed is due to be polled."""
+        if not self.feeds:
+            return self.min_interval
+        return max(0, min(f.next_poll for f in self.feeds) - time.time())
+
+    def run(self, stop=None):
+        """Poll until ``stop``, a threading.Event, is set."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self.next_poll())
+
+    # -- applying changes
+
+    def _urls(self, change):
+        """The urls of each resource a change touches, without a query."""
+        paths = {
+            'user': ['user/show/%(owner)s', 'users/%(owner)s/repos'],
+            'repository': ['repos/show/%(owner)s/%(repo)s', 'users/%(owner)s/repos'],
+            'commits': ['repos/%(owner)s/%(repo)s/commits'],
+            'branches': ['repos/show/%(owner)s/%(repo)s/branches'],
+            'tags': ['repos/show/%(owner)s/%(repo)s/tags'],
+            'issues': ['issues/list/%(owner)s/%(repo)s/open',
+                'issues/list/%(owner)s/%(repo)s/closed'],
+        }[change.kind]
+        if change.kind == 'issues' and change.number is not None:
+            paths.append('issues/show/%(owner)s/%(repo)s/%(number)s')
+        return [self.gh.api_base + p % change._asdict() for p in paths]
+
+    def _stored(self, change):
+        """What a change touches in the store, as (kind, owner, repo)."""
+        if change.kind in ('user', 'repository'):
+            return ('repositories', change.owner, '')
+        if change.kind in ('commits', 'issues'):
+            return (change.kind, change.owner, change.repo)
+        return None
+
+    def apply(self, change, done=None):
+        """Drop a change's resources from the response cache, invalidate or
+        refresh them in the store, and notify subscribers.  Store rows
+        already in ``done`` are left alone, and those touched are added."""
+        gh, store = self.gh, self.store
+        if gh.cache is not None:
+            # every page is dropped, eg. those fetched with all=True
+            delete = getattr(gh.cache, 'delete_pages', gh.cache.delete)
+            for url in self._urls(change):
+                delete(gh.cache_key(url))
+        stored = self._stored(change) if store is not None else None
+        if stored is not None and (done is None or stored not in done):
+            kind, owner, repo = stored
+            try:
+                if not self.refresh:
+                    store.invalidate(kind, owner, repo)
+                elif kind == 'repositories':
+                    store.refresh_repositories(gh, owner, force=True)
+                else:
+                    getattr(store, 'refresh_' + kind)(gh, owner, repo, force=True)
+            except Exception:
+                # the event is consumed, so the row must be refreshed later
+                self.change_errors.append((change, sys.exc_info()[1]))
+                store.invalidate(kind, owner, repo)
+                if not self.quiet:
+                    import traceback
+                    traceback.print_exc()
+                    print "change was: %s %s/%s" % (change.kind, owner, repo)
+            if done is not None:
+                done.add(stored)
+        for callback, kinds in self.subscribers:
+            if kinds is None or change.kind in kinds:
+                callback(change)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A small Future and worker-thread Executor, used to run many API calls
+concurrently over one Github handle's connection pool and rate limiter."""
+
+import sys
+import threading
+from Queue import Queue
+
+__all__ = ["Future", "Executor", "SingleFlight", "as_completed"]
+
+class Future(object):
+    """The eventual result of a call running on an Executor."""
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._result = None
+        self._exc_info = None
+
+    def done(self):
+        return self._event.is_set()
+
+    def _finish(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info=None):
+        """Fail the future with ``exc_info`` (or the exception being handled),
+        which is re-raised with its traceback by result()."""
+        self._exc_info = exc_info or sys.exc_info()
+        self._finish()
+
+    def exception(self, timeout=None):
+        """Return the exception the call raised, or None."""
+        if not self._event.wait(timeout):
+            raise RuntimeError("timed out waiting for result")
+        return self._exc_info[1] if self._exc_info else None
+
+    def result(self, timeout=None):
+        """Block until the call is finished and return its result, or raise
+        the exception it raised."""
+        if not self._event.wait(timeout):
+            raise RuntimeError("timed out waiting for result")
+        if self._exc_info:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def add_done_callback(self, callback):
+        """Call ``callback(future)`` when the future finishes, or right away
+        if it already has."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def then(self, func):
+        """Returns a new Future for ``func(result)``, run in whichever thread
+        finishes this one.  Exceptions propagate to the new future."""
+        future = Future()
+        def chain(done):
+            try:
+                future.set_result(func(done.result()))
+            except:
+                future.set_exception()
+        self.add_done_callback(chain)
+        return future
+
+def as_completed(futures):
+    """Yield futures as they finish, regardless of the order given."""
+    futures = list(futures)
+    queue = Queue()
+    for future in futures:
+        future.add_done_callback(queue.put)
+    for i in range(len(futures)):
+        yield queue.get()
+
+class Executor(object):
+    """Runs submitted calls on up to ``workers`` daemon threads, which are
+    started as they are needed."""
+    def __init__(self, workers=8):
+        self.workers = workers
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            future, func, args, kwargs = job
+            try:
+                result = func(*args, **kwargs)
+            except:
+                future.set_exception()
+            else:
+                future.set_result(result)
+
+    def submit(self, func, *args, **kwargs):
+        """Schedule ``func(*args, **kwargs)`` and return a Future for it."""
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        with self._lock:
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        return future
+
+    def map(self, func, items):
+        """Submit ``func(item)`` for every item, returning the futures in
+        the order of items."""
+        return [self.submit(func, item) for item in items]
+
+    def shutdown(self, wait=True):
+        """Stop the worker threads once the queued calls are finished."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        if wait:
+            for thread in threads:
+                thread.join()
+
+class SingleFlight(object):
+    """Coalesces concurrent calls made with the same key:  while one call for
+    a key is running, others for it wait for and share its outcome rather
+    than making their own.  ``coalesced`` counts the calls that were shared."""
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """Call ``func(*args, **kwargs)`` unless a call for ``key`` is already
+        running.  Returns a (result, shared) pair;  exceptions are raised in
+        every caller that shared the call."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                future = self._calls[key] = Future()
+                leader = True
+        if not leader:
+            return future.result(), True
+        try:
+            result = func(*args, **kwargs)
+        except:
+            exc_info = sys.exc_info()
+            self._forget(key)
+            future.set_exception(exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    def join(self, key):
+        """Wait for and share the outcome of a call for ``key`` which is
+        already running, as ``do`` would;  returns None if there is none."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                return None
+            self.coalesced += 1
+        return future.result(), True
+
+    def _forget(self, key):
+        # done before the result is published, so that calls arriving once
+        # the response has been read make their own request, not share it
+        with self._lock:
+            del self._calls[key]
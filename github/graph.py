@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A repository's commit graph, held compactly in memory.  Each commit is
+numbered as it is first seen;  its sha is kept as 20 bytes in one bytearray
+and its parents as numbers in an array, rather than as dicts of hex strings.
+Questions like "is X an ancestor of Y", merge bases and ahead/behind counts
+are then answered by walking the numbers, without any requests.  A graph
+tied to a Repository fetches the ancestors it is missing, a page of history
+from each, all at once."""
+
+import heapq
+from array import array
+from binascii import hexlify, unhexlify
+
+import core
+
+__all__ = ["CommitGraph"]
+
+def _sha(commit):
+    return commit.get('sha') or commit.get('id')
+
+def _parent_shas(commit):
+    """The parent shas of a commit payload;  github gives parents as
+    objects with a ``sha`` (or, in v2, ``id``), or as plain shas."""
+    shas = []
+    for parent in commit.get('parents') or ():
+        shas.append(parent if isinstance(parent, basestring) else _sha(parent))
+    return shas
+
+class CommitGraph(object):
+    """The commits added to it and the parent links between them.  Shas
+    which are named as parents but haven't been added yet are known, but
+    ``missing``.  Given a ``repository``, queries first fetch any missing
+    ancestors of the commits they're about;  without one, missing commits
+    are treated as roots, as are those github has no history for."""
+    def __init__(self, repository=None):
+        self.repository = repository
+        self._index = {}
+        self._shas = bytearray()
+        # first parent, or -1;  the parents of merges are kept in _merges
+        self._first = array('i')
+        self._merges = {}
+        self._loaded = bytearray()
+        self._missing = 0
+        # missing commits github has no history for
+        self._absent = set()
+        self._generations = None
+
+    def __len__(self):
+        """The number of commits which have been added."""
+        return len(self._first) - self._missing
+
+    def __contains__(self, sha):
+        index = self._index.get(unhexlify(sha))
+        return index is not None and self._loaded[index] == 1
+
+    def _node(self, binary):
+        index = self._index.get(binary)
+        if index is None:
+            index = len(self._first)
+            self._index[binary] = index
+            self._shas += binary
+            self._first.append(-1)
+            self._loaded.append(0)
+            self._missing += 1
+        return index
+
+    def _hex(self, index):
+        return hexlify(self._shas[index * 20:index * 20 + 20])
+
+    def _parents(self, index):
+        parents = self._merges.get(index)
+        if parents is not None:
+            return parents
+        first = self._first[index]
+        return (first,) if first >= 0 else ()
+
+    def add(self, commits):
+        """Add commits, as dicts or Commit models, in any order.  Returns the
+        number which weren't already in the graph."""
+        added = 0
+        for commit in commits:
+            index = self._node(unhexlify(_sha(commit)))
+            if self._loaded[index]:
+                continue
+            parents = [self._node(unhexlify(sha)) for sha in _parent_shas(commit)]
+            if parents:
+                self._first[index] = parents[0]
+            if len(parents) > 1:
+                self._merges[index] = tuple(parents)
+            self._loaded[index] = 1
+            self._missing -= 1
+            self._absent.discard(index)
+            added += 1
+        if added:
+            self._generations = None
+        return added
+
+    def parents(self, sha):
+        index, = self._lookup(sha)
+        return [self._hex(i) for i in self._parents(index)]
+
+    def missing(self):
+        """Shas named as parents of added commits but not added themselves."""
+        return [self._hex(i) for i in xrange(len(self._loaded)) if not self._loaded[i]]
+
+    # -- fetching
+
+    def fill(self, branch='master'):
+        """Add a branch's history from the repository, page by page, stopping
+        at the first page which reaches commits already in the graph;  any
+        ancestors beyond those are fetched by ``fetch_missing``.  Returns the
+        number of commits added."""
+        added = 0
+        page = 1
+        while True:
+            commits = self._page(branch, page)
+            new = self.add(commits)
+            added += new
+            if new < len(commits) or len(commits) < core.max_per_page:
+                break
+            page += 1
+        return added + self.fetch_missing()
+
+    def _page(self, sha, page=None):
+        url = self.repository._commits_url(page, per_page=core.max_per_page, sha=sha)
+        return self.repository.gh.load_json(url)
+
+    def fetch_missing(self, shas=None):
+        """Fetch missing commits from the repository:  those in ``shas`` and
+        their missing ancestors, or every missing one.  Each round fetches a
+        page of history from every missing commit concurrently, so a long
+        gap costs a request per page rather than per commit.  Returns the
+        number of commits added.  Commits github answers 404 for, or leaves
+        out of their own page, are remembered as roots and not asked for
+        again."""
+        if self.repository is None:
+            raise ValueError("fetching commits needs a graph with a repository")
+        # requested shas github doesn't know at all
+        unknown = set()
+        def wanted():
+            if shas is None:
+                return [self._hex(i) for i in xrange(len(self._loaded))
+                    if not self._loaded[i] and i not in self._absent]
+            return [s for s in shas if unhexlify(s) not in self._index and s not in unknown] + \
+                self._ancestors_missing(shas)
+        added = 0
+        shas_wanted = wanted()
+        while shas_wanted:
+            results = self.repository.gh.fetch_many(
+                [lambda sha=sha: self._page(sha) for sha in shas_wanted])
+            new = 0
+            for result in results:
+                if result.error is not None:
+                    if getattr(result.error, 'code', None) != 404:
+                        raise result.error
+                    continue
+                new += self.add(result.value)
+            for sha in shas_wanted:
+                index = self._index.get(unhexlify(sha))
+                if index is None:
+                    unknown.add(sha)
+                elif not self._loaded[index]:
+                    self._absent.add(index)
+            if not new:
+                break
+            added += new
+            shas_wanted = wanted()
+        return added
+
+    def _ancestors_missing(self, shas):
+        """Missing commits among the ancestors of ``shas``, other than those
+        known to be absent."""
+        if self._missing == len(self._absent):
+            return []
+        seen = bytearray(len(self._first))
+        stack = [self._index[unhexlify(s)] for s in shas if unhexlify(s) in self._index]
+        found = []
+        while stack:
+            index = stack.pop()
+            if seen[index]:
+                continue
+            seen[index] = 1
+            if not self._loaded[index]:
+                if index not in self._absent:
+                    found.append(self._hex(index))
+                continue
+            stack.extend(self._parents(index))
+        return found
+
+    def _lookup(self, *shas):
+        """The indexes of ``shas``.  If the graph has a repository, any of
+        them which are unknown, and any missing ancestors of them, are
+        fetched first;  otherwise no requests are made."""
+        if self.repository is not None:
+            if [s for s in shas if unhexlify(s) not in self._index] or \
+                    self._ancestors_missing(shas):
+                self.fetch_missing(shas)
+        indexes = []
+        for sha in shas:
+            index = self._index.get(unhexlify(sha))
+            if index is None:
+                raise KeyError(sha)
+            indexes.append(index)
+        return indexes
+
+    # -- queries
+
+    def generations(self):
+        """The generation number of each commit:  one more than the largest
+        of its parents', with missing commits at 0, so that an ancestor
+        always has a lower generation than its descendants."""
+        if self._generations is not None:
+            return self._generations
+        count = len(self._first)
+        generations = array('i', [-1]) * count
+        for root in xrange(count):
+            if generations[root] >= 0:
+                continue
+            stack = [root]
+            while stack:
+                index = stack[-1]
+                if generations[index] >= 0:
+                    stack.pop()
+                    continue
+                parents = self._parents(index)
+                pending = [p for p in parents if generations[p] < 0]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                stack.pop()
+                generations[index] = max([generations[p] + 1 for p in parents] or [0])
+        self._generations = generations
+        return generations
+
+    def is_ancestor(self, ancestor, sha):
+        """Whether ``ancestor`` is ``sha`` or one of its ancestors."""
+        target, start = self._lookup(ancestor, sha)
+        generations = self.generations()
+        floor = generations[target]
+        seen = bytearray(len(self._first))
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            if index == target:
+                return True
+            if seen[index]:
+                continue
+            seen[index] = 1
+            stack.extend(p for p in self._parents(index) if generations[p] >= floor)
+        return False
+
+    def _paint(self, a, b, find_base):
+        """Walk back from both commits, newest generation first, marking
+        each commit with which of them reaches it.  Returns the first commit
+        reached by both if ``find_base``, otherwise the counts of commits
+        reached only from ``a`` and only from ``b``."""
+        generations = self.generations()
+        flags = bytearray(len(self._first))
+        flags[a] |= 1
+        flags[b] |= 2
+        heap = [(-generations[a], a)]
+        if b != a:
+            heap.append((-generations[b], b))
+            heapq.heapify(heap)
+        # entries in the heap not reached by both;  once there are none,
+        # everything left is a common ancestor
+        uncommon = sum(1 for g, i in heap if flags[i] != 3)
+        counts = [0, 0, 0, 0]
+        while heap and uncommon:
+            generation, index = heapq.heappop(heap)
+            flag = flags[index]
+            if flag != 3:
+                uncommon -= 1
+            elif find_base:
+                return index
+            counts[flag] += 1
+            for parent in self._parents(index):
+                before = flags[parent]
+                if before | flag == before:
+                    continue
+                flags[parent] = before | flag
+                if not before:
+                    heapq.heappush(heap, (-generations[parent], parent))
+                    uncommon += flags[parent] != 3
+                elif before != 3 and flags[parent] == 3:
+                    uncommon -= 1
+        if find_base:
+            return heap[0][1] if heap else None
+        return counts[1], counts[2]
+
+    def merge_base(self, a, b):
+        """A best common ancestor of two commits, or None if they have no
+        history in common.  With criss-cross merges there may be several;
+        the one with the highest generation is returned."""
+        base = self._paint(*self._lookup(a, b) + [True])
+        return None if base is None else self._hex(base)
+
+    def ahead_behind(self, a, b):
+        """How many commits ``a`` has that ``b`` doesn't, and how many
+        ``b`` has that ``a`` doesn't."""
+        return self._paint(*self._lookup(a, b) + [False])
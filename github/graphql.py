@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Batched reads over github's GraphQL API.  Fetching the info, branches and
+tags of many repositories over REST costs a request (and a unit of the rate
+limit) for each;  a GraphQLBackend asks for dozens of them in one query,
+each under an alias, and maps what comes back into the shapes the REST
+methods return.  With ``Github(graphql=True)``, ``fetch_many`` sends the
+specs it can batch this way and everything else over REST as before."""
+
+import threading
+from functools import partial
+
+import core
+from ratelimit import RateLimiter
+from models import UserInfo, RepoInfo, decode
+
+__all__ = ["GraphQLError", "GraphQLBackend"]
+
+class GraphQLError(Exception):
+    """An error github reported for a query, or for one object in it;
+    ``type`` is github's error type, eg. ``NOT_FOUND``."""
+    def __init__(self, message, type=None):
+        Exception.__init__(self, message)
+        self.type = type
+
+# the fields read for each object, kept on one line
+repository_fields = ' '.join("""databaseId name nameWithOwner description url homepageUrl
+isPrivate isFork forkCount stargazerCount diskUsage createdAt updatedAt pushedAt
+owner { login } primaryLanguage { name } defaultBranchRef { name }
+issues(states: OPEN) { totalCount }""".split())
+
+user_fields = ' '.join("""databaseId login name email company websiteUrl location bio url
+avatarUrl createdAt followers { totalCount } following { totalCount }
+repositories(privacy: PUBLIC) { totalCount }""".split())
+
+ref_prefixes = {'branches': 'refs/heads/', 'tags': 'refs/tags/'}
+
+def _quote(value):
+    return core.json.dumps(value)
+
+def _refs(kind, first, after=None):
+    args = 'refPrefix: %s, first: %d' % (_quote(ref_prefixes[kind]), first)
+    if after:
+        args += ', after: %s' % _quote(after)
+    # annotated tags point at a tag object, which points at the commit
+    return ('%s: refs(%s) { nodes { name target { oid ... on Tag { target { oid } } } } '
+        'pageInfo { hasNextPage endCursor } }' % (kind, args))
+
+def _repository(data):
+    """A GraphQL repository in the shape of a REST one."""
+    name = lambda obj: obj['name'] if obj else None
+    return {'id': data['databaseId'], 'name': data['name'],
+        'full_name': data['nameWithOwner'], 'owner': {'login': data['owner']['login']},
+        'description': data['description'], 'url': data['url'],
+        'html_url': data['url'], 'homepage': data['homepageUrl'],
+        'private': data['isPrivate'], 'fork': data['isFork'],
+        'forks': data['forkCount'], 'watchers': data['stargazerCount'],
+        'size': data['diskUsage'], 'language': name(data['primaryLanguage']),
+        'master_branch': name(data['defaultBranchRef']),
+        'open_issues': data['issues']['totalCount'], 'created_at': data['createdAt'],
+        'updated_at': data['updatedAt'], 'pushed_at': data['pushedAt']}
+
+def _user(data):
+    """A GraphQL user in the shape of a REST one."""
+    return {'id': data['databaseId'], 'login': data['login'], 'name': data['name'],
+        'email': data['email'], 'company': data['company'], 'blog': data['websiteUrl'],
+        'location': data['location'], 'bio': data['bio'], 'html_url': data['url'],
+        'avatar_url': data['avatarUrl'], 'created_at': data['createdAt'],
+        'followers': data['followers']['totalCount'],
+        'following': data['following']['totalCount'],
+        'public_repos': data['repositories']['totalCount'], 'type': 'User'}
+
+def _ref_shas(connection):
+    shas = {}
+    for node in connection['nodes']:
+        target = node['target']
+        shas[node['name']] = (target.get('target') or target)['oid']
+    return shas
+
+class GraphQLBackend(object):
+    """Fetches users, repositories and repository branches and tags in
+    batches over GraphQL, at ``url`` (by default ``graphql`` under the
+    handle's api_base).  Each query holds objects costing at most
+    ``max_cost``, where an object costs one and each list of refs in it
+    another, much as github's query cost counts them.  Lists longer than
+    ``page_size`` are fetched in further rounds of batched queries.  The
+    GraphQL API has a rate limit of its own, kept by ``limiter``."""
+    kinds = ('user', 'repository', 'branches', 'tags')
+
+    def __init__(self, gh, url=None, max_cost=100, page_size=100, limiter=None):
+        self.gh = gh
+        self.url = url or gh.api_base + 'graphql'
+        self.max_cost = max_cost
+        self.page_size = page_size
+        self.limiter = limiter or RateLimiter()
+        self.stats = dict(queries=0, objects=0, cost=0)
+        self._lock = threading.Lock()
+
+    def handles(self, spec):
+        return (isinstance(spec, (tuple, list)) and spec and spec[0] in self.kinds
+            and len(spec) == (2 if spec[0] == 'user' else 3))
+
+    def _cost(self, specs):
+        """The cost of the aliases needed for ``specs``:  one per object,
+        plus one per list of refs."""
+        objects = set(tuple(s[1:]) for s in specs)
+        return len(objects) + sum(1 for s in specs if s[0] in ref_prefixes)
+
+    def chunks(self, specs):
+        """Split specs into batches of at most ``max_cost``, keeping the
+        specs for one repository together.  Returns lists of indexes into
+        ``specs``."""
+        groups, order = {}, []
+        for index, spec in enumerate(specs):
+            key = tuple(spec[1:])
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(index)
+        chunks, chunk, cost = [], [], 0
+        for key in order:
+            group_cost = self._cost([specs[i] for i in groups[key]])
+            if chunk and cost + group_cost > self.max_cost:
+                chunks.append(chunk)
+                chunk, cost = [], 0
+            chunk += groups[key]
+            cost += group_cost
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    # -- querying
+
+    def query(self, text):
+        """Send a GraphQL query, returning its response's ``data`` and
+        ``errors``.  Raises GraphQLError if the query as a whole failed.
+        Queries are sent like the handle's GETs, with its retry policy and
+        token pool, but paced by ``limiter``;  identical queries in flight
+        at once share one response."""
+        gh = self.gh
+        event = gh._event('POST', self.url)
+        send = lambda: gh._send(self.url, event, partial(self._post, text), self.limiter)
+        try:
+            if gh.inflight is None:
+                body = send()
+            else:
+                body, shared = gh.inflight.do(gh.cache_key(self.url) + ' ' + text, send)
+            result = gh.json_decoder(body)
+        except:
+            gh._failed(event)
+            raise
+        gh._emit('after_response', event)
+        data = result.get('data')
+        if data is None:
+            errors = result.get('errors') or [{}]
+            raise GraphQLError(errors[0].get('message', 'query failed'), errors[0].get('type'))
+        cost = data.pop('rateLimit', None)
+        with self._lock:
+            self.stats['queries'] += 1
+            if cost:
+                self.stats['cost'] += cost['cost']
+        return data, result.get('errors') or []
+
+    def _post(self, text, url, event):
+        request = self.gh.build_request(url, core.json.dumps({'query': text}))
+        request.add_header('Content-Type', 'application/json')
+        return self.gh._read(request, event, self.limiter)
+
+    def fetch(self, specs):
+        """Fetch one batch of specs, returning a FetchResult for each."""
+        specs = [tuple(s) for s in specs]
+        objects = []
+        for spec in specs:
+            if tuple(spec[1:]) not in objects:
+                objects.append(tuple(spec[1:]))
+        lines = []
+        for i, key in enumerate(objects):
+            kinds = [s[0] for s in specs if tuple(s[1:]) == key]
+            if len(key) == 1:
+                lines.append('o%d: user(login: %s) { %s }' % (i, _quote(key[0]), user_fields))
+                continue
+            fields = [repository_fields] if 'repository' in kinds else ['name']
+            fields += [_refs(kind, self.page_size) for kind in ('branches', 'tags') if kind in kinds]
+            lines.append('o%d: repository(owner: %s, name: %s) { %s }' % (
+                i, _quote(key[0]), _quote(key[1]), ' '.join(fields)))
+        lines.append('rateLimit { cost remaining resetAt }')
+        data, errors = self.query('query {\n%s\n}' % '\n'.join(lines))
+        with self._lock:
+            self.stats['objects'] += len(objects)
+        failures = dict((error.get('path', [None])[0], error) for error in errors)
+        found = dict((key, data.get('o%d' % i)) for i, key in enumerate(objects))
+        incomplete = self._more_refs(found)
+        results = []
+        for spec in specs:
+            key = tuple(spec[1:])
+            obj = found[key]
+            if (key, spec[0]) in incomplete:
+                results.append(core.FetchResult(spec, None, incomplete[key, spec[0]]))
+            elif obj is None:
+                error = failures.get('o%d' % objects.index(key), {})
+                results.append(core.FetchResult(spec, None, GraphQLError(
+                    error.get('message', 'Could not resolve %s' % '/'.join(key)),
+                    error.get('type', 'NOT_FOUND'))))
+            else:
+                results.append(core.FetchResult(spec, self._shape(spec[0], obj), None))
+        return results
+
+    def _more_refs(self, found):
+        """Page through any lists of refs longer than page_size, batching
+        the next page of every such list into one query per round.  Returns
+        a GraphQLError for each (key, kind) whose list couldn't be finished,
+        rather than passing off what was read as the whole list."""
+        incomplete = {}
+        while True:
+            wanted = [(key, kind) for key, obj in found.items() if obj
+                for kind in ref_prefixes if obj.get(kind, {}).get('pageInfo', {}).get('hasNextPage')
+                and (key, kind) not in incomplete]
+            if not wanted:
+                return incomplete
+            lines = ['p%d: repository(owner: %s, name: %s) { %s }' % (i, _quote(key[0]),
+                _quote(key[1]), _refs(kind, self.page_size, found[key][kind]['pageInfo']['endCursor']))
+                for i, (key, kind) in enumerate(wanted)]
+            data, errors = self.query('query {\n%s\n}' % '\n'.join(lines))
+            failures = dict((error.get('path', [None])[0], error) for error in errors)
+            for i, (key, kind) in enumerate(wanted):
+                page = (data.get('p%d' % i) or {}).get(kind)
+                connection = found[key][kind]
+                if page is None:
+                    error = failures.get('p%d' % i, {})
+                    incomplete[key, kind] = GraphQLError(error.get('message',
+                        'Could not read the rest of the %s of %s' % (kind, '/'.join(key))),
+                        error.get('type'))
+                    continue
+                connection['nodes'] += page['nodes']
+                connection['pageInfo'] = page['pageInfo']
+
+    def _shape(self, kind, obj):
+        models = self.gh.models
+        if kind == 'user':
+            return decode(UserInfo, _user(obj), models)
+        if kind == 'repository':
+            return decode(RepoInfo, {'repository': _repository(obj)}, models)
+        return _ref_shas(obj[kind])
+
+    def fetch_many(self, specs, concurrency=8, stream=False):
+        """Like Github.fetch_many, but with the specs this backend handles
+        fetched in batches;  the batches and the other specs are run
+        ``concurrency`` at a time."""
+        specs = list(specs)
+        batched = [i for i, spec in enumerate(specs) if self.handles(spec)]
+        # each job, and the indexes of the specs it fetches
+        jobs, positions = [], []
+        for i, spec in enumerate(specs):
+            if not self.handles(spec):
+                jobs.append(partial(self.gh._fetch_one, spec))
+                positions.append([i])
+        singles = len(jobs)
+        for chunk in self.chunks([specs[i] for i in batched]):
+            indexes = [batched[i] for i in chunk]
+            jobs.append(partial(self.fetch, [specs[i] for i in indexes]))
+            positions.append(indexes)
+        job_numbers = dict((id(job), n) for n, job in enumerate(jobs))
+        def expand(result):
+            n = job_numbers[id(result.spec)]
+            if n < singles:
+                return [core.FetchResult(specs[positions[n][0]], result.value, result.error)]
+            if result.error is not None:
+                return [core.FetchResult(specs[i], None, result.error) for i in positions[n]]
+            return [core.FetchResult(specs[i], r.value, r.error)
+                for i, r in zip(positions[n], result.value)]
+        if stream:
+            def results():
+                for result in self.gh._fetch_many(jobs, concurrency, True):
+                    for expanded in expand(result):
+                        yield expanded
+            return results()
+        ordered = [None] * len(specs)
+        for n, result in enumerate(self.gh._fetch_many(jobs, concurrency)):
+            for i, expanded in zip(positions[n], expand(result)):
+                ordered[i] = expanded
+        return ordered
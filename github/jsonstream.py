@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Json decoding.  ``find_decoder`` picks the fastest ``loads`` installed,
+and ArrayParser splits a json array into its items as the text arrives, so
+a page of results can be handed out item by item while the rest of it is
+still being read, without holding the whole body or its decoded list."""
+
+import re
+
+__all__ = ["find_decoder", "ArrayParser"]
+
+def find_decoder():
+    """The fastest json ``loads`` available:  ujson's, then simplejson's if
+    its C speedups are built, then the standard library's."""
+    try:
+        import ujson
+        return ujson.loads
+    except ImportError:
+        pass
+    try:
+        import simplejson
+        from simplejson import _speedups
+        return simplejson.loads
+    except ImportError:
+        pass
+    import json
+    return json.loads
+
+# a whole string literal (group 1 is missing if it is cut off by the end of
+# the text so far), or a character which delimits items
+_token_re = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[\[\]{},]', re.S)
+
+class ArrayParser(object):
+    """Incrementally parses a json array.  Text is passed to ``feed`` as it
+    arrives, which returns the items completed by it, decoded with ``loads``
+    (in one call per feed, which is much faster than one per item).  Only the
+    text of the item in progress is kept.  If the document turns out not to
+    be an array, it is decoded whole by ``close`` and, if it is a list after
+    all, its items returned."""
+    def __init__(self, loads):
+        self.loads = loads
+        self.buf = ''
+        self.pos = 0
+        self.start = None
+        self.depth = 0
+        self.is_array = None
+        self.finished = False
+
+    def feed(self, text):
+        if self.finished:
+            return []
+        self.buf += text
+        if self.is_array is None:
+            stripped = self.buf.lstrip()
+            if not stripped:
+                return []
+            self.is_array = stripped[0] == '['
+        if not self.is_array:
+            return []
+        items = self._decode(self._scan())
+        # drop the text of items already handed out
+        cut = self.start if self.start is not None else self.pos
+        if cut:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            if self.start is not None:
+                self.start -= cut
+        return items
+
+    def _scan(self):
+        items = []
+        buf, depth = self.buf, self.depth
+        pos = len(buf)
+        for match in _token_re.finditer(buf, self.pos):
+            char = buf[match.start()]
+            if char == '"':
+                if match.group(1) is None:
+                    # rescan the string once more of it has arrived
+                    pos = match.start()
+                    break
+            elif char == ',':
+                if depth == 1:
+                    self._item(buf[self.start:match.start()], items)
+                    self.start = match.end()
+            elif char in '[{':
+                depth += 1
+                if depth == 1:
+                    self.start = match.end()
+            else:
+                depth -= 1
+                if depth == 0:
+                    self._item(buf[self.start:match.start()], items)
+                    self.start = None
+                    self.finished = True
+                    pos = match.end()
+                    break
+        self.pos, self.depth = pos, depth
+        return items
+
+    def _item(self, text, items):
+        text = text.strip()
+        if text:
+            items.append(text)
+
+    def _decode(self, texts):
+        if not texts:
+            return []
+        return self.loads('[%s]' % ','.join(texts))
+
+    def close(self):
+        """Finish parsing, returning any items left.  Raises ValueError if
+        the text ended part way through an array."""
+        if self.is_array is False:
+            document = self.loads(self.buf)
+            self.buf = ''
+            return document if isinstance(document, list) else []
+        if self.is_array and not self.finished:
+            raise ValueError("json array ended after %d bytes of an item" % len(self.buf))
+        return []
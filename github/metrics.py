@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Request instrumentation.  A Github handle emits a RequestEvent to any
+hooks registered for these events:
+
+    ``before_request``  before a request is throttled and sent
+    ``throttle``        when the rate limiter is about to sleep
+    ``retry``           before a failed request is retried
+    ``after_response``  once a response has been read (and decoded)
+    ``error``           when a request fails
+
+Metrics is a hook that aggregates events per endpoint, with a histogram of
+the time spent in each phase of a request::
+
+    >>> metrics = Metrics().install(gh)
+    >>> gh.user('jmoiron').repositories()
+    >>> metrics.snapshot()['endpoints']['users/:user/repos']['requests']
+    1
+"""
+
+import re
+import time
+import json
+import threading
+from bisect import bisect_left
+
+__all__ = ["hook_events", "RequestEvent", "Histogram", "Metrics", "url_template"]
+
+hook_events = ('before_request', 'throttle', 'retry', 'after_response', 'error')
+
+# templates for the urls the client requests, relative to api_base or
+# gist_base;  urls matching none of them have numeric path segments replaced
+templates = [
+    'organizations',
+    'user/emails', 'user/keys', 'user/key/add', 'user/key/remove',
+    'user/follow/:user', 'user/unfollow/:user',
+    'user/show/:user', 'user/show/:user/following', 'user/show/:user/followers',
+    'users/:user/repos', 'users/:user/watched', 'users/:user/events',
+    'orgs/:org/events', 'repos/:user/:repo/events',
+    'repos/show/:user/:repo', 'repos/show/:user/:repo/tags',
+    'repos/show/:user/:repo/branches', 'repos/show/:user/:repo/followers',
+    'repos/:user/:repo/commits', 'repos/:user/:repo/commits/:sha',
+    'issues/list/:user/:repo/:state', 'issues/show/:user/:repo/:number',
+    'gists/:user', 'raw/:gist/:filename',
+]
+
+def _compile(template):
+    pattern = re.sub(r':\w+', '[^/]+', re.escape(template).replace('\\:', ':'))
+    return re.compile(pattern + '/?$')
+
+_templates = [(_compile(t), t) for t in templates]
+_number_re = re.compile(r'(?<=/)\d+(?=/|$)')
+
+def url_template(path):
+    """The template for a url path, eg. ``users/:user/repos`` for
+    ``users/jmoiron/repos?page=2``, so that requests can be grouped by
+    endpoint."""
+    path = path.split('?', 1)[0].strip('/')
+    for pattern, template in _templates:
+        if pattern.match(path):
+            return template
+    return _number_re.sub(':id', '/' + path)[1:]
+
+class RequestEvent(object):
+    """What is known about one request.  ``timings`` holds the seconds spent
+    in each phase so far:  ``throttle`` waiting on the rate limiter,
+    ``wait`` for the response headers, ``transfer`` reading the body and
+    ``decode`` parsing it.  ``cache`` is None when no response cache is in
+    use, otherwise ``miss``, ``revalidated`` (a cached response was replaced)
+    or ``hit`` (the server said it was not modified).  ``coalesced`` is set
+    when the response was shared with an identical request already in
+    flight, in which case ``wait`` is the time spent waiting for it.
+    ``retries`` counts the times the request was retried."""
+    __slots__ = ('method', 'url', 'template', 'status', 'bytes', 'wire_bytes',
+        'cache', 'rate_remaining', 'timings', 'delay', 'error', 'coalesced',
+        'retries', 'start')
+
+    def __init__(self, method, url, template=None):
+        self.method = method
+        self.url = url
+        self.template = template
+        self.status = None
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.cache = None
+        self.rate_remaining = None
+        self.timings = {}
+        self.delay = 0
+        self.error = None
+        self.coalesced = False
+        self.retries = 0
+        self.start = time.time()
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def __repr__(self):
+        return '<RequestEvent %s %s %s>' % (self.method, self.template, self.status)
+
+class Histogram(object):
+    """Counts observations into exponentially sized buckets, from ``base``
+    upwards in powers of two, so that recording a value is a bisect and
+    percentiles are accurate to within a factor of two."""
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self, base=0.001, buckets=20):
+        self.bounds = [base * 2 ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """The upper bound of the bucket holding the ``p``th percentile,
+        clamped to the largest value seen."""
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': self.total, 'min': self.min,
+            'max': self.max, 'p50': self.percentile(50), 'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': [(bound, count) for bound, count in
+                zip(self.bounds + ['+inf'], self.counts) if count]}
+
+class EndpointStats(object):
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.coalesced = 0
+        self.retries = 0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.statuses = {}
+        self.cache = {}
+        self.timings = {}
+
+    def to_dict(self):
+        return {'requests': self.requests, 'errors': self.errors,
+            'coalesced': self.coalesced, 'retries': self.retries,
+            'bytes': self.bytes, 'wire_bytes': self.wire_bytes,
+            'statuses': dict(self.statuses), 'cache': dict(self.cache),
+            'timings': dict((phase, hist.to_dict()) for phase, hist in self.timings.items())}
+
+class Metrics(object):
+    """Aggregates the events of one or more Github handles per endpoint
+    template:  counts of requests, errors, retries, statuses and cache
+    results, bytes received, and a Histogram per request phase plus
+    ``total``.  Recording an event takes a lock and a few dict updates."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def install(self, gh):
+        """Register with a Github handle, returning self."""
+        gh.add_hook('after_response', self.after_response)
+        gh.add_hook('error', self.error)
+        gh.add_hook('throttle', self.throttle)
+        gh.add_hook('retry', self.retry)
+        return self
+
+    def uninstall(self, gh):
+        gh.remove_hook('after_response', self.after_response)
+        gh.remove_hook('error', self.error)
+        gh.remove_hook('throttle', self.throttle)
+        gh.remove_hook('retry', self.retry)
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.endpoints = {}
+        self.throttled = Histogram()
+        self.rate_remaining = None
+        self.started = time.time()
+
+    def _stats(self, template):
+        stats = self.endpoints.get(template)
+        if stats is None:
+            stats = self.endpoints[template] = EndpointStats()
+        return stats
+
+    def _record(self, event):
+        stats = self._stats(event.template)
+        stats.requests += 1
+        stats.coalesced += event.coalesced
+        stats.bytes += event.bytes
+        stats.wire_bytes += event.wire_bytes
+        if event.status is not None:
+            stats.statuses[event.status] = stats.statuses.get(event.status, 0) + 1
+        if event.cache is not None:
+            stats.cache[event.cache] = stats.cache.get(event.cache, 0) + 1
+        timings = dict(event.timings, total=event.elapsed())
+        for phase, value in timings.iteritems():
+            hist = stats.timings.get(phase)
+            if hist is None:
+                hist = stats.timings[phase] = Histogram()
+            hist.observe(value)
+        if event.rate_remaining is not None:
+            self.rate_remaining = event.rate_remaining
+        return stats
+
+    def after_response(self, event):
+        with self._lock:
+            self._record(event)
+
+    def error(self, event):
+        with self._lock:
+            self._record(event).errors += 1
+
+    def throttle(self, event):
+        with self._lock:
+            self.throttled.observe(event.delay)
+
+    def retry(self, event):
+        with self._lock:
+            self._stats(event.template).retries += 1
+
+    def snapshot(self, reset=False):
+        """The aggregates so far as a json-friendly dict, optionally starting
+        afresh."""
+        with self._lock:
+            snapshot = {'since': self.started, 'time': time.time(),
+                'rate_remaining': self.rate_remaining,
+                'throttled': self.throttled.to_dict(),
+                'endpoints': dict((template, stats.to_dict())
+                    for template, stats in self.endpoints.items())}
+            if reset:
+                self._reset()
+        return snapshot
+
+    def dump(self, fileobj, reset=False):
+        """Write a snapshot to ``fileobj`` as json."""
+        json.dump(self.snapshot(reset), fileobj, indent=2, sort_keys=True)
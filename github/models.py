@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compact, optional result models.  By default every API method returns the
+dicts json gives back;  with ``Github(models=True)``, users, repositories
+and commits are returned as instances of the classes here instead.  They
+keep the fields github sends in ``__slots__`` rather than a dict per object,
+and only decode nested objects and timestamps when they are first accessed.
+Dict-style access still returns the raw values from the payload, except that
+nested objects are compact Records rather than dicts, and ascii strings are
+stored as ``str`` rather than ``unicode``."""
+
+import core
+
+__all__ = ["Model", "UserInfo", "RepoInfo", "Signature", "GitCommit", "Commit",
+    "decode"]
+
+_key_tuples = {}
+
+def _key(key):
+    """Intern a payload key."""
+    try:
+        return intern(str(key))
+    except UnicodeEncodeError:
+        return key
+
+def _keys(keys):
+    """Intern a tuple of keys, so that objects whose payloads have the same
+    undeclared fields share one tuple of their names."""
+    keys = tuple(keys)
+    return _key_tuples.setdefault(keys, tuple(_key(k) for k in keys))
+
+def _compact(value):
+    """Shrink a decoded json value:  dicts become Records, and ascii unicode
+    strings become (four times smaller) str, interned if short enough that
+    they are likely to repeat, like logins and emails."""
+    if isinstance(value, unicode):
+        try:
+            value = str(value)
+        except UnicodeEncodeError:
+            return value
+        return intern(value) if len(value) <= 32 else value
+    if isinstance(value, dict):
+        return Record(value)
+    if isinstance(value, list):
+        return [_compact(v) for v in value]
+    return value
+
+def _to_datetime(value):
+    return core.to_datetime(value)
+
+missing = object()
+
+class Field(object):
+    """Descriptor for a field, whose value lives in the slot ``_<name>``.
+    Fields missing from the payload read as None."""
+    def __init__(self, name):
+        self.name = name
+        self.raw = '_' + name
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = getattr(obj, self.raw)
+        return None if value is missing else value
+
+class Lazy(Field):
+    """Descriptor for a field which is converted on first access.  The
+    converted value is kept in the slot ``_c_<name>``."""
+    def __init__(self, name, convert):
+        Field.__init__(self, name)
+        self.cooked = '_c_' + name
+        self.convert = convert
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.cooked)
+        except AttributeError:
+            value = Field.__get__(self, obj, cls)
+            if value is not None:
+                value = self.convert(value)
+            setattr(obj, self.cooked, value)
+            return value
+
+class ModelType(type):
+    """Builds ``__slots__`` from a model's ``fields``, ``dates`` and
+    ``nested`` declarations, and a descriptor for each field."""
+    def __new__(mcs, name, bases, attrs):
+        fields = tuple(attrs.get('fields', ()))
+        dates = tuple(attrs.get('dates', ()))
+        nested = dict(attrs.get('nested', {}))
+        slots = list(attrs.get('__slots__', ()))
+        for field in fields:
+            slots.append('_' + field)
+            attrs[field] = Field(field)
+        for field in dates:
+            slots += ['_' + field, '_c_' + field]
+            attrs[field] = Lazy(field, _to_datetime)
+        for field, model in nested.items():
+            slots += ['_' + field, '_c_' + field]
+            attrs[field] = Lazy(field, model.decode)
+        attrs['__slots__'] = tuple(slots)
+        attrs['_raw_slots'] = tuple((_key(f), '_' + f) for f in fields + dates + tuple(nested))
+        attrs['_raw_keys'] = frozenset(key for key, slot in attrs['_raw_slots'])
+        return type.__new__(mcs, name, bases, attrs)
+
+class Model(object):
+    """Base class for result models.  Fields the model doesn't declare are
+    kept as a tuple of their names, shared between objects with the same
+    fields, and a tuple of their values."""
+    __metaclass__ = ModelType
+    __slots__ = ('_keys', '_values')
+    fields = ()
+    dates = ()
+    nested = {}
+
+    def __init__(self, payload):
+        for key, slot in self._raw_slots:
+            value = payload.get(key, missing)
+            setattr(self, slot, value if value is missing else _compact(value))
+        known = self._raw_keys
+        extra = [(k, v) for k,v in payload.iteritems() if k not in known]
+        self._keys = _keys(k for k,v in extra)
+        self._values = tuple(_compact(v) for k,v in extra)
+
+    @classmethod
+    def decode(cls, data):
+        """Wrap a payload, or a list of payloads, in this model."""
+        if isinstance(data, (dict, Model)):
+            return cls(data)
+        if isinstance(data, list):
+            return [cls(d) if isinstance(d, (dict, Model)) else d for d in data]
+        return data
+
+    def __getitem__(self, key):
+        for name, slot in self._raw_slots:
+            if name == key:
+                value = getattr(self, slot)
+                if value is missing:
+                    break
+                return value
+        else:
+            if key in self._keys:
+                return self._values[self._keys.index(key)]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def keys(self):
+        return [name for name, slot in self._raw_slots
+            if getattr(self, slot) is not missing] + list(self._keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def to_dict(self):
+        """The raw payload as a dict, with nested Records as dicts too."""
+        def convert(value):
+            if isinstance(value, Model):
+                return value.to_dict()
+            if isinstance(value, list):
+                return [convert(v) for v in value]
+            return value
+        return dict((key, convert(value)) for key, value in self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, Model):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.get(self.fields[0]) if self.fields else '')
+
+class Record(Model):
+    """A nested object in a payload, with no declared fields."""
+    def __repr__(self):
+        return '<Record %r>' % self.to_dict()
+
+class UserInfo(Model):
+    fields = ('login', 'id', 'name', 'email', 'company', 'blog', 'location',
+        'bio', 'type', 'url', 'html_url', 'avatar_url', 'public_repos',
+        'followers', 'following')
+    dates = ('created_at',)
+
+class RepoInfo(Model):
+    fields = ('name', 'id', 'full_name', 'description', 'private', 'fork',
+        'url', 'html_url', 'homepage', 'language', 'size', 'forks',
+        'watchers', 'open_issues', 'master_branch')
+    dates = ('created_at', 'updated_at', 'pushed_at')
+    nested = {'owner': UserInfo}
+
+class Signature(Model):
+    fields = ('name', 'email')
+    dates = ('date',)
+
+class GitCommit(Model):
+    fields = ('message', 'url', 'tree')
+    nested = {'author': Signature, 'committer': Signature}
+
+class Commit(Model):
+    fields = ('sha', 'id', 'url', 'message', 'parents', 'tree')
+    dates = ('authored_date', 'committed_date')
+    nested = {'commit': GitCommit, 'author': UserInfo, 'committer': UserInfo}
+
+def decode(model, data, enabled=True):
+    """Wrap data in ``model`` if ``enabled``, otherwise return it as is.
+    Empty data, such as the ``{}`` a failed request returns, is never
+    wrapped, so that it stays falsy."""
+    return model.decode(data) if enabled and data else data
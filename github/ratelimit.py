@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Request scheduling against github's rate limits.  Github reports the
+budget left for the current window in the ``X-RateLimit-Remaining`` and
+``X-RateLimit-Reset`` headers of every response;  the RateLimiter reads them
+and paces requests so that what remains is spread evenly up to the reset."""
+
+import time
+import threading
+import multiprocessing
+
+__all__ = ["RateLimiter", "SharedRateLimiter"]
+
+class RateLimiter(object):
+    """A thread-safe token bucket.  Until github has reported a budget, it
+    allows ``limit`` requests per ``period`` seconds.  Once headers have been
+    seen, tokens refill at remaining/(reset - now) per second, and up to
+    ``burst`` requests may be made back to back.  When the budget is spent,
+    callers are queued past the reset, drawing on the next window's default
+    budget so that they don't all go at once."""
+    def __init__(self, limit=60, period=60, burst=60):
+        self.limit = limit
+        self.period = period
+        self.burst = burst
+        self.remaining = None
+        self.reset = None
+        self.queued = 0
+        self._lock = threading.Lock()
+        self._restore()
+
+    def _restore(self):
+        """Go back to the default budget, less what was queued against it
+        while the last window's was spent.  Must hold the lock."""
+        now = time.time()
+        self.last = min(self.reset or now, now)
+        self.remaining = None
+        self.reset = None
+        self.rate = float(self.limit) / self.period
+        self.capacity = float(min(self.burst, self.limit))
+        self.tokens = self.capacity - self.queued
+        self.queued = 0
+
+    def update(self, headers):
+        """Update the budget from a response's (lowercased) headers."""
+        try:
+            remaining = int(headers['x-ratelimit-remaining'])
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, ValueError):
+            return
+        with self._lock:
+            now = time.time()
+            new_window = reset != self.reset
+            self.remaining = remaining
+            self.reset = reset
+            self.rate = remaining / max(reset - now, 1.0)
+            self.capacity = float(max(1, min(self.burst, remaining)))
+            if new_window:
+                # github's figures for the new window are taken as they are
+                self.tokens = self.capacity
+                self.queued = 0
+            self.tokens = min(self.tokens, self.capacity)
+
+    def reserve(self):
+        """Reserve a slot for one request, returning how many seconds the
+        caller must wait before making it."""
+        with self._lock:
+            now = time.time()
+            if self.reset is not None and now >= self.reset:
+                self._restore()
+            if self.remaining is not None:
+                if self.remaining <= 0:
+                    # queue behind those already waiting for the reset
+                    self.queued += 1
+                    excess = self.queued - min(self.burst, self.limit)
+                    return self.reset - now + max(0, excess) * float(self.period) / self.limit
+                self.remaining -= 1
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def try_reserve(self):
+        """Reserve a slot for one request only if it may be made at once;
+        returns whether one was reserved."""
+        with self._lock:
+            now = time.time()
+            if self.reset is not None and now >= self.reset:
+                self._restore()
+            if self.remaining is not None and self.remaining <= 0:
+                return False
+            tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            if tokens < 1:
+                return False
+            if self.remaining is not None:
+                self.remaining -= 1
+            self.tokens, self.last = tokens - 1, now
+            return True
+
+    def wait(self):
+        """Block until a request may be made.  Returns the time slept."""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return max(delay, 0)
+
+def _shared(index, optional=False, type=float):
+    """A property stored in slot ``index`` of a SharedRateLimiter's shared
+    array;  optional values are None while negative."""
+    def get(self):
+        value = self._state[index]
+        if optional and value < 0:
+            return None
+        return type(value)
+    def set(self, value):
+        self._state[index] = -1 if value is None else value
+    return property(get, set)
+
+class SharedRateLimiter(RateLimiter):
+    """A RateLimiter whose state lives in shared memory, so that the worker
+    processes of a multiprocessing pool draw on one budget.  It must be
+    handed to the workers when they are created, eg. in a Pool's
+    ``initargs``, rather than sent to them later."""
+    remaining = _shared(0, True, int)
+    reset = _shared(1, True)
+    rate = _shared(2)
+    capacity = _shared(3)
+    tokens = _shared(4)
+    last = _shared(5)
+    queued = _shared(6, type=int)
+
+    def __init__(self, limit=60, period=60, burst=60):
+        self._state = multiprocessing.Array('d', 7, lock=False)
+        RateLimiter.__init__(self, limit, period, burst)
+        self._lock = multiprocessing.Lock()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Retrying transient failures.  A 502 or a secondary rate limit response
+part way through a long crawl shouldn't cut it short, so a Github handle
+retries GETs which fail in ways that are likely to pass:  server errors,
+dropped connections and responses asking the client to back off.  Retries
+wait an exponentially growing, jittered delay, or as long as ``Retry-After``
+says, and each endpoint has a budget of retries which grows with the
+requests made to it, so a failing endpoint can't multiply the traffic sent
+to it.  Optionally, a GET which is slower than most to answer is sent a
+second time, and whichever copy answers first is used."""
+
+import time
+import socket
+import random
+import httplib
+import threading
+from email.utils import parsedate_tz, mktime_tz
+
+from transport import HTTPError
+from metrics import Histogram
+
+__all__ = ["RetryBudget", "RetryPolicy"]
+
+class RetryBudget(object):
+    """Retries allowed for one endpoint:  it starts with ``minimum``, and
+    every request adds ``ratio`` of a retry, up to ``minimum`` plus
+    ``ratio`` of the last ``window`` requests."""
+    def __init__(self, ratio=0.2, minimum=10, window=100):
+        self.ratio = ratio
+        self.cap = minimum + ratio * window
+        self.balance = float(minimum)
+
+    def deposit(self):
+        self.balance = min(self.cap, self.balance + self.ratio)
+
+    def withdraw(self):
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+class RetryPolicy(object):
+    """When and how long to wait before retrying a request.  A request is
+    tried up to ``retries`` more times, waiting ``backoff`` seconds doubled
+    on each attempt, up to ``max_backoff``, and then picked uniformly at
+    random from zero up to that (unless ``jitter`` is off) so that clients
+    failing together don't retry together.  A Retry-After header is waited
+    for instead, but no longer than ``max_retry_after`` seconds.  Retries
+    and hedges are drawn from a RetryBudget per endpoint.
+
+    With ``hedge``, a GET still waiting for its response headers after the
+    endpoint's ``hedge_percentile`` latency, once ``hedge_samples``
+    responses have been timed, is sent again, as long as the rate limit has
+    more than ``hedge_reserve`` requests left."""
+    retry_statuses = (500, 502, 503, 504)
+    # sent for github's secondary rate limits, with Retry-After
+    backoff_statuses = (403, 429)
+    errors = (socket.error, httplib.HTTPException)
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30, jitter=True,
+            budget_ratio=0.2, budget_minimum=10, hedge=False, hedge_percentile=95,
+            hedge_samples=20, hedge_reserve=100, max_retry_after=60):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.jitter = jitter
+        self.budget_ratio = budget_ratio
+        self.budget_minimum = budget_minimum
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_samples = hedge_samples
+        self.hedge_reserve = hedge_reserve
+        self.budgets = {}
+        self.latencies = {}
+        self.stats = dict(retries=0, hedges=0, hedge_wins=0, exhausted=0)
+        self._lock = threading.Lock()
+
+    def _budget(self, template):
+        budget = self.budgets.get(template)
+        if budget is None:
+            budget = self.budgets[template] = RetryBudget(self.budget_ratio,
+                self.budget_minimum)
+        return budget
+
+    def _count(self, name):
+        self.stats[name] += 1
+
+    def requested(self, template):
+        """Note a request to an endpoint, adding to its retry budget."""
+        with self._lock:
+            self._budget(template).deposit()
+
+    def retryable(self, error):
+        """Whether a request which failed with ``error`` is worth retrying."""
+        if isinstance(error, HTTPError):
+            if error.code in self.retry_statuses:
+                return True
+            if error.code in self.backoff_statuses:
+                response = error.response
+                return (response.getheader('retry-after') is not None or
+                    'secondary rate limit' in (response.body or '').lower())
+            return False
+        return isinstance(error, self.errors)
+
+    def should_retry(self, template, error, attempt):
+        """Whether to make retry number ``attempt + 1`` of a request which
+        failed with ``error``;  takes a retry from the endpoint's budget."""
+        if attempt >= self.retries or not self.retryable(error):
+            return False
+        with self._lock:
+            if not self._budget(template).withdraw():
+                self._count('exhausted')
+                return False
+            self._count('retries')
+        return True
+
+    def delay(self, attempt, error=None):
+        """Seconds to wait before retry number ``attempt + 1``."""
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_retry_after)
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def retry_after(self, error):
+        """The seconds a response's Retry-After header asks for, or None."""
+        response = getattr(error, 'response', None)
+        value = response.getheader('retry-after') if response is not None else None
+        if value is None:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0, mktime_tz(parsed) - time.time())
+
+    # -- hedging
+
+    def observe(self, template, seconds):
+        """Record how long an endpoint took to start answering."""
+        with self._lock:
+            histogram = self.latencies.get(template)
+            if histogram is None:
+                histogram = self.latencies[template] = Histogram()
+            histogram.observe(seconds)
+
+    def hedge_after(self, template):
+        """Seconds after which a GET to an endpoint should be hedged, or
+        None if hedging is off or the endpoint hasn't been timed enough."""
+        if not self.hedge:
+            return None
+        histogram = self.latencies.get(template)
+        if histogram is None or histogram.count < self.hedge_samples:
+            return None
+        return histogram.percentile(self.hedge_percentile)
+
+    def allow_hedge(self, template, limiter, reserve=True):
+        """Whether a hedge may be sent:  the rate limit must have plenty
+        left, and the hedge is taken from the endpoint's retry budget.  With
+        ``reserve``, it also takes a slot from ``limiter``, and isn't sent
+        unless one is free at once."""
+        if limiter.remaining is not None and limiter.remaining <= self.hedge_reserve:
+            return False
+        with self._lock:
+            budget = self._budget(template)
+            if budget.balance < 1 or (reserve and not limiter.try_reserve()):
+                return False
+            budget.withdraw()
+            self._count('hedges')
+        return True
+
+    def hedge_won(self):
+        with self._lock:
+            self._count('hedge_wins')
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""A local SQLite mirror of repositories, commits and issues.  Pass a Store
+to ``Github(store=...)`` and every page of repositories, commits or issues
+the handle fetches is upserted into it;  questions like "which repositories
+had commits by alice last week" can then be answered from the indexed
+tables without touching the network.  The ``refresh_*`` methods bring a
+user's or repository's rows up to date, but only once they are older than
+``max_age`` seconds."""
+
+import time
+import json
+import sqlite3
+import calendar
+import threading
+from functools import partial
+
+import core
+
+__all__ = ["Store"]
+
+schema = """
+create table if not exists repositories (
+    owner text not null,
+    name text not null,
+    language text,
+    pushed_at real,
+    data text not null,
+    fetched_at real not null,
+    primary key (owner, name)
+);
+create table if not exists commits (
+    owner text not null,
+    repo text not null,
+    sha text not null,
+    author text,
+    author_name text,
+    author_email text,
+    date real,
+    data text not null,
+    fetched_at real not null,
+    primary key (owner, repo, sha)
+);
+create index if not exists commits_date on commits (owner, repo, date);
+create index if not exists commits_author on commits (author, date);
+create index if not exists commits_author_email on commits (author_email, date);
+create table if not exists issues (
+    owner text not null,
+    repo text not null,
+    number integer not null,
+    state text,
+    user text,
+    title text,
+    created_at real,
+    updated_at real,
+    data text not null,
+    fetched_at real not null,
+    primary key (owner, repo, number)
+);
+create index if not exists issues_state on issues (owner, repo, state);
+create index if not exists issues_user on issues (user, updated_at);
+create table if not exists refreshes (
+    kind text not null,
+    owner text not null,
+    repo text not null,
+    fetched_at real not null,
+    cursor_sha text,
+    cursor_date text,
+    primary key (kind, owner, repo)
+);
+"""
+
+def _payload(obj):
+    return obj.to_dict() if hasattr(obj, 'to_dict') else obj
+
+def _timestamp(value):
+    """Seconds since the epoch for a github timestamp, datetime or number."""
+    if value is None or isinstance(value, (int, long, float)):
+        return value
+    if isinstance(value, basestring):
+        value = core.to_datetime(value)
+    if value.tzinfo is not None:
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+    return calendar.timegm(value.timetuple()) + value.microsecond / 1e6
+
+def _login(user):
+    if isinstance(user, dict):
+        return user.get('login')
+    return user
+
+def _commit_row(owner, repo, commit, now):
+    commit = _payload(commit)
+    if 'commit' in commit:
+        signature = commit['commit'].get('author') or {}
+        author = _login(commit.get('author')) or signature.get('name')
+        name, email, date = signature.get('name'), signature.get('email'), signature.get('date')
+    else:
+        signature = commit.get('author') or {}
+        author = signature.get('login') or signature.get('name')
+        name, email, date = signature.get('name'), signature.get('email'), commit.get('authored_date')
+    return (owner, repo, commit.get('sha') or commit.get('id'), author, name, email,
+        _timestamp(date), json.dumps(commit), now)
+
+def _repository_row(owner, repo, now):
+    repo = _payload(repo)
+    owner = _login(repo.get('owner')) or owner
+    return (owner, repo['name'], repo.get('language'), _timestamp(repo.get('pushed_at')),
+        json.dumps(repo), now)
+
+def _issue_row(owner, repo, issue, now):
+    issue = _payload(issue)
+    return (owner, repo, issue['number'], issue.get('state'), _login(issue.get('user')),
+        issue.get('title'), _timestamp(issue.get('created_at')),
+        _timestamp(issue.get('updated_at')), json.dumps(issue), now)
+
+class Store(object):
+    """A SQLite database at ``path`` (in memory by default) holding the
+    repositories, commits and issues that have been fetched.  Safe to share
+    between threads.  Query methods return the stored payloads as dicts."""
+    def __init__(self, path=':memory:', max_age=3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def _write(self, sql, rows):
+        with self._lock:
+            with self.db:
+                self.db.executemany(sql, rows)
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self.db.execute(sql, args).fetchall()
+
+    # -- upserts
+
+    def put_repositories(self, owner, repositories):
+        now = time.time()
+        self._write('insert or replace into repositories values (?,?,?,?,?,?)',
+            [_repository_row(owner, r, now) for r in repositories])
+
+    def put_commits(self, owner, repo, commits):
+        now = time.time()
+        self._write('insert or replace into commits values (?,?,?,?,?,?,?,?,?)',
+            [_commit_row(owner, repo, c, now) for c in commits])
+
+    def put_issues(self, owner, repo, issues):
+        now = time.time()
+        self._write('insert or replace into issues values (?,?,?,?,?,?,?,?,?,?)',
+            [_issue_row(owner, repo, i, now) for i in issues])
+
+    # -- queries
+
+    def _select(self, table, filters, order, limit=None):
+        clauses, args = [], []
+        for clause, value in filters:
+            if value is not None:
+                clauses.append(clause)
+                args.extend([value] * clause.count('?'))
+        sql = 'select data from %s' % table
+        if clauses:
+            sql += ' where ' + ' and '.join(clauses)
+        sql += ' order by ' + order
+        if limit:
+            sql += ' limit %d' % limit
+        return [json.loads(data) for data, in self._query(sql, args)]
+
+    def repositories(self, owner=None, language=None):
+        return self._select('repositories', [('owner = ?', owner),
+            ('language = ?', language)], 'owner, name')
+
+    def commits(self, owner=None, repo=None, author=None, start=None, end=None,
+            limit=None):
+        """Commits, newest first.  ``author`` matches a login, name or email;
+        ``start`` and ``end`` bound the author date, and may be datetimes,
+        github timestamps or seconds since the epoch."""
+        return self._select('commits', [('owner = ?', owner), ('repo = ?', repo),
+            ('(author = ? or author_name = ? or author_email = ?)', author),
+            ('date >= ?', _timestamp(start)), ('date < ?', _timestamp(end))],
+            'date desc', limit)
+
+    def issues(self, owner=None, repo=None, state=None, user=None, start=None,
+            end=None):
+        """Issues, most recently updated first;  ``start`` and ``end`` bound
+        the update date."""
+        return self._select('issues', [('owner = ?', owner), ('repo = ?', repo),
+            ('state = ?', state), ('user = ?', user),
+            ('updated_at >= ?', _timestamp(start)), ('updated_at < ?', _timestamp(end))],
+            'updated_at desc')
+
+    def active_repositories(self, author=None, start=None, end=None):
+        """(owner, repo, commit count) for repositories with commits in a
+        date range, optionally by one author, busiest first."""
+        return self._query('select owner, repo, count(*) from commits where '
+            '(? is null or author = ? or author_name = ? or author_email = ?) and '
+            '(? is null or date >= ?) and (? is null or date < ?) '
+            'group by owner, repo order by count(*) desc',
+            [author] * 4 + [_timestamp(start)] * 2 + [_timestamp(end)] * 2)
+
+    # -- staleness
+
+    def _refreshed(self, kind, owner, repo=''):
+        rows = self._query('select fetched_at, cursor_sha, cursor_date from refreshes '
+            'where kind = ? and owner = ? and repo = ?', (kind, owner, repo))
+        return rows[0] if rows else (None, None, None)
+
+    def _mark(self, kind, owner, repo='', cursor=None):
+        sha, date = cursor or (None, None)
+        self._write('insert or replace into refreshes values (?,?,?,?,?,?)',
+            [(kind, owner, repo, time.time(), sha, date)])
+
+    def invalidate(self, kind, owner, repo=''):
+        """Mark ``kind`` for an owner or repository stale, so that the next
+        refresh fetches it whatever its age;  a sync cursor is kept."""
+        self._write('update refreshes set fetched_at = 0 where kind = ? and owner = ? '
+            'and repo = ?', [(kind, owner, repo)])
+
+    def is_stale(self, kind, owner, repo=''):
+        """Whether ``kind`` (repositories, commits or issues) for an owner
+        or repository has never been refreshed, or not for max_age seconds."""
+        fetched_at = self._refreshed(kind, owner, repo)[0]
+        return fetched_at is None or time.time() - fetched_at > self.max_age
+
+    def refresh_repositories(self, gh, owner, force=False):
+        """Fetch a user's repositories if the stored ones are stale.  Like
+        the other refreshes, a failed request raises, and leaves the rows as
+        stale as they were."""
+        if not force and not self.is_stale('repositories', owner):
+            return False
+        self.put_repositories(owner, gh._fetch_one(('repositories', owner)))
+        self._mark('repositories', owner)
+        return True
+
+    def refresh_commits(self, gh, owner, repo, force=False):
+        """Fetch the commits made to a repository since it was last
+        refreshed, if it is stale.  Returns the new commits, or None if the
+        stored ones were fresh enough."""
+        fetched_at, sha, date = self._refreshed('commits', owner, repo)
+        if not force and fetched_at and time.time() - fetched_at <= self.max_age:
+            return None
+        cursor = core.CommitCursor(sha, date) if sha else None
+        commits, cursor = gh.repository(owner, repo).sync_commits(cursor)
+        self.put_commits(owner, repo, commits)
+        self._mark('commits', owner, repo, cursor)
+        return commits
+
+    def refresh_issues(self, gh, owner, repo, force=False):
+        """Fetch a repository's open and closed issues if they are stale."""
+        if not force and not self.is_stale('issues', owner, repo):
+            return False
+        repository = gh.repository(owner, repo)
+        for open in (True, False):
+            self.put_issues(owner, repo, gh._fetch_one(partial(repository.issues, open)))
+        self._mark('issues', owner, repo)
+        return True
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""The Github API objects as a facade over a thread pool.  Every method of a
+ThreadedUser, ThreadedRepository, ThreadedGist or ThreadedIssue submits the
+(blocking) call to a shared pool of worker threads and returns a Future for
+it, over the client's single connection pool and rate limiter.  This is not
+non-blocking I/O:  at most ``workers`` calls are in flight at once, each
+holding a thread, and ``result()`` blocks."""
+
+from core import Github, last_page
+from executor import Executor, Future
+
+__all__ = ["ThreadedGithub"]
+
+class ThreadedGithub(object):
+    """A Github whose API objects run their calls on a pool of threads.
+    Takes the same arguments, plus the number of ``workers`` calls may run
+    on at once;  the connection pool is sized to match.  An existing Github
+    handle may be shared with ``gh``."""
+    def __init__(self, username='', token='', workers=32, gh=None, **kwargs):
+        kwargs.setdefault('pool_size', workers)
+        self.gh = gh or Github(username, token, **kwargs)
+        self.executor = Executor(workers)
+
+    def submit(self, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` on the worker pool, returning a
+        Future for its result."""
+        return self.executor.submit(func, *args, **kwargs)
+
+    def user(self, username=None):
+        return ThreadedUser(self, self.gh.user(username))
+
+    def repository(self, username, name):
+        return ThreadedRepository(self, self.gh.repository(username, name))
+
+    def gist(self, id):
+        return ThreadedGist(self, self.gh.gist(id))
+
+    def organizations(self):
+        return self.submit(self.gh.organizations)
+
+    def close(self):
+        self.executor.shutdown()
+        self.gh.close()
+
+    def __repr__(self):
+        return '<Threaded%s' % repr(self.gh)[1:]
+
+class ThreadedProxy(object):
+    """Wraps one of the API objects from core.  Calling any of its methods
+    submits the call to the client's executor and returns a Future, except
+    for ``constructors``, which build further API objects without making
+    a request and so return them (wrapped) directly."""
+    constructors = {}
+
+    def __init__(self, client, obj):
+        self.client = client
+        self.obj = obj
+
+    def __getattr__(self, name):
+        attr = getattr(self.obj, name)
+        if not callable(attr):
+            return attr
+        if name in self.constructors:
+            cls = globals()[self.constructors[name]]
+            return lambda *args, **kwargs: cls(self.client, attr(*args, **kwargs))
+        def method(*args, **kwargs):
+            return self.client.submit(attr, *args, **kwargs)
+        method.__name__ = name
+        method.__doc__ = attr.__doc__
+        return method
+
+    def pages(self, name, **kwargs):
+        """Submit the pages of the paginated method ``name`` to the pool,
+        returning a Future for the list of their Futures, in page order.
+        Once the first page has arrived, if its Link header says how many
+        pages there are, the rest are submitted at once and the list is
+        complete;  otherwise pages are submitted one after another, and the
+        list is complete after the first empty or failed one.  Each page is
+        a blocking call on a worker thread, like any other method."""
+        method = getattr(self.obj, name)
+        client, gh = self.client, self.client.gh
+        def fetch(page):
+            # last_response is per thread, so it is read in the same call
+            result = method(page=page, **kwargs)
+            return result, last_page(gh.last_response)
+        pages, futures = Future(), []
+        def submit(page):
+            future = client.submit(fetch, page)
+            futures.append(future.then(lambda (result, last): result))
+            future.add_done_callback(lambda done: fetched(page, done))
+        def fetched(page, done):
+            if done.exception() is not None:
+                return pages.set_result(futures)
+            result, last = done.result()
+            if page == 1 and last:
+                futures.extend(client.submit(method, page=n, **kwargs)
+                    for n in range(2, last + 1))
+                return pages.set_result(futures)
+            if not result:
+                return pages.set_result(futures)
+            submit(page + 1)
+        submit(1)
+        return pages
+
+    def __repr__(self):
+        return '<Threaded%s' % repr(self.obj)[1:]
+
+class ThreadedUser(ThreadedProxy):
+    constructors = {'repository': 'ThreadedRepository', 'gist': 'ThreadedGist'}
+
+    def repository_pages(self):
+        return self.pages('repositories')
+
+class ThreadedRepository(ThreadedProxy):
+    constructors = {'issue': 'ThreadedIssue'}
+
+    def commit_pages(self, branch='master'):
+        return self.pages('commits', branch=branch)
+
+class ThreadedGist(ThreadedProxy):
+    pass
+
+class ThreadedIssue(ThreadedProxy):
+    pass
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Spreading requests over several credentials.  Github's rate limit is per
+user, so a crawler holding tokens for several accounts can make several
+times as many requests;  a TokenPool tracks each token's budget from the
+rate limit headers of its responses and hands each request to the token
+with the most left."""
+
+import time
+import threading
+from hashlib import sha1
+
+import core
+from ratelimit import RateLimiter
+
+__all__ = ["Credential", "TokenPool"]
+
+def identity(username, token):
+    """A name for the user a request is made as, which doesn't reveal the
+    token."""
+    return '%s:%s' % (username, sha1(token).hexdigest()[:12])
+
+class Credential(object):
+    """A username and token, with a RateLimiter of its own.  A credential
+    whose budget is spent is out of rotation until ``available_at``;  one
+    which github has rejected is ``revoked`` for good."""
+    def __init__(self, username, token, limiter=None):
+        self.username = username
+        self.token = token
+        self.limiter = limiter or RateLimiter()
+        self.available_at = 0
+        self.revoked = False
+
+    identity = property(lambda self: identity(self.username, self.token))
+
+    def headroom(self):
+        """Requests left in the current window;  infinite until github has
+        said, so that every credential is tried."""
+        remaining = self.limiter.remaining
+        return float('inf') if remaining is None else remaining
+
+    def available(self, now):
+        return not self.revoked and self.available_at <= now
+
+    def __repr__(self):
+        return '<Credential %s>' % self.username
+
+class TokenPool(object):
+    """A set of credentials to make requests with, given as Credentials or
+    (username, token) pairs."""
+    def __init__(self, credentials):
+        self.credentials = [c if isinstance(c, Credential) else Credential(*c)
+            for c in credentials]
+        self.identity = 'pool:' + ','.join(sorted(c.username for c in self.credentials))
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        """The credential for ``username``, or None."""
+        for credential in self.credentials:
+            if credential.username == username:
+                return credential
+        return None
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def __len__(self):
+        return len(self.credentials)
+
+    def select(self, username=None):
+        """The credential to make a request with:  the one for ``username``
+        if given (None if the pool has none), otherwise the one with the most
+        headroom.  If every credential is out of rotation, the one which is
+        due back first is returned, and its limiter will wait for its reset.
+        Raises AuthenticationRequired if every credential has been
+        revoked."""
+        if username is not None:
+            return self.get(username)
+        with self._lock:
+            now = time.time()
+            live = [c for c in self.credentials if c.available(now)]
+            if live:
+                return max(live, key=Credential.headroom)
+            waiting = [c for c in self.credentials if not c.revoked]
+            if not waiting:
+                raise core.AuthenticationRequired("every token in the pool has been revoked")
+            return min(waiting, key=lambda c: c.available_at)
+
+    def update(self, credential, response, limiter=None):
+        """Update a credential from a response made with it:  its budget from
+        the rate limit headers, and its place in the rotation.  The headers
+        of a request which draws on a budget of its own, eg. a GraphQL
+        query, go to that ``limiter`` instead."""
+        if limiter is not None:
+            limiter.update(response.headers)
+            if response.status == 401:
+                with self._lock:
+                    credential.revoked = True
+            return
+        credential.limiter.update(response.headers)
+        with self._lock:
+            if response.status == 401:
+                credential.revoked = True
+            elif credential.limiter.remaining == 0:
+                credential.available_at = credential.limiter.reset
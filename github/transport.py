@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Pooled keep-alive HTTP transport.  The Github object owns a single
+ConnectionPool and funnels all of its requests through it, so repeated calls
+against api.github.com reuse one TCP/TLS session per connection instead of
+paying for a new handshake on every request."""
+
+import httplib
+import socket
+import threading
+import time
+import urlparse
+import zlib
+
+__all__ = ["HTTPError", "Response", "StreamingResponse", "ConnectionPool"]
+
+user_agent = "python-github/0.1"
+chunk_size = 64 * 1024
+
+class Decoder(object):
+    """Incrementally decodes a gzip or deflate encoded body.  Servers send
+    "deflate" both with and without the zlib header, so it is sniffed from
+    the first chunk."""
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self._decompressor = None
+        if encoding == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, chunk):
+        if self._decompressor is None:
+            try:
+                zlib.decompressobj().decompress(chunk[:2])
+                self._decompressor = zlib.decompressobj()
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decompressor.decompress(chunk)
+
+    def flush(self):
+        if self._decompressor is None:
+            return ''
+        return self._decompressor.flush()
+
+def header_name(name):
+    """A header name in its usual form, eg. "Accept-Encoding", whatever
+    the case it was given in."""
+    return '-'.join(part.capitalize() for part in name.split('-'))
+
+class HTTPError(Exception):
+    """Raised for responses with a 4xx or 5xx status.  The full response is
+    available as the ``response`` attribute."""
+    def __init__(self, response):
+        self.response = response
+        self.code = response.status
+        Exception.__init__(self, "HTTP Error %s: %s (%s)" % (
+            response.status, response.reason, response.url))
+
+class Response(object):
+    """A fully read HTTP response.  Mimics the bits of urllib2's response
+    objects that this library uses."""
+    def __init__(self, url, status, reason, headers, body, wire_size=None):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = dict((k.lower(), v) for k,v in headers)
+        self.body = body
+        self.wire_size = len(body) if wire_size is None else wire_size
+
+    code = property(lambda self: self.status)
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def read(self):
+        return self.body
+
+    def __repr__(self):
+        return '<Response %s %s>' % (self.status, self.url)
+
+class StreamingResponse(Response):
+    """A response whose body is read from its connection on demand.  The
+    connection is returned to the pool once the body has been read in full,
+    or dropped if the response is closed before then."""
+    def __init__(self, pool, key, conn, resp, url):
+        Response.__init__(self, url, resp.status, resp.reason, resp.getheaders(), None, 0)
+        self.decoded_size = 0
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._resp = resp
+        encoding = self.getheader('content-encoding', '').strip().lower()
+        self._decoder = Decoder(encoding) if encoding in ('gzip', 'deflate') else None
+
+    def iter_chunks(self, size=chunk_size):
+        """Yield the decoded body, reading ``size`` bytes off the wire at a
+        time."""
+        if self._resp is None:
+            return
+        try:
+            while True:
+                chunk = self._resp.read(size)
+                if not chunk:
+                    # httplib doesn't complain about a short body when it
+                    # is read piecemeal, so check what's left of its length
+                    if self._resp.length:
+                        raise httplib.IncompleteRead('', self._resp.length)
+                    break
+                self.wire_size += len(chunk)
+                if self._decoder:
+                    chunk = self._decoder.decompress(chunk)
+                self.decoded_size += len(chunk)
+                if chunk:
+                    yield chunk
+            if self._decoder:
+                chunk = self._decoder.flush()
+                self.decoded_size += len(chunk)
+                if chunk:
+                    yield chunk
+        except:
+            self.close()
+            raise
+        self._finish(True)
+
+    def read(self):
+        if self.body is None:
+            self.body = ''.join(self.iter_chunks())
+        return self.body
+
+    def _finish(self, complete):
+        resp, self._resp = self._resp, None
+        self._pool._count_bytes(self.wire_size, self.decoded_size)
+        if complete and not resp.will_close:
+            self._pool._checkin(self._key, self._conn)
+        else:
+            self._pool._release(self._key, self._conn)
+
+    def close(self):
+        """Stop reading the body, dropping the connection if any is left."""
+        if self._resp is not None:
+            self._finish(False)
+
+class ConnectionPool(object):
+    """A thread-safe pool of persistent HTTP(S) connections, kept per
+    (scheme, host, port).  At most ``maxsize`` connections are opened to any
+    one host; callers block until one is returned to the pool.  Connections
+    which have sat idle for longer than ``idle_timeout`` seconds are closed
+    rather than reused.  Responses are requested gzip or deflate encoded and
+    decoded as they are read;  ``stats`` counts the bytes read off the wire
+    and the bytes they decoded to."""
+    redirect_codes = (301, 302, 303, 307)
+    max_redirects = 5
+    idempotent_methods = ('GET', 'HEAD')
+    accept_encoding = 'gzip, deflate'
+
+    def __init__(self, maxsize=4, idle_timeout=60, timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.stats = dict(wire_bytes=0, decoded_bytes=0)
+        self._stats_lock = threading.Lock()
+        self._idle = {}
+        self._count = {}
+        self._cond = threading.Condition(threading.Lock())
+        self._last_reap = time.time()
+
+    def _key(self, url):
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        return (scheme, parts.hostname, port)
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        cls = httplib.HTTPSConnection if scheme == 'https' else httplib.HTTPConnection
+        if self.timeout is None:
+            return cls(host, port)
+        return cls(host, port, timeout=self.timeout)
+
+    def _reap(self, now):
+        """Close idle connections older than idle_timeout.  Must be called
+        with the condition held."""
+        self._last_reap = now
+        cutoff = now - self.idle_timeout
+        for key, idle in self._idle.items():
+            # idle lists are appended to, so the stalest are at the front
+            while idle and idle[0][1] < cutoff:
+                conn, _ = idle.pop(0)
+                conn.close()
+                self._count[key] -= 1
+
+    def reap(self):
+        """Close any connections that have been idle for too long."""
+        with self._cond:
+            self._reap(time.time())
+            self._cond.notify_all()
+
+    def _checkout(self, key):
+        """Returns a (connection, reused) pair, blocking if the host is
+        already at maxsize connections."""
+        with self._cond:
+            while True:
+                now = time.time()
+                if now - self._last_reap > self.idle_timeout:
+                    self._reap(now)
+                idle = self._idle.setdefault(key, [])
+                if idle:
+                    conn, _ = idle.pop()
+                    return conn, True
+                if self._count.get(key, 0) < self.maxsize:
+                    self._count[key] = self._count.get(key, 0) + 1
+                    break
+                self._cond.wait()
+        try:
+            return self._new_connection(key), False
+        except:
+            self._release(key)
+            raise
+
+    def _checkin(self, key, conn):
+        with self._cond:
+            self._idle.setdefault(key, []).append((conn, time.time()))
+            self._cond.notify()
+
+    def _release(self, key, conn=None):
+        """Drop a connection from the pool entirely."""
+        if conn is not None:
+            conn.close()
+        with self._cond:
+            self._count[key] -= 1
+            self._cond.notify()
+
+    def _send(self, method, url, body, headers):
+        key = self._key(url)
+        parts = urlparse.urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        conn, reused = self._checkout(key)
+        try:
+            try:
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+            except (httplib.BadStatusLine, httplib.CannotSendRequest, socket.error):
+                if not reused or method not in self.idempotent_methods:
+                    raise
+                # the server closed this keep-alive connection while it sat
+                # idle in the pool; retry once on a fresh connection.  Other
+                # requests may have been acted on, so aren't sent twice
+                conn.close()
+                conn = self._new_connection(key)
+                conn.request(method, path, body, headers)
+                resp = conn.getresponse()
+        except:
+            self._release(key, conn)
+            raise
+        return StreamingResponse(self, key, conn, resp, url)
+
+    def _count_bytes(self, wire_size, decoded_size):
+        with self._stats_lock:
+            self.stats['wire_bytes'] += wire_size
+            self.stats['decoded_bytes'] += decoded_size
+
+    def request(self, method, url, body=None, headers=None, stream=False):
+        """Perform a request, following redirects the way urllib2 does.
+        Raises HTTPError for error statuses.  With ``stream``, the body is
+        left unread, to be consumed with the response's iter_chunks()."""
+        # urllib2 capitalizes header names ("Accept-encoding"), so names are
+        # put in one form before the defaults are added under them
+        headers = dict((header_name(k), v) for k, v in (headers or {}).items())
+        headers.setdefault('User-Agent', user_agent)
+        if self.accept_encoding:
+            headers.setdefault('Accept-Encoding', self.accept_encoding)
+        if body is not None:
+            headers.setdefault('Content-Type', 'application/x-www-form-urlencoded')
+        for i in range(self.max_redirects + 1):
+            response = self._send(method, url, body, headers)
+            location = response.getheader('location')
+            if response.status not in self.redirect_codes or not location:
+                break
+            response.read()
+            url = urlparse.urljoin(url, location)
+            if response.status == 303 or (method == 'POST' and response.status != 307):
+                method, body = 'GET', None
+                for name in ('Content-Type', 'Content-Length'):
+                    headers.pop(name, None)
+        if response.status >= 400:
+            response.read()
+            raise HTTPError(response)
+        if not stream:
+            response.read()
+        return response
+
+    def urlopen(self, request, stream=False):
+        """Drop-in replacement for urllib2.urlopen which takes a
+        urllib2.Request and sends it over a pooled connection."""
+        return self.request(request.get_method(), request.get_full_url(),
+            request.get_data(), dict(request.header_items()), stream)
+
+    def close(self):
+        """Close every idle connection in the pool."""
+        with self._cond:
+            for key, idle in self._idle.items():
+                for conn, _ in idle:
+                    conn.close()
+                    self._count[key] -= 1
+                del idle[:]
+            self._cond.notify_all()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Batching mutations.  A WritePipeline queues follows, unfollows and key
+changes, possibly for several users in a token pool, then sends them
+concurrently over the handle's connection pool and rate limiter.  Queued
+operations which a later one makes pointless are dropped before anything is
+sent, and each operation gets a WriteResult saying what became of it."""
+
+from collections import namedtuple
+
+__all__ = ["WriteOp", "WriteResult", "WritePipeline"]
+
+WriteOp = namedtuple('WriteOp', 'kind user args')
+
+# ``outcome`` is one of "ok", "failed", "superseded" (a later operation
+# undoes or repeats this one, so it wasn't sent) or "duplicate"
+WriteResult = namedtuple('WriteResult', 'op outcome status value error')
+
+def _target(op):
+    """What an operation acts on;  of several queued operations with the
+    same target, only the last has any lasting effect."""
+    if op.kind in ('follow', 'unfollow'):
+        return (op.user, 'following', op.args[0])
+    if op.kind == 'add_key':
+        return (op.user, 'key', op.args[1])
+    return (op.user, 'key id', op.args[0])
+
+class WritePipeline(object):
+    """Queues mutations to be sent by ``run``, ``concurrency`` at a time.
+    Each method takes the user to act as, who must be the handle's user or
+    in its token pool."""
+    def __init__(self, gh, concurrency=8):
+        self.gh = gh
+        self.concurrency = concurrency
+        self.ops = []
+
+    def __len__(self):
+        return len(self.ops)
+
+    def _queue(self, kind, user, *args):
+        op = WriteOp(kind, user or self.gh.username, args)
+        self.ops.append(op)
+        return op
+
+    def follow(self, target, user=None):
+        return self._queue('follow', user, target)
+
+    def unfollow(self, target, user=None):
+        return self._queue('unfollow', user, target)
+
+    def add_key(self, title, key, user=None):
+        return self._queue('add_key', user, title, key)
+
+    def remove_key(self, id, user=None):
+        return self._queue('remove_key', user, id)
+
+    def plan(self):
+        """The operations which will be sent, and a WriteResult for each
+        one which won't.  A follow followed by an unfollow of the same user
+        (or vice versa) is only sent as the unfollow, and an operation
+        repeated is sent once."""
+        last = {}
+        for index, op in enumerate(self.ops):
+            last[_target(op)] = index
+        send, skipped = [], {}
+        for index, op in enumerate(self.ops):
+            winner = self.ops[last[_target(op)]]
+            if index == last[_target(op)]:
+                send.append(op)
+            else:
+                outcome = 'duplicate' if op == winner else 'superseded'
+                skipped[index] = WriteResult(op, outcome, None, None, None)
+        return send, skipped
+
+    def _send(self, op):
+        value = getattr(self.gh.user(op.user), op.kind)(*op.args)
+        return value, self.gh.last_response.status
+
+    def run(self):
+        """Send the queued operations, emptying the queue.  Returns a
+        WriteResult for each operation, in the order they were queued;
+        failures are reported in ``error`` rather than stopping the rest."""
+        send, skipped = self.plan()
+        results = self.gh.fetch_many([lambda op=op: self._send(op) for op in send],
+            self.concurrency)
+        sent = iter(results)
+        report = []
+        for index, op in enumerate(self.ops):
+            if index in skipped:
+                report.append(skipped[index])
+                continue
+            result = sent.next()
+            if result.error is None:
+                value, status = result.value
+                report.append(WriteResult(op, 'ok', status, value, None))
+            else:
+                status = getattr(result.error, 'code', None)
+                report.append(WriteResult(op, 'failed', status, None, result.error))
+        self.ops = []
+        return report
@@ -0,0 +1,500 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""An in-process stand-in for the parts of the github REST API that
+github.core talks to.  It serves generated users, repositories, commits and
+issues with github's pagination Link headers, rate limit headers, ETags and
+gzip encoding, and can add latency to every response.  Used by the tests and
+by the benchmark suite::
+
+    >>> api = FakeAPI(commits=1000)
+    >>> gh = github.Github(api_base=api.start())
+    >>> len(gh.repository('octocat', 'repo0').commits(all=True))
+    1000
+    >>> api.stop()
+"""
+
+import re
+import gzip
+import time
+import json
+import threading
+from hashlib import sha1, md5
+from StringIO import StringIO
+from urlparse import urlsplit, parse_qs
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+__all__ = ["FakeAPI"]
+
+epoch = 1300000000
+
+def timestamp(t):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # buffer each response so it goes out in one write, rather than a packet
+    # per header line stalling on the client's delayed ACKs
+    wbufsize = -1
+    api = None
+
+    def do_GET(self):
+        self.api.handle(self)
+
+    def do_POST(self):
+        self.api.handle(self)
+
+    def log_message(self, *args):
+        pass
+
+class FakeAPI(object):
+    """Serves ``repos`` repositories for each of ``users``, each with a
+    linear history of ``commits`` commits (newest first, one an hour),
+    ``branches`` branches and ``issues`` issues.  A stub GraphQL endpoint
+    answers the queries GraphQLBackend makes.  Events added with
+    ``add_event`` are served in the events feeds, which ask to be polled
+    every ``poll_interval`` seconds.  Pages hold ``per_page`` items unless
+    the client asks for up to ``max_per_page``.  Each client gets
+    ``rate_limit`` requests per hour;  304 responses are free, as on
+    github.  Each caller can follow users and add and remove keys.
+    Requests made with a token in ``revoked`` get a 401.  Every response is
+    delayed by ``latency`` seconds;  the next responses for a path can be
+    made to fail with the statuses (or (status, headers) pairs) listed in
+    ``faults[path]``, and be delayed by the seconds listed in
+    ``delays[path]``.  Keys may carry part of the query too, eg.
+    ``path?page=2``.  ``requests`` and ``callers`` record the path and
+    identity of each request."""
+    routes = [
+        (r'users/([^/]+)/repos$', 'user_repos'),
+        (r'users/([^/]+)/watched$', 'user_repos'),
+        (r'user/show/([^/]+)$', 'user_show'),
+        (r'repos/show/([^/]+)/([^/]+)$', 'repo_show'),
+        (r'repos/show/([^/]+)/([^/]+)/branches$', 'repo_branches'),
+        (r'repos/show/([^/]+)/([^/]+)/tags$', 'repo_tags'),
+        (r'repos/([^/]+)/([^/]+)/commits$', 'repo_commits'),
+        (r'repos/([^/]+)/([^/]+)/commits/([0-9a-f]{40})$', 'repo_commit'),
+        (r'issues/list/([^/]+)/([^/]+)/(open|closed)$', 'repo_issues'),
+        (r'user/keys$', 'user_keys'),
+        (r'users/([^/]+)/events$', 'user_events'),
+        (r'orgs/([^/]+)/events$', 'org_events'),
+        (r'repos/([^/]+)/([^/]+)/events$', 'repo_events'),
+    ]
+    # posts are handled with the caller's identity and the form posted
+    post_routes = [
+        (r'user/follow/([^/]+)$', 'user_follow'),
+        (r'user/unfollow/([^/]+)$', 'user_unfollow'),
+        (r'user/key/add$', 'user_key_add'),
+        (r'user/key/remove$', 'user_key_remove'),
+        (r'graphql$', 'graphql'),
+    ]
+    authors = ('alice', 'bob', 'carol')
+
+    def __init__(self, users=('octocat',), repos=3, commits=100, issues=10,
+            per_page=30, max_per_page=100, rate_limit=5000, latency=0, branches=1):
+        self.users = list(users)
+        self.repos = repos
+        self.commits = commits
+        self.branches = branches
+        self.events = []
+        self.poll_interval = 60
+        self.issues = issues
+        self.per_page = per_page
+        self.max_per_page = max_per_page
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.reset = int(time.time()) + 3600
+        self.remaining = {}
+        self.revoked = set()
+        self.faults = {}
+        self.delays = {}
+        self.requests = []
+        self.callers = []
+        self.server = None
+        self._lock = threading.Lock()
+        self.following = {}
+        self.keys = {}
+        self._key_ids = 0
+        self._routes = {
+            'GET': [(re.compile(pattern), name) for pattern, name in self.routes],
+            'POST': [(re.compile(pattern), name) for pattern, name in self.post_routes]}
+        self._history = {}
+        self._local = threading.local()
+
+    def start(self):
+        """Start serving in a background thread, returning the API base url."""
+        class handler(Handler):
+            api = self
+        self.server = Server(('127.0.0.1', 0), handler)
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    url = property(lambda self: 'http://127.0.0.1:%d/' % self.server.server_port)
+
+    # -- data
+
+    def sha(self, owner, repo, index):
+        return sha1('%s/%s/%d' % (owner, repo, index)).hexdigest()
+
+    def user(self, login):
+        return {'login': login, 'id': int(md5(login).hexdigest()[:6], 16),
+            'type': 'User', 'url': self.url + 'users/' + login,
+            'html_url': 'https://github.com/' + login,
+            'avatar_url': 'https://avatars.example.com/%s' % login,
+            'created_at': timestamp(epoch - 86400 * 365)}
+
+    def repo(self, owner, index):
+        name = 'repo%d' % index
+        return {'name': name, 'id': index, 'full_name': '%s/%s' % (owner, name),
+            'owner': self.user(owner), 'private': False, 'fork': False,
+            'description': 'fake repository %d' % index,
+            'url': self.url + 'repos/%s/%s' % (owner, name),
+            'html_url': 'https://github.com/%s/%s' % (owner, name),
+            'language': 'Python', 'forks': index, 'watchers': index * 2,
+            'size': 1024, 'open_issues': self.issues, 'master_branch': 'master',
+            'created_at': timestamp(epoch - 86400 * 30),
+            'updated_at': timestamp(epoch), 'pushed_at': timestamp(epoch)}
+
+    def commit(self, owner, repo, index):
+        sha = self.sha(owner, repo, index)
+        author = self.authors[index % len(self.authors)]
+        signature = {'name': author.title(), 'email': '%s@example.com' % author,
+            'date': timestamp(epoch - 3600 * index)}
+        parents = []
+        if index + 1 < self.commits:
+            parent = self.sha(owner, repo, index + 1)
+            parents.append({'sha': parent, 'url': self.url + 'repos/%s/%s/commits/%s' % (
+                owner, repo, parent)})
+        return {'sha': sha, 'url': self.url + 'repos/%s/%s/commits/%s' % (owner, repo, sha),
+            'html_url': 'https://github.com/%s/%s/commit/%s' % (owner, repo, sha),
+            'commit': {'message': 'commit %d' % index, 'author': signature,
+                'committer': signature, 'tree': {'sha': sha1(sha).hexdigest()}},
+            'author': self.user(author), 'committer': self.user(author),
+            'parents': parents}
+
+    def branch_shas(self, owner, repo):
+        """master at the newest commit, then branch1, branch2... at older ones."""
+        names = ['master'] + ['branch%d' % i for i in range(1, self.branches)]
+        return dict((name, self.sha(owner, repo, i)) for i, name in enumerate(names))
+
+    def history(self, owner, repo):
+        """Every commit in a repository, newest first;  generated once."""
+        key = (owner, repo)
+        if key not in self._history:
+            self._history[key] = [self.commit(owner, repo, i) for i in range(self.commits)]
+        return self._history[key]
+
+    def issue(self, owner, repo, number, state):
+        return {'number': number, 'title': 'issue %d' % number, 'state': state,
+            'user': self.authors[number % len(self.authors)],
+            'created_at': timestamp(epoch - 86400 * number),
+            'updated_at': timestamp(epoch - 3600 * number)}
+
+    # -- endpoints;  each returns the response data, where lists are paginated,
+    # or None for a 404
+
+    def user_repos(self, query, login):
+        if login not in self.users:
+            return None
+        return [self.repo(login, i) for i in range(self.repos)]
+
+    def user_show(self, query, login):
+        if login not in self.users:
+            return None
+        return {'user': self.user(login)}
+
+    def has_repo(self, owner, name):
+        return (owner in self.users and re.match(r'repo\d+$', name) is not None
+            and int(name[4:]) < self.repos)
+
+    def repo_show(self, query, owner, name):
+        if not self.has_repo(owner, name):
+            return None
+        return {'repository': self.repo(owner, int(name[4:]))}
+
+    def repo_branches(self, query, owner, name):
+        if not self.has_repo(owner, name):
+            return None
+        return {'branches': self.branch_shas(owner, name)}
+
+    def repo_tags(self, query, owner, name):
+        if not self.has_repo(owner, name):
+            return None
+        return {'tags': {'v1.0': self.sha(owner, name, self.commits // 2)}}
+
+    def repo_commits(self, query, owner, name):
+        if not self.has_repo(owner, name):
+            return None
+        commits = self.history(owner, name)
+        if 'sha' in query and query['sha'][0] != 'master':
+            shas = [c['sha'] for c in commits]
+            if query['sha'][0] not in shas:
+                return None
+            commits = commits[shas.index(query['sha'][0]):]
+        if 'since' in query:
+            since = query['since'][0]
+            commits = [c for c in commits if c['commit']['committer']['date'] >= since]
+        return commits
+
+    def repo_commit(self, query, owner, name, sha):
+        if not self.has_repo(owner, name):
+            return None
+        for commit in self.history(owner, name):
+            if commit['sha'] == sha:
+                return commit
+        return None
+
+    def repo_issues(self, query, owner, name, state):
+        if not self.has_repo(owner, name):
+            return None
+        return {'issues': [self.issue(owner, name, n, state)
+            for n in range(1, self.issues + 1)]}
+
+    def add_event(self, type, owner, repo, payload=None, actor=None):
+        """Add an event to the feeds, returning it."""
+        with self._lock:
+            event = {'id': str(len(self.events) + 1), 'type': type,
+                'actor': {'login': actor or owner},
+                'repo': {'name': '%s/%s' % (owner, repo)},
+                'payload': payload or {}, 'created_at': timestamp(time.time())}
+            self.events.append(event)
+            return event
+
+    def _feed(self, match):
+        with self._lock:
+            return [e for e in reversed(self.events) if match(e)]
+
+    def user_events(self, query, login):
+        return self._feed(lambda e: e['actor']['login'] == login)
+
+    def org_events(self, query, org):
+        return self._feed(lambda e: e['repo']['name'].split('/')[0] == org)
+
+    def repo_events(self, query, owner, name):
+        return self._feed(lambda e: e['repo']['name'] == '%s/%s' % (owner, name))
+
+    def user_keys(self, query):
+        return {'public_keys': self.keys.get(self._local.caller, [])}
+
+    def user_follow(self, caller, form, login):
+        if login not in self.users:
+            return None
+        with self._lock:
+            following = self.following.setdefault(caller, set())
+            following.add(login)
+            return {'users': sorted(following)}
+
+    def user_unfollow(self, caller, form, login):
+        if login not in self.users:
+            return None
+        with self._lock:
+            following = self.following.setdefault(caller, set())
+            following.discard(login)
+            return {'users': sorted(following)}
+
+    def user_key_add(self, caller, form):
+        if 'key' not in form:
+            return None
+        with self._lock:
+            self._key_ids += 1
+            keys = self.keys.setdefault(caller, [])
+            keys.append({'id': self._key_ids, 'title': form.get('title', [''])[0],
+                'key': form['key'][0]})
+            return {'public_keys': keys}
+
+    def user_key_remove(self, caller, form):
+        with self._lock:
+            keys = self.keys.setdefault(caller, [])
+            ids = [str(k['id']) for k in keys]
+            if form.get('id', [None])[0] not in ids:
+                return None
+            del keys[ids.index(form['id'][0])]
+            return {'public_keys': keys}
+
+    # a stub of the GraphQL API, which expects each object queried on a line
+    # of its own
+    _alias_re = re.compile(r'(\w+): (user|repository)\((.*?)\) \{(.*)\}$')
+    _refs_re = re.compile(r'(\w+): refs\(refPrefix: "([^"]+)", first: (\d+)(?:, after: "(\d+)")?\)')
+
+    def graphql(self, caller, form):
+        data, errors = {}, []
+        for line in form.get('query', '').splitlines():
+            line = line.strip()
+            if line.startswith('rateLimit'):
+                data['rateLimit'] = {'cost': 1, 'remaining': self.rate_limit,
+                    'resetAt': timestamp(self.reset)}
+            match = self._alias_re.match(line)
+            if not match:
+                continue
+            alias, kind, args, fields = match.groups()
+            args = dict(re.findall(r'(\w+): "([^"]*)"', args))
+            if kind == 'user':
+                data[alias] = self.graphql_user(args['login'])
+            else:
+                data[alias] = self.graphql_repository(args['owner'], args['name'], fields)
+            if data[alias] is None:
+                errors.append({'type': 'NOT_FOUND', 'path': [alias],
+                    'message': 'Could not resolve to a %s' % kind})
+        return {'data': data, 'errors': errors} if errors else {'data': data}
+
+    def graphql_user(self, login):
+        if login not in self.users:
+            return None
+        user = self.user(login)
+        return {'databaseId': user['id'], 'login': login, 'name': login.title(),
+            'email': None, 'company': None, 'websiteUrl': None, 'location': None,
+            'bio': None, 'url': user['html_url'], 'avatarUrl': user['avatar_url'],
+            'createdAt': user['created_at'], 'followers': {'totalCount': 0},
+            'following': {'totalCount': 0}, 'repositories': {'totalCount': self.repos}}
+
+    def graphql_repository(self, owner, name, fields):
+        if not self.has_repo(owner, name):
+            return None
+        repo = self.repo(owner, int(name[4:]))
+        data = {'databaseId': repo['id'], 'name': name, 'nameWithOwner': repo['full_name'],
+            'description': repo['description'], 'url': repo['html_url'],
+            'homepageUrl': None, 'isPrivate': False, 'isFork': False,
+            'forkCount': repo['forks'], 'stargazerCount': repo['watchers'],
+            'diskUsage': repo['size'], 'createdAt': repo['created_at'],
+            'updatedAt': repo['updated_at'], 'pushedAt': repo['pushed_at'],
+            'owner': {'login': owner}, 'primaryLanguage': {'name': repo['language']},
+            'defaultBranchRef': {'name': 'master'}, 'issues': {'totalCount': self.issues}}
+        refs = {'refs/heads/': self.branch_shas(owner, name),
+            'refs/tags/': self.repo_tags({}, owner, name)['tags']}
+        for alias, prefix, first, after in self._refs_re.findall(fields):
+            names = sorted(refs[prefix])
+            start = int(after or 0)
+            page = names[start:start + int(first)]
+            data[alias] = {'nodes': [{'name': n, 'target': {'oid': refs[prefix][n]}}
+                for n in page], 'pageInfo': {'hasNextPage': start + len(page) < len(names),
+                'endCursor': str(start + len(page))}}
+        return data
+
+    # -- serving
+
+    def paginate(self, handler, path, query, items):
+        """Slice a list endpoint into pages, returning the page and a Link
+        header for it."""
+        page = int(query.get('page', [1])[0])
+        per_page = min(int(query.get('per_page', [self.per_page])[0]), self.max_per_page)
+        last = max(1, (len(items) + per_page - 1) // per_page)
+        def link(n):
+            args = dict((k, v[0]) for k,v in query.items())
+            args.update(page=n, per_page=per_page)
+            return '<%s%s?%s>' % (self.url, path, '&'.join(
+                '%s=%s' % kv for kv in sorted(args.items())))
+        links = []
+        if page < last:
+            links += ['%s; rel="next"' % link(page + 1), '%s; rel="last"' % link(last)]
+        if page > 1:
+            links += ['%s; rel="first"' % link(1), '%s; rel="prev"' % link(page - 1)]
+        return items[(page - 1) * per_page:page * per_page], ', '.join(links)
+
+    def _next(self, table, path, query):
+        """Pop the next value listed in ``faults`` or ``delays`` for a
+        request, under its path or its path and part of its query, eg.
+        ``repos/octocat/repo0/commits?page=2``.  Must hold the lock."""
+        for key, values in table.items():
+            key_path, _, key_query = key.partition('?')
+            if key_path == path and values and all(query.get(k) == v
+                    for k, v in parse_qs(key_query).items()):
+                return values.pop(0)
+        return None
+
+    def identity(self, handler):
+        return handler.headers.get('Authorization') or handler.client_address[0]
+
+    def handle(self, handler):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(handler.path)
+        path, query = parts.path.lstrip('/'), parse_qs(parts.query)
+        # read any body before responding, so the connection can be reused
+        length = int(handler.headers.get('Content-Length') or 0)
+        body = handler.rfile.read(length) if length else ''
+        content_types = handler.headers.getheaders('Content-Type')
+        if len(content_types) > 1:
+            return self.respond(handler, 400, {'message': 'Conflicting Content-Type headers'})
+        if content_types == ['application/json']:
+            form = json.loads(body)
+        else:
+            form = parse_qs(body)
+        with self._lock:
+            self.requests.append(handler.path)
+            self.callers.append(self.identity(handler))
+            fault = self._next(self.faults, path, query)
+            delay = self._next(self.delays, path, query)
+        if delay:
+            time.sleep(delay)
+        if fault:
+            status, headers = fault if isinstance(fault, tuple) else (fault, {})
+            return self.respond(handler, status, {'message': 'Fault'}, headers)
+        auth = handler.headers.get('Authorization', '')
+        if auth.startswith('token ') and auth[6:] in self.revoked:
+            return self.respond(handler, 401, {'message': 'Bad credentials'})
+        for pattern, name in self._routes.get(handler.command, []):
+            match = pattern.match(path)
+            if match:
+                break
+        else:
+            return self.respond(handler, 404, {'message': 'Not Found'})
+        if handler.command == 'POST':
+            data = getattr(self, name)(self.identity(handler), form, *match.groups())
+        else:
+            self._local.caller = self.identity(handler)
+            data = getattr(self, name)(query, *match.groups())
+        if data is None:
+            return self.respond(handler, 404, {'message': 'Not Found'})
+        headers = {}
+        if path.endswith('/events'):
+            headers['X-Poll-Interval'] = str(self.poll_interval)
+        if isinstance(data, list):
+            data, link = self.paginate(handler, path, query, data)
+            if link:
+                headers['Link'] = link
+        self.respond(handler, 200, data, headers)
+
+    def respond(self, handler, status, data, headers=None):
+        headers = dict(headers or {})
+        body = json.dumps(data)
+        etag = '"%s"' % md5(body).hexdigest()
+        if status == 200 and handler.headers.get('If-None-Match') == etag:
+            status, body = 304, ''
+        key = self.identity(handler)
+        with self._lock:
+            if time.time() >= self.reset:
+                self.reset = int(time.time()) + 3600
+                self.remaining.clear()
+            remaining = self.remaining.get(key, self.rate_limit)
+            if status != 304:
+                if remaining <= 0:
+                    status = 403
+                    body = json.dumps({'message': 'API rate limit exceeded'})
+                else:
+                    remaining -= 1
+            self.remaining[key] = remaining
+        headers.update({'ETag': etag, 'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Reset': str(self.reset),
+            'Content-Type': 'application/json; charset=utf-8'})
+        if body and 'gzip' in handler.headers.get('Accept-Encoding', ''):
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=6) as f:
+                f.write(body)
+            body = buf.getvalue()
+            headers['Content-Encoding'] = 'gzip'
+        handler.send_response(status)
+        for name, value in headers.items():
+            handler.send_header(name, value)
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
@@ -3,12 +3,886 @@
 
 """pythongithub tests."""
 
+from __future__ import absolute_import
+
+import random
+import shutil
+import socket
+import multiprocessing
+import datetime
+import tempfile
+import threading
+import time
+import zlib
+import gzip
+import hashlib
+from StringIO import StringIO
 from unittest import TestCase
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+import github
+from github.core import handle_pagination_all, iter_pages, parse_link_header, \
+    _parse_timestamp
+from github.transport import ConnectionPool, HTTPError, Response
+from github.cache import CacheEntry, MemoryCache, DiskCache
+from github.executor import Executor, as_completed
+from github.threaded import ThreadedProxy
+from github.models import Commit
+from github.metrics import Metrics
+from github.store import Store
+from github.jsonstream import ArrayParser
+from github.crawl import Crawler
+from github.graph import CommitGraph
+from github.ratelimit import RateLimiter, SharedRateLimiter
+from tests.fakeapi import FakeAPI
+
+file_data = ''.join(chr(i % 251) for i in range(300000))
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = []
+    requests = []
+    headers_seen = []
+
+    def send_file(self):
+        """Serve file_data with Range support;  /flaky cuts off unranged
+        responses part of the way through."""
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'].split('=')[1].rstrip('-'))
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(file_data) - start))
+        self.end_headers()
+        if self.path.startswith('/flaky') and not start:
+            self.wfile.write(file_data[:100000])
+            self.close_connection = 1
+            return
+        self.wfile.write(file_data[start:])
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.connections.append(self.client_address)
+
+    def do_GET(self):
+        self.requests.append(self.path)
+        self.headers_seen.append(self.headers)
+        if self.path.startswith('/file') or self.path.startswith('/flaky'):
+            return self.send_file()
+        status = 404 if self.path.startswith('/missing') else 200
+        body = self.path
+        if self.path.startswith('/etag'):
+            if self.headers.get('If-None-Match') == '"v1"':
+                status, body = 304, ''
+        encoding = None
+        if self.path.startswith('/gzip') or self.path.startswith('/deflate'):
+            body = 'x' * 10000
+            encoding = self.path.strip('/')
+            if encoding == 'gzip':
+                buf = StringIO()
+                with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                    f.write(body)
+                body = buf.getvalue()
+            else:
+                body = zlib.compress(body)
+        self.send_response(status)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if self.path.startswith('/etag'):
+            self.send_header('ETag', '"v1"')
+        if self.path.startswith('/pages'):
+            page = int(self.path.split('page=')[1])
+            body = '[%d]' % page if page <= 5 else '[]'
+            self.send_header('Link', '</pages?page=2>; rel="next", </pages?page=5>; rel="last"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def serve(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%d/' % server.server_port
+
+class Pages(object):
+    def __init__(self, gh, base):
+        self.gh = gh
+        self.base = base
+
+    @handle_pagination_all
+    def pages(self, page=None, all=False):
+        return github.core.json.loads(self.gh.load_url(self.base + 'pages?page=%s' % page))
+
+class Unlinked(object):
+    def items(self, page=None):
+        return [page] if page <= 3 else []
 
 class pythongithubTest(TestCase):
     def setUp(self):
-        pass
+        EchoHandler.connections = []
+        self.server, self.base = serve(EchoHandler)
 
     def tearDown(self):
-        pass
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_pool_reuses_connections(self):
+        pool = ConnectionPool(maxsize=2)
+        for i in range(3):
+            self.assertEqual(pool.request('GET', self.base + 'a%d' % i).body, '/a%d' % i)
+        self.assertEqual(len(EchoHandler.connections), 1)
+        self.assertRaises(HTTPError, pool.request, 'GET', self.base + 'missing')
+        pool.close()
+
+    def test_pool_stale_connections(self):
+        pool = ConnectionPool(maxsize=1)
+        pool.request('GET', self.base)
+        # a GET on a connection which has gone away is sent again, a POST isn't
+        pool._idle.values()[0][0][0].sock.close()
+        self.assertEqual(pool.request('GET', self.base + 'again').body, '/again')
+        pool._idle.values()[0][0][0].sock.close()
+        self.assertRaises(socket.error, pool.request, 'POST', self.base, 'data')
+        self.assertEqual(pool.request('GET', self.base + 'after').body, '/after')
+        pool.close()
+
+    def test_pool_reaps_idle_connections(self):
+        pool = ConnectionPool(maxsize=2, idle_timeout=0)
+        pool.request('GET', self.base)
+        pool.reap()
+        pool.request('GET', self.base)
+        self.assertEqual(len(EchoHandler.connections), 2)
+
+    def test_load_url(self):
+        gh = github.Github()
+        self.assertEqual(gh.load_url(self.base + 'users'), '/users')
+        self.assertEqual(gh.load_url(self.base + 'missing', quiet=True), '{}')
+        gh.close()
+
+    def test_conditional_requests(self):
+        gh = github.Github(cache=MemoryCache())
+        self.assertEqual(gh.load_url(self.base + 'etag'), '/etag')
+        self.assertEqual(gh.load_url(self.base + 'etag'), '/etag')
+        self.assertEqual(gh.cache_stats, dict(hits=1, misses=1, not_modified=1))
+
+    def test_memory_cache_eviction(self):
+        cache = MemoryCache(max_bytes=10)
+        cache.set('a', CacheEntry(None, None, 'aaaa'))
+        cache.set('b', CacheEntry(None, None, 'bbbb'))
+        cache.get('a')
+        cache.set('c', CacheEntry(None, None, 'cccc'))
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a').body, 'aaaa')
+        self.assertEqual(cache.size, 8)
+
+    def test_disk_cache(self):
+        path = tempfile.mkdtemp()
+        try:
+            DiskCache(path).set('k', CacheEntry('"e"', None, 'body'))
+            entry = DiskCache(path).get('k')
+            self.assertEqual((entry.etag, entry.body), ('"e"', 'body'))
+            for key in ('k?page=2', 'kk'):
+                DiskCache(path).set(key, CacheEntry(None, None, 'body'))
+            DiskCache(path).delete_pages('k')
+            self.assertEqual([bool(DiskCache(path).get(key)) for key in ('k', 'k?page=2', 'kk')],
+                [False, False, True])
+        finally:
+            shutil.rmtree(path)
+
+    def test_rate_limiter_default_budget(self):
+        limiter = RateLimiter(limit=3, period=60)
+        self.assertEqual([limiter.reserve() for i in range(3)], [0, 0, 0])
+        self.assertTrue(19 < limiter.reserve() <= 20)
+
+    def test_rate_limiter_headers(self):
+        limiter = RateLimiter()
+        reset = time.time() + 100
+        limiter.update({'x-ratelimit-remaining': '2', 'x-ratelimit-reset': repr(reset)})
+        self.assertEqual([limiter.reserve() for i in range(2)], [0, 0])
+        self.assertTrue(99 < limiter.reserve() <= 100)
+        limiter.update({'x-ratelimit-remaining': '5000', 'x-ratelimit-reset': repr(reset + 3600)})
+        self.assertEqual([limiter.reserve() for i in range(60)], [0] * 60)
+        self.assertTrue(0 < limiter.reserve() < 1)
+
+    def test_rate_limiter_queues_past_reset(self):
+        for limiter in (RateLimiter(limit=2, period=60), SharedRateLimiter(limit=2, period=60)):
+            reset = time.time() + 0.2
+            limiter.update({'x-ratelimit-remaining': '0', 'x-ratelimit-reset': repr(reset)})
+            # waiters are spread over the next window rather than all woken at the reset
+            delays = [limiter.reserve() - 30 * max(0, i - 1) for i in range(4)]
+            self.assertTrue(all(0 < d <= 0.2 for d in delays))
+            # and once it comes, what they took is missing from its budget
+            time.sleep(0.3)
+            self.assertTrue(89 < limiter.reserve() <= 90)
+
+    def test_parse_link_header(self):
+        links = parse_link_header('<https://a/?page=2>; rel="next", <https://a/?page=9>; rel="last"')
+        self.assertEqual(links, {'next': 'https://a/?page=2', 'last': 'https://a/?page=9'})
+
+    def test_parallel_pagination(self):
+        pages = Pages(github.Github(), self.base)
+        self.assertEqual(pages.pages(page=2), [2])
+        self.assertEqual(pages.pages(all=True), [1, 2, 3, 4, 5])
+
+    def test_iter_pages(self):
+        pages = Pages(github.Github(), self.base)
+        self.assertEqual(list(iter_pages(pages.pages)), [1, 2, 3, 4, 5])
+        self.assertEqual(list(iter_pages(pages.pages, prefetch=True)), [1, 2, 3, 4, 5])
+        EchoHandler.requests = []
+        items = iter_pages(pages.pages)
+        self.assertEqual(items.next(), 1)
+        items.close()
+        self.assertEqual(len(EchoHandler.requests), 1)
+
+    def test_executor(self):
+        executor = Executor(4)
+        futures = executor.map(lambda x: 10 / x, [1, 2, 0])
+        self.assertEqual([f.result() for f in futures[:2]], [10, 5])
+        self.assertRaises(ZeroDivisionError, futures[2].result)
+        self.assertEqual(futures[1].then(lambda x: x + 1).result(), 6)
+        self.assertEqual(len(list(as_completed(futures))), 3)
+        executor.shutdown()
+
+    def test_threaded_client(self):
+        client = github.ThreadedGithub(workers=4)
+        future = client.submit(client.gh.load_url, self.base + 'users')
+        self.assertEqual(future.result(), '/users')
+        pages = ThreadedProxy(client, Pages(client.gh, self.base)).pages('pages')
+        self.assertEqual([f.result() for f in pages.result()], [[i] for i in range(1, 6)])
+        # without a Link header, pages are fetched until an empty one
+        other = github.ThreadedGithub(workers=2)
+        unlinked = ThreadedProxy(other, Unlinked()).pages('items')
+        self.assertEqual([f.result() for f in unlinked.result()], [[1], [2], [3], []])
+        other.close()
+        client.close()
+
+    def test_fetch_many(self):
+        gh = github.Github()
+        specs = [lambda i=i: gh.load_url(self.base + 'item%d' % i) for i in range(5)]
+        specs.insert(2, lambda: gh.load_url(self.base + 'missing'))
+        results = gh.fetch_many(specs, concurrency=3)
+        self.assertEqual([r.value for r in results],
+            ['/item0', '/item1', None, '/item2', '/item3', '/item4'])
+        self.assertEqual(results[2].error.code, 404)
+        self.assertEqual(len(list(gh.fetch_many(specs, stream=True))), 6)
+        self.assertEqual(gh.load_url(self.base + 'missing', quiet=True), '{}')
+
+    def test_to_datetime(self):
+        stamps = ['2010-11-10T21:19:10-08:00', '2010/10/26 20:28:08 -0700',
+            '2011-03-13T01:59:59-08:00', '2011-03-13T02:30:00-08:00',
+            '2011-03-13T03:00:00-07:00', '2011-11-06T01:30:00-07:00',
+            '2011-11-06T02:00:00-08:00', '2011-06-01T12:00:00Z',
+            '2010/10/26 20:28:08', ' 2011-06-01T12:00:00Z', '2011-6-1T12:00:00Z']
+        expected = [_parse_timestamp(s) for s in stamps]
+        self.assertEqual([github.to_datetime(s) for s in stamps], expected)
+        self.assertEqual(github.to_datetimes(stamps), expected)
+        self.assertEqual(github.to_datetime(stamps[0]).isoformat(), '2010-11-11T05:19:10+00:00')
+        self.assertRaises(Exception, github.to_datetime, '2011-06-01 12:00')
+
+    def test_models(self):
+        payload = github.core.json.loads(github.core.json.dumps({
+            'sha': 'a' * 40, 'node_id': 'n', 'parents': [{'sha': 'b' * 40}],
+            'commit': {'message': u'caf\xe9', 'author': {'name': 'J', 'date': '2011-06-01T12:00:00Z'}},
+            'author': {'login': 'jmoiron', 'id': 1, 'gravatar_id': ''}}))
+        commit = Commit(payload)
+        self.assertEqual(commit.sha, 'a' * 40)
+        self.assertEqual(commit.tree, None)
+        self.assertEqual(commit.commit.message, u'caf\xe9')
+        self.assertEqual(commit.commit.author.date, github.to_datetime('2011-06-01T12:00:00Z'))
+        self.assertEqual(commit.author.login, 'jmoiron')
+        self.assertEqual(commit['parents'][0]['sha'], 'b' * 40)
+        self.assertEqual(commit['node_id'], 'n')
+        self.assertRaises(KeyError, lambda: commit['tree'])
+        self.assertEqual(commit.to_dict(), payload)
+        self.assertFalse(hasattr(commit, '__dict__'))
+
+    def test_compressed_responses(self):
+        gh = github.Github()
+        self.assertEqual(gh.load_url(self.base + 'gzip'), 'x' * 10000)
+        self.assertEqual(gh.load_url(self.base + 'deflate'), 'x' * 10000)
+        stats = gh.transfer_stats
+        self.assertEqual(stats['decoded_bytes'], 20000)
+        self.assertTrue(stats['wire_bytes'] < 1000)
+
+    def test_streaming_download(self):
+        gh = github.Github()
+        chunks = list(gh.iter_url(self.base + 'file', chunk_size=4096))
+        self.assertEqual(''.join(chunks), file_data)
+        self.assertEqual(set(len(c) for c in chunks[:-1]), set([4096]))
+        self.assertEqual(''.join(gh.iter_url(self.base + 'flaky')), file_data)
+        out = StringIO()
+        checksum = hashlib.md5(file_data).hexdigest()
+        size = gh.download_url(self.base + 'flaky', out, size=len(file_data), checksum=checksum)
+        self.assertEqual((size, out.getvalue()), (len(file_data), file_data))
+        out = StringIO(file_data[:1000])
+        gh.download_url(self.base + 'file', out, offset=1000, checksum=checksum)
+        self.assertEqual(out.getvalue(), file_data)
+        self.assertEqual(EchoHandler.requests[-1:], ['/file'])
+        self.assertRaises(github.DownloadError, gh.download_url, self.base + 'file',
+            StringIO(), checksum='0' * 32)
+
+    def test_header_defaults(self):
+        gh = github.Github()
+        list(gh.iter_url(self.base + 'file'))
+        self.assertEqual(EchoHandler.headers_seen[-1].getheaders('Accept-Encoding'),
+            ['identity'])
+        gh.load_url(self.base + 'users')
+        self.assertEqual(EchoHandler.headers_seen[-1].getheaders('Accept-Encoding'),
+            ['gzip, deflate'])
+
+def count_commits(spec, commits):
+    return len(commits)
+
+def reserve_many(limiter, count):
+    for i in range(count):
+        limiter.reserve()
+
+class SharedRateLimiterTest(TestCase):
+    def test_shared(self):
+        limiter = SharedRateLimiter()
+        limiter.update({'x-ratelimit-remaining': '100',
+            'x-ratelimit-reset': repr(time.time() + 3600)})
+        processes = [multiprocessing.Process(target=reserve_many, args=(limiter, 10))
+            for i in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(limiter.remaining, 70)
+
+class ArrayParserTest(TestCase):
+    def test_chunks(self):
+        data = [{'a': 'x]\\"}{,', 'b': [1, 2, {'c': None}]}, 3, 'str,]', [], {}, u'\xe9']
+        text = github.core.json.dumps(data)
+        for size in range(1, 8):
+            parser = ArrayParser(github.core.json.loads)
+            items = []
+            for i in range(0, len(text), size):
+                items += parser.feed(text[i:i + size])
+            self.assertEqual(items + parser.close(), data)
+
+    def test_not_an_array(self):
+        parser = ArrayParser(github.core.json.loads)
+        self.assertEqual(parser.feed('{"message": "Not Found"}'), [])
+        self.assertEqual(parser.close(), [])
+        parser = ArrayParser(github.core.json.loads)
+        self.assertEqual(parser.feed('[1, {"a": '), [1])
+        self.assertRaises(ValueError, parser.close)
+
+def graph_commit(name, *parents):
+    sha = hashlib.sha1(name).hexdigest()
+    return {'sha': sha, 'parents': [{'sha': hashlib.sha1(p).hexdigest()} for p in parents]}
+
+class CommitGraphTest(TestCase):
+    def test_queries(self):
+        # a - b - c - d, with e - f branched from b and merged into d, and g
+        # made on top of f
+        graph = CommitGraph()
+        sha = lambda name: hashlib.sha1(name).hexdigest()
+        self.assertEqual(graph.add([graph_commit('d', 'c', 'f'), graph_commit('c', 'b'),
+            graph_commit('g', 'f'), graph_commit('f', 'e'), graph_commit('e', 'b')]), 5)
+        self.assertEqual(graph.missing(), [sha('b')])
+        graph.add([graph_commit('b', 'a'), graph_commit('a'), graph_commit('c', 'b')])
+        self.assertEqual((len(graph), graph.missing()), (7, []))
+        self.assertEqual(graph.parents(sha('d')), [sha('c'), sha('f')])
+        self.assertTrue(graph.is_ancestor(sha('f'), sha('d')))
+        self.assertTrue(graph.is_ancestor(sha('d'), sha('d')))
+        self.assertFalse(graph.is_ancestor(sha('g'), sha('d')))
+        self.assertEqual(graph.merge_base(sha('g'), sha('c')), sha('b'))
+        self.assertEqual(graph.merge_base(sha('g'), sha('d')), sha('f'))
+        self.assertEqual(graph.ahead_behind(sha('g'), sha('c')), (3, 1))
+        self.assertEqual(graph.ahead_behind(sha('d'), sha('g')), (2, 1))
+        # the older commit first
+        self.assertEqual(graph.merge_base(sha('b'), sha('c')), sha('b'))
+        self.assertEqual(graph.ahead_behind(sha('b'), sha('c')), (0, 1))
+        self.assertEqual(graph.ahead_behind(sha('c'), sha('g')), (1, 3))
+        self.assertFalse(graph.is_ancestor(sha('d'), sha('b')))
+        self.assertRaises(KeyError, graph.is_ancestor, sha('x'), sha('d'))
+
+    def test_random_graphs(self):
+        rng = random.Random(22)
+        for n in range(50):
+            names = [str(i) for i in range(rng.randint(1, 30))]
+            parents = dict((name, rng.sample(names[:i], min(i, rng.choice([0, 1, 1, 1, 2]))))
+                for i, name in enumerate(names))
+            ancestors = {}
+            for name in names:
+                ancestors[name] = set([name]).union(*[ancestors[p] for p in parents[name]])
+            graph = CommitGraph()
+            graph.add([graph_commit(name, *parents[name]) for name in reversed(names)])
+            sha = lambda name: hashlib.sha1(name).hexdigest()
+            for i in range(20):
+                a, b = rng.choice(names), rng.choice(names)
+                self.assertEqual(graph.is_ancestor(sha(a), sha(b)), a in ancestors[b])
+                self.assertEqual(graph.ahead_behind(sha(a), sha(b)),
+                    (len(ancestors[a] - ancestors[b]), len(ancestors[b] - ancestors[a])))
+                common = ancestors[a] & ancestors[b]
+                # a best common ancestor has no descendants in common
+                best = [c for c in common if not [d for d in common if d != c and c in ancestors[d]]]
+                base = graph.merge_base(sha(a), sha(b))
+                self.assertTrue(base is None if not best else base in map(sha, best))
+
+class FakeAPITest(TestCase):
+    def setUp(self):
+        self.api = FakeAPI(commits=250)
+        self.gh = github.Github(api_base=self.api.start(), throttle=False)
+
+    def tearDown(self):
+        self.api.stop()
+
+    def test_commits(self):
+        repo = self.gh.repository('octocat', 'repo1')
+        commits = repo.commits(all=True)
+        self.assertEqual(len(commits), 250)
+        self.assertEqual(commits[1]['sha'], commits[0]['parents'][0]['sha'])
+        self.assertEqual(len(self.api.requests), 3)
+        self.assertTrue(4997 <= self.gh.limiter.remaining < 5000)
+        self.assertEqual([c['sha'] for c in repo.iter_commits()], [c['sha'] for c in commits])
+
+    def test_plan(self):
+        repo = self.gh.repository('octocat', 'repo1')
+        plan = repo.commits(all=True, dry_run=True)
+        self.assertEqual((plan.items, plan.requests, plan.per_page, plan.fits), (250, 3, 100, True))
+        self.assertEqual(plan.remaining, 4999)
+        self.assertEqual(repo.commits(all=True, dry_run=True, per_page=30).requests, 9)
+        self.assertEqual(self.gh.user('octocat').repositories(dry_run=True).items, 3)
+        self.assertEqual(repo.commits(dry_run=True, page=2).items, 250)
+        self.assertEqual(len(self.api.requests), 4)
+        self.assertEqual(len(repo.commits(page=2, per_page=100)), 100)
+
+    def test_commit_graph(self):
+        repo = self.gh.repository('octocat', 'repo1')
+        graph = CommitGraph(repo)
+        graph.add(repo.commits()[:5])
+        head, tail = self.api.sha('octocat', 'repo1', 0), self.api.sha('octocat', 'repo1', 240)
+        del self.api.requests[:]
+        self.assertTrue(graph.is_ancestor(tail, head))
+        # a page from the unknown tail, alongside a page at a time from the
+        # newest missing ancestor of the head
+        self.assertEqual(len(graph), 250)
+        self.assertEqual(len(self.api.requests), 4)
+        self.assertEqual(graph.ahead_behind(head, tail), (240, 0))
+        self.assertEqual(len(self.api.requests), 4)
+        # a missing commit elsewhere doesn't cost queries about complete ones,
+        # and one github doesn't have is only asked for once
+        orphan = graph_commit('orphan', 'gone')
+        graph.add([orphan])
+        self.assertEqual(graph.merge_base(tail, head), tail)
+        self.assertEqual(len(self.api.requests), 4)
+        for i in range(2):
+            self.assertFalse(graph.is_ancestor(head, orphan['sha']))
+        self.assertEqual(len(self.api.requests), 5)
+        self.assertEqual(len(repo.graph()), 250)
+
+    def test_sync_commits(self):
+        repo = self.gh.repository('octocat', 'repo1')
+        commits, cursor = repo.sync_commits()
+        self.assertEqual(len(commits), 250)
+        self.assertEqual(cursor.sha, commits[0]['sha'])
+        self.assertEqual(len(self.api.requests), 3)
+        # from another branch, or a sha
+        self.assertEqual(repo.sync_commits(branch=commits[10]['sha'])[0], commits[10:])
+        del self.api.requests[:]
+        self.assertEqual(repo.sync_commits(cursor), ([], cursor))
+        self.assertEqual(len(self.api.requests), 1)
+        new, cursor = repo.sync_commits(commits[40]['sha'])
+        self.assertEqual(new, commits[:40])
+        self.assertEqual(cursor.sha, commits[0]['sha'])
+        new, _ = repo.sync_commits(since=commits[9]['commit']['committer']['date'])
+        self.assertEqual(new, commits[:10])
+        # a merge bringing in a commit made before the last sync
+        side = dict(self.api.commit('octocat', 'repo1', 300), sha='c' * 40)
+        merge = dict(self.api.commit('octocat', 'repo1', -2), sha='d' * 40,
+            parents=[{'sha': commits[0]['sha']}, {'sha': side['sha']}])
+        self.api.history('octocat', 'repo1')[:0] = [merge, side]
+        new, cursor = repo.sync_commits(cursor)
+        self.assertEqual([c['sha'] for c in new], [merge['sha'], side['sha']])
+        self.assertEqual(cursor.sha, merge['sha'])
+
+    def test_store(self):
+        store = Store(max_age=60)
+        gh = github.Github(api_base=self.api.url, throttle=False, store=store)
+        gh.user('octocat').repositories()
+        self.assertEqual([r['name'] for r in store.repositories('octocat')],
+            ['repo0', 'repo1', 'repo2'])
+        self.assertEqual(len(store.refresh_commits(gh, 'octocat', 'repo1')), 250)
+        self.assertEqual(store.refresh_commits(gh, 'octocat', 'repo1'), None)
+        self.assertTrue(store.refresh_issues(gh, 'octocat', 'repo1'))
+        self.assertEqual(len(store.issues(repo='repo1', state='closed')), 10)
+        # commits are an hour apart, by alice, bob and carol in turn
+        latest = store.commits(repo='repo1', limit=1)[0]
+        date = latest['commit']['author']['date']
+        start = github.to_datetime(date) - datetime.timedelta(hours=24)
+        recent = store.commits(author='bob', start=start)
+        self.assertEqual(len(recent), 8)
+        self.assertEqual(set(c['author']['login'] for c in recent), set(['bob']))
+        self.assertEqual(store.commits(author='bob@example.com', start=start), recent)
+        self.assertEqual(store.active_repositories('alice', start), [('octocat', 'repo1', 9)])
+        requests = len(self.api.requests)
+        new, cursor = gh.repository('octocat', 'repo1').sync_commits(
+            store.commits(repo='repo1', limit=4)[-1]['sha'])
+        self.assertEqual(len(new), 3)
+        self.assertEqual(len(self.api.requests), requests + 1)
+
+    def test_store_failed_refresh(self):
+        store = Store(max_age=60)
+        gh = github.Github(api_base=self.api.url, throttle=False, retry=False)
+        self.api.faults['users/octocat/repos'] = [502]
+        self.assertRaises(HTTPError, store.refresh_repositories, gh, 'octocat')
+        self.assertTrue(store.is_stale('repositories', 'octocat'))
+        self.assertTrue(store.refresh_repositories(gh, 'octocat'))
+        self.assertEqual(len(store.repositories('octocat')), 3)
+        self.api.faults['issues/list/octocat/repo1/closed'] = [502]
+        self.assertRaises(HTTPError, store.refresh_issues, gh, 'octocat', 'repo1')
+        self.assertTrue(store.is_stale('issues', 'octocat', 'repo1'))
+        self.assertTrue(store.refresh_issues(gh, 'octocat', 'repo1'))
+        self.assertFalse(store.is_stale('issues', 'octocat', 'repo1'))
+
+    def test_event_poller(self):
+        store = Store(max_age=3600)
+        gh = github.Github(api_base=self.api.url, throttle=False, store=store,
+            cache=MemoryCache())
+        store.refresh_commits(gh, 'octocat', 'repo1')
+        store.refresh_issues(gh, 'octocat', 'repo1')
+        store.refresh_issues(gh, 'octocat', 'repo2')
+        gh.repository('octocat', 'repo1').tags()
+        gh.repository('octocat', 'repo1').commits(all=True)
+        commit_keys = [k for k in gh.cache._entries if '/commits?page' in k]
+        self.assertEqual(len(commit_keys), 3)
+        self.api.add_event('WatchEvent', 'octocat', 'repo0')
+        self.api.poll_interval = 120
+        poller = github.EventPoller(gh)
+        poller.watch_org('octocat')
+        seen = []
+        poller.subscribe(seen.append, kinds=('commits', 'issues'))
+        # the first poll only notes how far the feed goes
+        self.assertEqual(poller.poll(), [])
+        self.assertEqual(poller.feeds[0].interval, 120)
+        self.api.add_event('PushEvent', 'octocat', 'repo1')
+        self.api.add_event('IssuesEvent', 'octocat', 'repo1', {'issue': {'number': 3}})
+        self.api.add_event('PushEvent', 'octocat', 'repo1')
+        self.api.add_event('CreateEvent', 'octocat', 'repo1', {'ref_type': 'tag'})
+        del self.api.requests[:]
+        self.assertEqual(poller.poll(), [])
+        self.assertEqual(self.api.requests, [])
+        changes = poller.poll(force=True)
+        self.assertEqual([(c.kind, c.number, c.event['id']) for c in changes],
+            [('issues', 3, '3'), ('commits', None, '4'), ('branches', None, '4'),
+            ('tags', None, '5')])
+        self.assertEqual([c.kind for c in seen], ['issues', 'commits'])
+        self.assertTrue(store.is_stale('commits', 'octocat', 'repo1'))
+        self.assertTrue(store.is_stale('issues', 'octocat', 'repo1'))
+        self.assertFalse(store.is_stale('issues', 'octocat', 'repo2'))
+        self.assertEqual(gh.cache.get(gh.cache_key(self.api.url +
+            'repos/show/octocat/repo1/tags')), None)
+        # pages fetched with all=True are dropped too
+        self.assertEqual([k for k in commit_keys if gh.cache.get(k)], [])
+        # an unchanged feed is answered 304, and the sync cursor survives
+        self.assertEqual(poller.poll(force=True), [])
+        self.assertEqual(gh.last_response.status, 304)
+        del self.api.requests[:]
+        self.assertEqual(store.refresh_commits(gh, 'octocat', 'repo1'), [])
+        self.assertEqual(len(self.api.requests), 1)
+
+    def test_event_poller_refresh_errors(self):
+        store = Store(max_age=3600)
+        gh = github.Github(api_base=self.api.url, throttle=False, store=store)
+        store.refresh_commits(gh, 'octocat', 'repo1')
+        poller = github.EventPoller(gh, refresh=True, quiet=True)
+        poller.watch_org('octocat')
+        seen = []
+        poller.subscribe(seen.append)
+        poller.poll()
+        self.api.add_event('PushEvent', 'octocat', 'repo1')
+        self.api.add_event('IssuesEvent', 'octocat', 'repo2', {'issue': {'number': 1}})
+        self.api.faults['repos/octocat/repo1/commits'] = [404]
+        # a failed refresh doesn't stop the rest being applied
+        changes = poller.poll(force=True)
+        self.assertEqual([c.kind for c in seen], ['commits', 'branches', 'issues'])
+        self.assertEqual([(c.kind, e.code) for c, e in poller.change_errors], [('commits', 404)])
+        self.assertTrue(store.is_stale('commits', 'octocat', 'repo1'))
+        self.assertFalse(store.is_stale('issues', 'octocat', 'repo2'))
+        self.assertEqual(len(store.refresh_commits(gh, 'octocat', 'repo1')), 0)
+        self.assertFalse(store.is_stale('commits', 'octocat', 'repo1'))
+
+    def test_coalescing(self):
+        self.api.latency = 0.2
+        user = self.gh.user('octocat')
+        results = Executor(8).map(lambda i: user.repositories(), range(8))
+        results = [future.result() for future in results]
+        self.assertEqual(len(self.api.requests), 1)
+        self.assertEqual(self.gh.coalesced, 7)
+        self.assertTrue(all(r == results[0] and len(r) == 3 for r in results))
+        user.repositories()
+        self.assertEqual(len(self.api.requests), 2)
+        other = github.Github('bob', 'secret', api_base=self.api.url, throttle=False)
+        futures = [Executor(1).submit(user.repositories),
+            Executor(1).submit(other.user('octocat').repositories)]
+        [future.result() for future in futures]
+        self.assertEqual(len(self.api.requests), 4)
+
+    def test_retries(self):
+        policy = github.RetryPolicy(backoff=0, budget_minimum=3)
+        gh = github.Github(api_base=self.api.url, throttle=False, retry=policy)
+        metrics = Metrics().install(gh)
+        path = 'repos/octocat/repo1/commits'
+        self.api.faults[path] = [502, (429, {'Retry-After': '0'}), 503]
+        self.assertEqual(len(gh.repository('octocat', 'repo1').commits(all=True)), 250)
+        self.assertEqual(len(self.api.requests), 6)
+        self.assertEqual(policy.stats['retries'], 3)
+        endpoint = metrics.snapshot()['endpoints']['repos/:user/:repo/commits']
+        self.assertEqual((endpoint['retries'], endpoint['errors']), (3, 0))
+        # the budget is spent, and errors which won't pass aren't retried
+        self.api.faults[path] = [502]
+        self.assertEqual(gh.load_url(self.api.url + path, quiet=True), '{}')
+        self.assertEqual((gh.last_response.status, policy.stats['exhausted']), (502, 1))
+        self.api.faults['user/show/octocat'] = [404, 502]
+        self.assertEqual(gh.load_url(self.api.url + 'user/show/octocat', quiet=True), '{}')
+        self.assertEqual(policy.delay(2), 0)
+        self.assertTrue(0 <= github.RetryPolicy(backoff=1).delay(3) <= 8)
+        slow = HTTPError(Response('u', 429, 'Too Many', [('Retry-After', '3600')], ''))
+        self.assertEqual(github.RetryPolicy(max_retry_after=5).delay(0, slow), 5)
+        # a page which fails after every retry is reported, not dropped
+        self.api.faults[path + '?page=2'] = [502] * 4
+        policy.budgets.clear()
+        result = gh.fetch_many([('commits', 'octocat', 'repo1')])[0]
+        self.assertEqual((result.value, result.error.code), (None, 502))
+        self.assertEqual(policy.stats['retries'], 6)
+
+    def test_hedge_reservations(self):
+        policy = github.RetryPolicy(hedge=True)
+        limiter = RateLimiter(limit=1, period=60)
+        self.assertTrue(policy.allow_hedge('t', limiter))
+        # no slot is free at once, so no hedge, and no retry spent on one
+        self.assertFalse(policy.allow_hedge('t', limiter))
+        self.assertEqual((policy.stats['hedges'], policy.budgets['t'].balance), (1, 9))
+        self.assertTrue(policy.allow_hedge('t', limiter, reserve=False))
+
+    def test_hedging(self):
+        policy = github.RetryPolicy(hedge=True, hedge_samples=5)
+        gh = github.Github(api_base=self.api.url, throttle=False, retry=policy,
+            coalesce=False)
+        url = self.api.url + 'user/show/octocat'
+        for i in range(5):
+            gh.load_json(url)
+        self.api.delays['user/show/octocat'] = [2]
+        start = time.time()
+        self.assertEqual(gh.load_json(url)['user']['login'], 'octocat')
+        self.assertTrue(time.time() - start < 1)
+        self.assertEqual((policy.stats['hedges'], policy.stats['hedge_wins']), (1, 1))
+        self.assertEqual(len(self.api.requests), 7)
+
+    def test_graphql(self):
+        api = FakeAPI(repos=4, branches=3)
+        try:
+            rest = github.Github(api_base=api.start(), throttle=False)
+            gh = github.Github(api_base=api.url, throttle=False, graphql=True)
+            gh.graphql.max_cost, gh.graphql.page_size = 6, 2
+            specs = [(kind, 'octocat', 'repo%d' % i) for i in range(4)
+                for kind in ('repository', 'branches', 'tags')]
+            specs += [('user', 'octocat'), ('repository', 'octocat', 'missing'),
+                ('commit', 'octocat', 'repo0', api.sha('octocat', 'repo0', 1))]
+            expected = rest.fetch_many(specs[:-2])
+            del api.requests[:]
+            results = gh.fetch_many(specs)
+            self.assertEqual([r.spec for r in results], specs)
+            for result, rest_result in zip(results, expected):
+                self.assertEqual(result.error, None)
+                if result.spec[0] == 'repository':
+                    repo, rest_repo = result.value['repository'], rest_result.value['repository']
+                    for key in ('name', 'full_name', 'language', 'forks', 'pushed_at'):
+                        self.assertEqual(repo[key], rest_repo[key])
+                elif result.spec[0] == 'user':
+                    self.assertEqual(result.value['login'], 'octocat')
+                else:
+                    self.assertEqual(result.value, rest_result.value)
+            self.assertEqual(results[-2].error.type, 'NOT_FOUND')
+            self.assertEqual(results[-1].value['sha'], api.sha('octocat', 'repo0', 1))
+            # queries for two repositories, two more, and the user and missing
+            # repository;  the first two each need another for their second
+            # page of branches.  The commit is fetched over REST
+            self.assertEqual(sorted(api.requests), ['/graphql'] * 5 +
+                ['/repos/octocat/repo0/commits/' + api.sha('octocat', 'repo0', 1)])
+            # queries are retried like GETs, and their budget is kept apart
+            gh = github.Github(api_base=api.url, throttle=False, graphql=True)
+            api.faults['graphql'] = [502]
+            self.assertEqual(gh.fetch_many([('user', 'octocat')])[0].value['login'], 'octocat')
+            self.assertEqual(gh.retry.stats['retries'], 1)
+            self.assertTrue(gh.graphql.limiter.remaining > 0)
+            self.assertEqual(gh.limiter.remaining, None)
+            gh.graphql.page_size = 2
+            # a list of refs whose next page fails isn't passed off as whole
+            def fail_next(event):
+                api.faults['graphql'] = [404]
+            gh.add_hook('after_response', fail_next)
+            result = gh.fetch_many([('branches', 'octocat', 'repo0')])[0]
+            self.assertEqual((result.value, result.error.code), (None, 404))
+        finally:
+            api.stop()
+
+    def test_token_pool(self):
+        api = FakeAPI(users=('alice', 'bob', 'carol'), rate_limit=5)
+        gh = github.Github(api_base=api.start(), tokens=[('alice', 't1'),
+            ('bob', 't2'), ('carol', 't3')])
+        try:
+            for i in range(12):
+                self.assertEqual(gh.user('alice').get()['login'], 'alice')
+            self.assertEqual(sorted(api.callers), ['token t1'] * 4 + ['token t2'] * 4 +
+                ['token t3'] * 4)
+            self.assertEqual([c.headroom() for c in gh.tokens.credentials], [1, 1, 1])
+            self.assertTrue(gh.can_act_as('bob'))
+            self.assertFalse(gh.can_act_as('dave'))
+            self.assertRaises(github.AccessRestricted, gh.user('dave').keys)
+            del api.callers[:]
+            gh.user('bob').keys()
+            self.assertEqual(api.callers, ['token t2'])
+        finally:
+            api.stop()
+
+    def test_write_pipeline(self):
+        api = FakeAPI(users=('alice', 'bob', 'carol'))
+        gh = github.Github(api_base=api.start(), tokens=[('alice', 't1'), ('bob', 't2')])
+        try:
+            pipeline = gh.pipeline()
+            pipeline.follow('carol', user='alice')
+            pipeline.follow('bob', user='alice')
+            pipeline.unfollow('carol', user='alice')
+            pipeline.follow('carol', user='bob')
+            pipeline.follow('carol', user='bob')
+            pipeline.add_key('laptop', 'ssh-rsa AAAA', user='bob')
+            pipeline.follow('dave', user='bob')
+            report = pipeline.run()
+            self.assertEqual([r.outcome for r in report], ['superseded', 'ok', 'ok',
+                'duplicate', 'ok', 'ok', 'failed'])
+            self.assertEqual(report[-1].status, 404)
+            self.assertEqual(len(pipeline), 0)
+            self.assertEqual(sorted(api.requests), ['/user/follow/bob', '/user/follow/carol',
+                '/user/follow/dave', '/user/key/add', '/user/unfollow/carol'])
+            self.assertEqual(api.following, {'token t1': set(['bob']), 'token t2': set(['carol'])})
+            self.assertEqual(gh.user('bob').keys()['public_keys'][0]['title'], 'laptop')
+        finally:
+            api.stop()
+
+    def test_revoked_token(self):
+        self.api.revoked.add('t1')
+        gh = github.Github(api_base=self.api.url, tokens=[('alice', 't1'), ('bob', 't2')])
+        gh.user('octocat').repositories()
+        self.assertTrue(gh.tokens.get('alice').revoked)
+        for i in range(3):
+            self.assertEqual(len(gh.user('octocat').repositories()), 3)
+        self.assertEqual(self.api.callers, ['token t1'] + ['token t2'] * 3)
+        self.api.revoked.add('t2')
+        gh.user('octocat').repositories()
+        self.assertRaises(github.AuthenticationRequired, gh.user('octocat').repositories)
+
+    def test_stream_commits(self):
+        calls = []
+        def loads(text):
+            calls.append(len(text))
+            return github.core.json.loads(text)
+        gh = github.Github(api_base=self.api.url, throttle=False, json_decoder=loads)
+        repo = gh.repository('octocat', 'repo1')
+        commits = repo.commits(all=True)
+        self.assertEqual(len(calls), 3)
+        streamed = repo.iter_commits(stream=True)
+        self.assertEqual(streamed.next(), commits[0])
+        # only the first page has been read
+        self.assertTrue(len(calls) <= 3 + 30)
+        self.assertEqual([commits[0]] + list(streamed), commits)
+        # streamed pages are retried, and share a fetch already in flight
+        gh.retry.backoff = 0
+        self.api.faults['repos/octocat/repo1/commits?page=2'] = [502]
+        self.assertEqual(list(repo.iter_commits(stream=True)), commits)
+        self.assertEqual(gh.retry.stats['retries'], 1)
+        self.api.latency = 0.2
+        del self.api.requests[:]
+        url = repo._commits_url()
+        future = Executor(1).submit(gh.load_json, url)
+        time.sleep(0.1)
+        self.assertEqual(list(gh.iter_json(url)), future.result())
+        self.assertEqual((len(self.api.requests), gh.coalesced), (1, 1))
+
+    def test_crawler(self):
+        crawler = Crawler(processes=2, transform=count_commits, api_base=self.api.url)
+        repos = [('octocat', 'repo%d' % i) for i in range(3)] + [('octocat', 'missing')]
+        results = dict((r.spec[2], r) for r in crawler.commits(repos))
+        self.assertEqual([results['repo%d' % i].value for i in range(3)], [250] * 3)
+        self.assertTrue(results['missing'].error is not None)
+        # every worker drew on, and updated, the one budget
+        self.assertEqual(len(self.api.requests), 3 * 3 + 1)
+        self.assertTrue(crawler.limiter.remaining <= 5000 - 3 * 3)
+
+    def test_failed_page(self):
+        gh = github.Github(api_base=self.api.url, throttle=False, retry=False)
+        self.api.faults['repos/octocat/repo0/commits?page=2'] = [502]
+        result = gh.fetch_many([('commits', 'octocat', 'repo0')])[0]
+        self.assertEqual((result.value, result.error.code), (None, 502))
+        self.assertEqual(len(gh.repository('octocat', 'repo0').commits(all=True)), 250)
+        self.api.faults['repos/octocat/repo1/commits?page=3'] = [502]
+        crawler = Crawler(processes=2, transform=count_commits, api_base=self.api.url,
+            retry=False)
+        results = dict((r.spec[2], r) for r in crawler.commits([('octocat', 'repo0'),
+            ('octocat', 'repo1')]))
+        self.assertEqual(results['repo0'].value, 250)
+        self.assertTrue('502' in str(results['repo1'].error))
+        # iterators report the page which failed, or raise it in strict mode
+        repo = gh.repository('octocat', 'repo0')
+        for stream in (False, True):
+            self.api.faults['repos/octocat/repo0/commits?page=2'] = [502]
+            commits = repo.iter_commits(stream=stream)
+            self.assertEqual((len(list(commits)), commits.error.code), (30, 502))
+        commits = repo.iter_commits(prefetch=True)
+        self.assertEqual((len(list(commits)), commits.error), (250, None))
+        self.api.faults['repos/octocat/repo0/commits?page=2'] = [502]
+        result = gh.fetch_many([lambda: list(repo.iter_commits(prefetch=True))])[0]
+        self.assertEqual((result.value, result.error.code), (None, 502))
+
+    def test_failed_page_models(self):
+        gh = github.Github(api_base=self.api.url, throttle=False, retry=False, models=True)
+        repo = gh.repository('octocat', 'repo0')
+        self.api.faults['repos/octocat/repo0/commits?page=2'] = [502]
+        result = gh.fetch_many([('commits', 'octocat', 'repo0')])[0]
+        self.assertEqual((result.value, result.error.code), (None, 502))
+        # a failure isn't wrapped in a model, so it still reads as nothing
+        self.api.faults['repos/octocat/repo0/commits?page=2'] = [502]
+        commits = repo.commits(all=True)
+        self.assertEqual([type(c) for c in commits], [Commit] * 100)
+        self.api.faults['repos/octocat/repo0/commits'] = [404]
+        self.assertEqual(repo.commits(), {})
+
+    def test_cached_repositories(self):
+        gh = github.Github(api_base=self.api.url, cache=MemoryCache())
+        user = gh.user('octocat')
+        self.assertEqual(user.repositories(), user.repositories())
+        self.assertEqual(gh.cache_stats['not_modified'], 1)
+        self.assertEqual(user.get()['login'], 'octocat')
 
+    def test_hooks_and_metrics(self):
+        events = []
+        for name in ('before_request', 'after_response', 'error'):
+            self.gh.add_hook(name, lambda event, name=name: events.append((name, event)))
+        metrics = Metrics().install(self.gh)
+        repo = self.gh.repository('octocat', 'repo1')
+        repo.commits()
+        self.assertEqual([name for name, event in events], ['before_request', 'after_response'])
+        event = events[1][1]
+        self.assertEqual((event.template, event.status), ('repos/:user/:repo/commits', 200))
+        self.assertTrue(event.bytes > event.wire_bytes > 0)
+        self.assertEqual(set(event.timings), set(['wait', 'transfer', 'decode']))
+        self.gh.repository('octocat', 'missing').get()
+        self.assertEqual(events[-1][0], 'error')
+        self.assertEqual(events[-1][1].status, 404)
+        snapshot = metrics.snapshot()
+        commits = snapshot['endpoints']['repos/:user/:repo/commits']
+        self.assertEqual((commits['requests'], commits['statuses']), (1, {200: 1}))
+        self.assertEqual(commits['timings']['total']['count'], 1)
+        self.assertEqual(snapshot['endpoints']['repos/show/:user/:repo']['errors'], 1)
+        self.assertEqual(snapshot['rate_remaining'], 4998)